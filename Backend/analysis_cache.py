@@ -0,0 +1,101 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Dict, List, Optional
+from pymongo import ASCENDING, IndexModel
+from pymongo.collection import Collection
+from cache_utils import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Days a cached analysis is kept; shared by the cache and the TTL index in indexes.py
+ANALYSIS_CACHE_TTL_DAYS = int(os.getenv('ANALYSIS_CACHE_TTL_DAYS', 30))
+
+class AnalysisCache:
+    """Disease analysis results keyed on image content and model settings.
+
+    A bounded in-memory LRU sits in front of a MongoDB collection whose
+    entries expire through a TTL index.
+    """
+
+    def __init__(self, collection: Collection, prompt: str, generation_config: Dict,
+                 model_name: str, preprocessing: Optional[Dict] = None,
+                 ttl_days: int = ANALYSIS_CACHE_TTL_DAYS, memory_size: int = 256):
+        self.collection = collection
+        self.ttl_days = ttl_days
+        self._memory = TTLCache(maxsize=memory_size)
+        self._lock = threading.Lock()
+        self._mongo_hits = 0
+        self._misses = 0
+        # Any change to the prompt, generation or image settings starts a fresh keyspace
+        settings = json.dumps({
+            "prompt": prompt,
+            "generation_config": generation_config,
+            "model": model_name,
+            "preprocessing": preprocessing or {}
+        }, sort_keys=True)
+        self.version = hashlib.sha256(settings.encode()).hexdigest()[:16]
+
+    @staticmethod
+    def indexes(ttl_days: int = ANALYSIS_CACHE_TTL_DAYS) -> List[IndexModel]:
+        return [
+            IndexModel([("created_at", ASCENDING)], name="created_at_ttl",
+                       expireAfterSeconds=ttl_days * 24 * 3600),
+        ]
+
+    def key(self, image_data: bytes) -> str:
+        """Cache key for an image as prepared for the model, under the current prompt version"""
+        return f"{self.version}:{hashlib.sha256(image_data).hexdigest()}"
+
+    def get(self, key: str) -> Optional[str]:
+        analysis = self._memory.get(key)
+        if analysis is not None:
+            return analysis
+        try:
+            entry = self.collection.find_one_and_update(
+                {"_id": key},
+                {"$inc": {"hits": 1}},
+                projection={"analysis": 1}
+            )
+        except Exception:
+            logger.exception("Error reading analysis cache")
+            entry = None
+        with self._lock:
+            if entry is None:
+                self._misses += 1
+                return None
+            self._mongo_hits += 1
+        self._memory.set(key, entry["analysis"])
+        return entry["analysis"]
+
+    def set(self, key: str, analysis: str) -> None:
+        self._memory.set(key, analysis)
+        try:
+            self.collection.update_one(
+                {"_id": key},
+                {
+                    "$set": {"analysis": analysis},
+                    "$setOnInsert": {"created_at": datetime.datetime.utcnow(), "hits": 0}
+                },
+                upsert=True
+            )
+        except Exception:
+            logger.exception("Error writing analysis cache")
+
+    def stats(self) -> Dict:
+        """Hit rate of this worker process plus the size of the shared store"""
+        memory = self._memory.stats()
+        hits = memory["hits"] + self._mongo_hits
+        total = hits + self._misses
+        return {
+            "version": self.version,
+            "memory_hits": memory["hits"],
+            "mongo_hits": self._mongo_hits,
+            "misses": self._misses,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "memory_size": memory["size"],
+            "entries": self.collection.estimated_document_count()
+        }
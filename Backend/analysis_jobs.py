@@ -0,0 +1,99 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Set
+from db import (
+    create_analysis_job, update_analysis_job, save_upload_history,
+    renew_analysis_job_leases, fail_expired_analysis_jobs
+)
+
+logger = logging.getLogger(__name__)
+
+class QueueFullError(Exception):
+    """Raised when no analysis slot is free"""
+
+class AnalysisJobQueue:
+    """Runs image analyses on a bounded worker pool.
+
+    Jobs are tracked in the analysis_jobs collection so any web worker can
+    answer status requests, and finished analyses are recorded with
+    save_upload_history. Each job is leased to the process running it and
+    the lease is renewed while the process holds the job; jobs whose process
+    died (restart, deploy, max_requests recycle) are marked failed once the
+    lease runs out, so polling clients stop waiting.
+    """
+
+    def __init__(self, analyze: Callable[..., str], max_workers: int = 4, max_pending: int = 32,
+                 lease_seconds: int = 60):
+        self._analyze = analyze
+        self.lease_seconds = lease_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analysis")
+        # Running plus waiting jobs; further uploads are rejected instead of piling up
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self._held: Set[str] = set()
+        self._held_lock = threading.Lock()
+        self._heartbeat: Optional[threading.Thread] = None
+
+    def submit(self, user_id: str, filename: str, *args,
+               history: Optional[Dict] = None) -> str:
+        """Queue an analysis and return its job id.
+
+        Extra args are passed to analyze; history holds extra fields for save_upload_history.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise QueueFullError("Analysis queue is full")
+        try:
+            job_id = create_analysis_job(user_id, filename, lease_seconds=self.lease_seconds)
+            with self._held_lock:
+                self._held.add(job_id)
+            self._start_heartbeat()
+            self._executor.submit(self._run, job_id, user_id, filename, args, history or {})
+            return job_id
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _start_heartbeat(self) -> None:
+        # Started on first use so it runs in the serving process, not a preloading parent
+        with self._held_lock:
+            if self._heartbeat is None or not self._heartbeat.is_alive():
+                self._heartbeat = threading.Thread(target=self._renew_leases, name="analysis-leases",
+                                                   daemon=True)
+                self._heartbeat.start()
+
+    def _renew_leases(self) -> None:
+        """Renew the leases of jobs held here and fail jobs abandoned by dead processes"""
+        while True:
+            time.sleep(self.lease_seconds / 3)
+            with self._held_lock:
+                held = list(self._held)
+            try:
+                if held:
+                    renew_analysis_job_leases(held, self.lease_seconds)
+                fail_expired_analysis_jobs()
+            except Exception:
+                logger.exception("Error renewing analysis job leases")
+
+    def _run(self, job_id: str, user_id: str, filename: str, args: tuple, history: Dict) -> None:
+        try:
+            update_analysis_job(job_id, {"status": "running", "progress": 10})
+            analysis = self._analyze(*args)
+            update_analysis_job(job_id, {"progress": 90})
+            upload_id = save_upload_history(user_id, filename, analysis, **history)
+            update_analysis_job(job_id, {
+                "status": "completed",
+                "progress": 100,
+                "upload_id": upload_id,
+                "analysis": analysis
+            })
+        except Exception as e:
+            logger.exception("Error in analysis job %s", job_id)
+            try:
+                update_analysis_job(job_id, {"status": "failed", "error": str(e)})
+            except Exception:
+                pass
+        finally:
+            with self._held_lock:
+                self._held.discard(job_id)
+            self._slots.release()
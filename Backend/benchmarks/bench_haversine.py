@@ -0,0 +1,81 @@
+"""Compare the scalar haversine loop with the vectorized kernel in geo.py.
+
+Usage:
+    python benchmarks/bench_haversine.py [--sizes 1000 100000 1000000] [-k 50]
+
+For each market count, times nearest-k ranking with a scalar haversine
+called per market plus a full sort (the previous /api/market-prices path),
+against geo.haversine_km over a cached radian snapshot plus argpartition.
+"""
+import argparse
+import math
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from geo import haversine_km, top_k  # noqa: E402
+
+# Markets are spread over India's bounding box
+LAT_RANGE = (8.0, 37.0)
+LON_RANGE = (68.0, 97.0)
+ORIGIN = (18.52, 73.86)
+
+def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Scalar haversine, as the market search computed it before geo.py"""
+    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+def time_call(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+def scalar_nearest(latitudes, longitudes, k):
+    distances = [
+        (calculate_distance(ORIGIN[0], ORIGIN[1], lat, lon), index)
+        for index, (lat, lon) in enumerate(zip(latitudes, longitudes))
+    ]
+    distances.sort()
+    return [index for _, index in distances[:k]]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000, 1000000])
+    parser.add_argument("-k", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'markets':>9} {'scalar ms':>10} {'numpy ms':>9} {'speedup':>8} {'max err km':>11} {'same k':>6}")
+    for size in args.sizes:
+        latitudes = rng.uniform(*LAT_RANGE, size)
+        longitudes = rng.uniform(*LON_RANGE, size)
+        # The snapshot keeps these precomputed between requests
+        lat_rad, lon_rad = np.radians(latitudes), np.radians(longitudes)
+        cos_lat = np.cos(lat_rad)
+        lat_list, lon_list = latitudes.tolist(), longitudes.tolist()
+
+        repeat = 3 if size >= 1000000 else 5
+        scalar_ms = time_call(lambda: scalar_nearest(lat_list, lon_list, args.k), repeat)
+        numpy_ms = time_call(
+            lambda: top_k(haversine_km(*ORIGIN, lat_rad, lon_rad, cos_lat), args.k), repeat * 4
+        )
+
+        vectorized = haversine_km(*ORIGIN, lat_rad, lon_rad, cos_lat)
+        sample = range(0, size, max(1, size // 1000))
+        error = max(abs(vectorized[i] - calculate_distance(ORIGIN[0], ORIGIN[1], lat_list[i], lon_list[i]))
+                    for i in sample)
+        same = set(top_k(vectorized, args.k).tolist()) == set(scalar_nearest(lat_list, lon_list, args.k))
+
+        print(f"{size:>9} {scalar_ms:>10.1f} {numpy_ms:>9.2f} {scalar_ms / numpy_ms:>7.0f}x {error:>11.2e} "
+              f"{'yes' if same else 'NO':>6}")
+
+if __name__ == "__main__":
+    main()
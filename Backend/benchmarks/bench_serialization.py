@@ -0,0 +1,128 @@
+"""Time serializing a page of latest price rows into a JSON response body.
+
+Usage:
+    python benchmarks/bench_serialization.py [--rows 10000]
+
+Compares the previous path (a Python pass converting ObjectId and datetime
+fields of every row, then Flask's stdlib encoder) with the documents shaped
+by LATEST_PRICE_PROJECTION on the server, and with raw documents left to the
+encoder in serialization.py. orjson rows are skipped when it is not
+installed. The decode group shows the cost of decoding the same documents
+from BSON into dicts and through RawBSONDocument.
+"""
+import argparse
+import copy
+import datetime
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+import bson
+from bson import ObjectId
+from bson.raw_bson import RawBSONDocument
+from flask.json.provider import DefaultJSONProvider
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import serialization  # noqa: E402
+from db import _format_latest_price  # noqa: E402
+
+CROPS = ["Wheat", "Rice", "Onion", "Tomato", "Potato", "Cotton", "Soybean", "Maize"]
+
+def raw_entries(count: int):
+    """latest_prices documents as pymongo returns them"""
+    rng = random.Random(0)
+    now = datetime.datetime(2024, 3, 15, 10, 30)
+    entries = []
+    for index in range(count):
+        latitude, longitude = rng.uniform(8, 37), rng.uniform(68, 97)
+        change = round(rng.uniform(-10, 10), 1)
+        entries.append({
+            "_id": {"state": "Maharashtra", "region": f"Region {index % 300}",
+                    "market": f"Market {index}", "crop_name": CROPS[index % len(CROPS)]},
+            "state": "Maharashtra",
+            "region": f"Region {index % 300}",
+            "market": f"Market {index}",
+            "crop_name": CROPS[index % len(CROPS)],
+            "price_id": ObjectId(),
+            "price": rng.randint(800, 6000),
+            "date_effective": now - datetime.timedelta(days=index % 30),
+            "image_url": f"https://example.com/crops/{index}.jpg",
+            "latitude": latitude,
+            "longitude": longitude,
+            "location": {"type": "Point", "coordinates": [longitude, latitude]},
+            "updated_at": now,
+            "previous_price": rng.randint(800, 6000),
+            "previous_date": now - datetime.timedelta(days=index % 30 + 1),
+            "change": change
+        })
+    return entries
+
+def stdlib_dumps(obj) -> bytes:
+    """What jsonify produced before: Flask's default provider settings"""
+    return json.dumps(obj, default=DefaultJSONProvider.default, sort_keys=True,
+                      separators=(",", ":")).encode()
+
+def encoder_dumps(obj) -> bytes:
+    return json.dumps(obj, default=serialization.default, sort_keys=True, separators=(",", ":")).encode()
+
+def time_call(prepare, fn, repeat: int) -> float:
+    """Median milliseconds of fn(prepare()), excluding prepare"""
+    timings = []
+    for _ in range(repeat):
+        argument = prepare()
+        start = time.perf_counter()
+        fn(argument)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args()
+
+    entries = raw_entries(args.rows)
+    # The same rows as LATEST_PRICE_PROJECTION returns them from the server
+    projected = [_format_latest_price(entry) for entry in copy.deepcopy(entries)]
+    # Raw documents for the encoder: ObjectId _id and datetime fields left as they are
+    unformatted = [
+        {key: value for key, value in entry.items() if key not in ("_id", "location")}
+        for entry in entries
+    ]
+    blobs = [bson.encode(entry) for entry in entries]
+
+    cases = [
+        ("before: format rows + stdlib json",
+         lambda: copy.deepcopy(entries),
+         lambda rows: stdlib_dumps({"prices": [_format_latest_price(row) for row in rows]})),
+        ("server-formatted + stdlib json", lambda: projected, lambda rows: encoder_dumps({"prices": rows})),
+        ("raw documents + encoder, stdlib json", lambda: unformatted, lambda rows: encoder_dumps({"prices": rows})),
+    ]
+    if serialization.orjson is not None:
+        cases += [
+            ("server-formatted + orjson", lambda: projected, lambda rows: serialization.dumps({"prices": rows})),
+            ("raw documents + encoder, orjson", lambda: unformatted,
+             lambda rows: serialization.dumps({"prices": rows})),
+        ]
+    else:
+        print("orjson not installed; orjson rows skipped\n")
+    decode_cases = [
+        ("decode BSON to dict", lambda: blobs, lambda raw: [bson.decode(blob) for blob in raw]),
+        ("decode via RawBSONDocument", lambda: blobs,
+         lambda raw: [dict(RawBSONDocument(blob)) for blob in raw]),
+    ]
+
+    print(f"{args.rows} rows, median of {args.repeat}")
+    for header, group in (("serialize", cases), ("decode", decode_cases)):
+        baseline = None
+        print(f"\n{header:<40} {'ms':>8} {'speedup':>8}")
+        for name, prepare, fn in group:
+            elapsed = time_call(prepare, fn, args.repeat)
+            baseline = baseline or elapsed
+            print(f"{name:<40} {elapsed:>8.1f} {baseline / elapsed:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
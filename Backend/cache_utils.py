@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+class TTLCache:
+    """Thread-safe bounded LRU cache whose entries expire after a TTL"""
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value, or default if missing or expired"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires = entry
+            if expires is not None and expires <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None,
+            expires_at: Optional[float] = None) -> None:
+        """Store a value. expires_at is a unix timestamp and overrides ttl."""
+        if expires_at is not None:
+            ttl = expires_at - time.time()
+            if ttl <= 0:
+                return
+        elif ttl is None:
+            ttl = self.ttl
+        expires = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return entry[0] if entry is not None else default
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and current size"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "size": len(self._data),
+            "maxsize": self.maxsize
+        }
+
+# Invalidation subscribers per namespace, notified when the underlying data changes
+_subscribers: Dict[str, List[Callable[[], None]]] = {}
+_subscribers_lock = threading.Lock()
+# Monotonic time of the last invalidation per namespace
+_invalidated_at: Dict[str, float] = {}
+
+def subscribe(namespace: str, callback: Callable[[], None]) -> None:
+    """Call callback whenever namespace is invalidated in this process"""
+    with _subscribers_lock:
+        _subscribers.setdefault(namespace, []).append(callback)
+
+def invalidate(namespace: str) -> None:
+    """Drop everything cached for namespace in this process.
+
+    Other worker processes are not notified; their entries expire by TTL.
+    """
+    with _subscribers_lock:
+        _invalidated_at[namespace] = time.monotonic()
+        callbacks = list(_subscribers.get(namespace, []))
+    for callback in callbacks:
+        try:
+            callback()
+        except Exception as e:
+            print(f"Error invalidating cache {namespace}: {e}")
+
+def invalidated_within(namespace: str, seconds: float) -> bool:
+    """True if namespace was invalidated in this process in the last seconds"""
+    invalidated_at = _invalidated_at.get(namespace)
+    return invalidated_at is not None and time.monotonic() - invalidated_at < seconds
@@ -1,24 +1,55 @@
 import pymongo
 import os
+import socket
 from dotenv import load_dotenv
 from bson import ObjectId
 import datetime
-from typing import Optional, Dict, List, Union
-from pymongo import MongoClient
-from math import radians, sin, cos, sqrt, atan2
+from contextlib import contextmanager
+from typing import Any, Callable, Optional, Dict, List, Tuple, Union
+import base64
+from bson import json_util
+from flask import g, has_request_context
+from cache_utils import TTLCache, invalidate
+from geo import MarketCoordinates
+from services import collection, mongo_client, public_read
+from token_cache import TokenBlacklist
 
 # Load environment variables
 load_dotenv()
 
-# Connect to MongoDB
-client = pymongo.MongoClient(os.getenv("MONGO_URI"))
-db = client["plant_detector"]
-users_collection = db["users"]
-schemes_collection = db["schemes"]
-prices_collection = db["prices"]
-uploads_collection = db["uploads"]  # New collection for tracking image uploads
-expert_articles_collection = db["expert_articles"]  # New collection for expert articles
-daily_news_collection = db["daily_news"]  # New collection for daily news
+# MongoDB collections; the shared client connects on first use (see services.py)
+DATABASE_NAME = "plant_detector"
+users_collection = collection(DATABASE_NAME, "users")
+schemes_collection = collection(DATABASE_NAME, "schemes")
+prices_collection = collection(DATABASE_NAME, "prices")
+uploads_collection = collection(DATABASE_NAME, "uploads")  # New collection for tracking image uploads
+expert_articles_collection = collection(DATABASE_NAME, "expert_articles")  # New collection for expert articles
+daily_news_collection = collection(DATABASE_NAME, "daily_news")  # New collection for daily news
+analysis_jobs_collection = collection(DATABASE_NAME, "analysis_jobs")  # Background image analysis jobs
+analysis_cache_collection = collection(DATABASE_NAME, "analysis_cache")  # Cached analyses keyed on image hash
+notification_outbox_collection = collection(DATABASE_NAME, "notification_outbox")  # Queued push notification fan-outs
+latest_prices_collection = collection(DATABASE_NAME, "latest_prices")  # Latest price per crop and market, maintained on write
+maintenance_collection = collection(DATABASE_NAME, "maintenance")  # Locks and completion markers of maintenance tasks
+# Revoked tokens live in the farmcare database
+token_blacklist_collection = collection("farmcare", "token_blacklist")
+
+# Public GET routes read these with MONGO_PUBLIC_READ_PREFERENCE and tolerate replication lag
+public_schemes = public_read(schemes_collection, "schemes")
+public_expert_articles = public_read(expert_articles_collection, "expert_articles")
+public_daily_news = public_read(daily_news_collection, "daily_news")
+public_latest_prices = public_read(latest_prices_collection, "latest_prices")
+
+# User documents by id; a short TTL bounds staleness for writes made by other workers
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 30))
+_user_cache = TTLCache(maxsize=int(os.getenv("USER_CACHE_SIZE", 10000)), ttl=USER_CACHE_TTL)
+
+# Seconds a queued notification waits so a burst of edits can be merged into one digest
+NOTIFICATION_COALESCE_WINDOW = int(os.getenv("NOTIFICATION_COALESCE_WINDOW", 60))
+# Failed fan-outs are retried after NOTIFICATION_RETRY_BACKOFF x 2^(attempt - 1) seconds
+NOTIFICATION_RETRY_BACKOFF = int(os.getenv("NOTIFICATION_RETRY_BACKOFF", 30))
+NOTIFICATION_MAX_ATTEMPTS = 3
+# Times a send deferred by the push service's Retry-After is rescheduled before it counts as failed
+NOTIFICATION_MAX_DEFERRALS = 5
 
 # Profile image collections and names for DiceBear
 PROFILE_IMG_COLLECTIONS = [
@@ -83,14 +114,81 @@ def create_user(full_name: str, email: str, mobile: str, password: str, is_admin
         print(f"Error creating user: {e}")
         raise
 
+def _request_users() -> Optional[Dict]:
+    """User documents already read during the current request, if there is one"""
+    if not has_request_context():
+        return None
+    if "users" not in g:
+        g.users = {}
+    return g.users
+
+def _remember_user(user_id: str, user: Dict) -> None:
+    _user_cache.set(user_id, user)
+    request_users = _request_users()
+    if request_users is not None:
+        request_users[user_id] = user
+
+def get_user(user_id: str, fresh: bool = False) -> Optional[Dict]:
+    """Get a user by id, reading through the request memo and the process cache.
+
+    fresh skips both caches, for checks such as password verification that
+    must not act on another worker's stale copy.
+    """
+    try:
+        user_id = str(user_id)
+        request_users = _request_users()
+        if not fresh:
+            if request_users is not None and user_id in request_users:
+                return request_users[user_id]
+            user = _user_cache.get(user_id)
+            if user is not None:
+                if request_users is not None:
+                    request_users[user_id] = user
+                return user
+        user = users_collection.find_one({"_id": ObjectId(user_id)})
+        if user is not None:
+            _remember_user(user_id, user)
+        return user
+    except Exception as e:
+        print(f"Error getting user: {e}")
+        raise
+
+def invalidate_user(user_id: str) -> None:
+    """Drop a user from the caches of this process after a write"""
+    user_id = str(user_id)
+    _user_cache.pop(user_id)
+    request_users = _request_users()
+    if request_users is not None:
+        request_users.pop(user_id, None)
+
+def update_user(user_id: str, changes: Dict, unset: Optional[List[str]] = None) -> Optional[Dict]:
+    """Apply $set changes (and $unset fields) to a user and return the updated document"""
+    try:
+        update = {"$set": changes}
+        if unset:
+            update["$unset"] = {field: "" for field in unset}
+        user = users_collection.find_one_and_update(
+            {"_id": ObjectId(user_id)},
+            update,
+            return_document=pymongo.ReturnDocument.AFTER
+        )
+        if user is None:
+            invalidate_user(user_id)
+        else:
+            _remember_user(str(user_id), user)
+        return user
+    except Exception as e:
+        print(f"Error updating user: {e}")
+        raise
+
+def user_cache_stats() -> Dict:
+    return _user_cache.stats()
+
 def update_user_profile_image(user_id: str) -> Dict:
     """Update user's profile image"""
     try:
         profile_image = generate_profile_image()
-        users_collection.update_one(
-            {"_id": ObjectId(user_id)},
-            {"$set": {"profile_image": profile_image}}
-        )
+        update_user(user_id, {"profile_image": profile_image})
         return profile_image
     except Exception as e:
         print(f"Error updating profile image: {e}")
@@ -103,10 +201,78 @@ def update_user_last_login(user_id: str) -> None:
             {"_id": ObjectId(user_id)},
             {"$set": {"last_login": datetime.datetime.utcnow()}}
         )
+        invalidate_user(user_id)
     except Exception as e:
         print(f"Error updating last login: {e}")
         raise
 
+# Pagination
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+# Characters of description returned by article and news list views
+LIST_DESCRIPTION_LENGTH = 300
+
+def clamp_limit(limit: Optional[int]) -> int:
+    """Page size within 1..MAX_PAGE_SIZE, DEFAULT_PAGE_SIZE when not given"""
+    if not limit:
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(int(limit), MAX_PAGE_SIZE))
+
+def encode_cursor(sort_value, doc_id) -> str:
+    """Opaque cursor for the position after a document"""
+    return base64.urlsafe_b64encode(json_util.dumps([sort_value, doc_id]).encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple:
+    """(sort_value, _id) from a cursor; raises ValueError if it is malformed"""
+    try:
+        sort_value, doc_id = json_util.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return sort_value, doc_id
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def _paginate(collection, query: Dict, sort_field: str, direction: int, limit: Optional[int] = None,
+              cursor: Optional[str] = None, projection: Optional[Dict] = None) -> Tuple[List[Dict], Optional[str]]:
+    """Fetch one page sorted on (sort_field, _id) and the cursor for the next page.
+
+    The cursor holds the last document's sort key, so each page is an index
+    range scan instead of a growing skip. Without a limit or cursor every
+    matching document is returned, as before paging existed, for callers that
+    do not follow next_cursor.
+    """
+    sort = [("_id", direction)] if sort_field == "_id" else [(sort_field, direction), ("_id", direction)]
+    if not limit and not cursor:
+        return list(collection.find(query, projection).sort(sort)), None
+    limit = clamp_limit(limit)
+    operator = "$lt" if direction == pymongo.DESCENDING else "$gt"
+    if cursor:
+        sort_value, last_id = decode_cursor(cursor)
+        if sort_field == "_id":
+            after = {"_id": {operator: last_id}}
+        else:
+            after = {"$or": [
+                {sort_field: {operator: sort_value}},
+                {sort_field: sort_value, "_id": {operator: last_id}}
+            ]}
+        query = {"$and": [query, after]}
+
+    docs = list(collection.find(query, projection).sort(sort).limit(limit + 1))
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor(docs[-1].get(sort_field), docs[-1]["_id"])
+    return docs, next_cursor
+
+def _list_projection(*fields: str) -> Dict:
+    """Projection of fields plus a description cut down for list views"""
+    projection = {field: 1 for field in fields}
+    projection["description"] = {"$substrCP": [{"$ifNull": ["$description", ""]}, 0, LIST_DESCRIPTION_LENGTH]}
+    return projection
+
+ARTICLE_LIST_PROJECTION = _list_projection(
+    "title", "author", "category", "read_time", "image_url", "created_at", "updated_at"
+)
+NEWS_LIST_PROJECTION = _list_projection("title", "image_url", "created_at", "updated_at")
+
 # Scheme Management Functions
 def create_scheme(name: str, description: str, eligibility: str, benefits: str, state: str) -> str:
     """Create a new government scheme"""
@@ -122,6 +288,7 @@ def create_scheme(name: str, description: str, eligibility: str, benefits: str,
     }
     try:
         result = schemes_collection.insert_one(scheme)
+        invalidate("schemes")
         return str(result.inserted_id)
     except Exception as e:
         print(f"Error creating scheme: {e}")
@@ -137,6 +304,7 @@ def update_scheme(scheme_id: str, updates: Dict) -> None:
         )
         if result.matched_count == 0:
             raise ValueError("Active scheme not found")
+        invalidate("schemes")
     except Exception as e:
         print(f"Error updating scheme: {e}")
         raise
@@ -147,45 +315,30 @@ def delete_scheme(scheme_id: str) -> None:
         result = schemes_collection.delete_one({"_id": ObjectId(scheme_id)})
         if result.deleted_count == 0:
             raise ValueError("Scheme not found")
+        invalidate("schemes")
     except Exception as e:
         print(f"Error deleting scheme: {e}")
         raise
 
-def get_schemes(state: Optional[str] = None) -> List[Dict]:
-    """Get all schemes, optionally filtered by state"""
+def get_schemes(state: Optional[str] = None, limit: Optional[int] = None,
+                cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+    """Get a page of schemes, optionally filtered by state, and the next page cursor"""
     try:
         query = {}
         if state:
             query["state"] = state
         
-        schemes = list(schemes_collection.find(query))
-        for scheme in schemes:
-            scheme["_id"] = str(scheme["_id"])
-            scheme["created_at"] = scheme["created_at"].strftime("%Y-%m-%d %H:%M:%S")
-            scheme["updated_at"] = scheme["updated_at"].strftime("%Y-%m-%d %H:%M:%S")
-        return schemes
+        # ObjectId and datetime values are encoded by serialization.MongoJSONProvider
+        return _paginate(public_schemes, query, "_id", pymongo.ASCENDING, limit, cursor)
     except Exception as e:
         print(f"Error getting schemes: {e}")
         raise
 
 # Crop Price Management Functions
-def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    """Calculate distance between two points using Haversine formula"""
-    R = 6371  # Earth's radius in kilometers
-    
-    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * atan2(sqrt(a), sqrt(1-a))
-    distance = R * c
-    
-    return distance
-
 def get_prices(state: Optional[str] = None, region: Optional[str] = None, 
-               crop_name: Optional[str] = None, before_date: Optional[datetime.datetime] = None) -> List[Dict]:
-    """Get all prices, optionally filtered by state, region, crop_name and date"""
+               crop_name: Optional[str] = None, before_date: Optional[datetime.datetime] = None,
+               limit: Optional[int] = None, cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+    """Get a page of prices, optionally filtered by state, region, crop_name and date, and the next page cursor"""
     try:
         query = {}
         if state:
@@ -197,31 +350,348 @@ def get_prices(state: Optional[str] = None, region: Optional[str] = None,
         if before_date:
             query["date_effective"] = {"$lte": before_date}
         
-        prices = list(prices_collection.find(query).sort("date_effective", -1))
+        prices, next_cursor = _paginate(
+            prices_collection, query, "date_effective", pymongo.DESCENDING, limit, cursor
+        )
         
         # Convert ObjectId and dates to string format
         for price in prices:
-            price["_id"] = str(price["_id"])
-            if "date_effective" in price:
-                price["date_effective"] = price["date_effective"].strftime("%Y-%m-%d")
-            if "created_at" in price:
-                price["created_at"] = price["created_at"].strftime("%Y-%m-%d %H:%M:%S")
-            if "updated_at" in price:
-                price["updated_at"] = price["updated_at"].strftime("%Y-%m-%d %H:%M:%S")
-            
-            # Add market name if not present
-            if "market" not in price:
-                price["market"] = price["region"]
+            _format_price(price)
                 
-        return prices
+        return prices, next_cursor
     except Exception as e:
         print(f"Error getting prices: {e}")
         raise
 
+def _format_price(price: Dict) -> Dict:
+    """Convert ObjectId and dates of a price document to string format"""
+    price["_id"] = str(price["_id"])
+    if "date_effective" in price:
+        price["date_effective"] = price["date_effective"].strftime("%Y-%m-%d")
+    if "created_at" in price:
+        price["created_at"] = price["created_at"].strftime("%Y-%m-%d %H:%M:%S")
+    if "updated_at" in price:
+        price["updated_at"] = price["updated_at"].strftime("%Y-%m-%d %H:%M:%S")
+    
+    # Add market name if not present
+    if "market" not in price:
+        price["market"] = price["region"]
+    return price
+
+def _latest_price_key(price: Dict) -> Dict:
+    """_id of the latest_prices entry a price row belongs to"""
+    return {
+        "state": price["state"],
+        "region": price["region"],
+        "market": price.get("market") or price["region"],
+        "crop_name": price["crop_name"]
+    }
+
+# change and trend compare the latest price with the last one at least this many days older
+PRICE_TREND_DAYS = 7
+
+def _latest_prices_pipeline(match: Dict) -> List[Dict]:
+    """Latest, previous and trend reference price of every (state, region, market, crop_name) matched.
+
+    $topN keeps only the two newest rows per group instead of pushing the
+    whole history into memory (MongoDB 5.2+). The reference is the newest row
+    dated PRICE_TREND_DAYS or more before the latest one, fetched per group
+    from the (state, region, crop_name, market, date_effective) index.
+    """
+    return [
+        {"$match": match},
+        {"$group": {
+            "_id": {
+                "state": "$state",
+                "region": "$region",
+                "market": {"$ifNull": ["$market", "$region"]},
+                "crop_name": "$crop_name"
+            },
+            "rows": {"$topN": {
+                "n": 2,
+                "sortBy": {"date_effective": -1, "_id": -1},
+                "output": {
+                    "price_id": "$_id",
+                    "price": "$price",
+                    "date_effective": "$date_effective",
+                    "image_url": "$image_url",
+                    "latitude": "$latitude",
+                    "longitude": "$longitude",
+                    "created_at": "$created_at",
+                    "updated_at": "$updated_at"
+                }
+            }}
+        }},
+        {"$project": {
+            "latest": {"$arrayElemAt": ["$rows", 0]},
+            "previous": {"$arrayElemAt": ["$rows", 1]}
+        }},
+        {"$lookup": {
+            "from": prices_collection.name,
+            "let": {
+                "state": "$_id.state", "region": "$_id.region", "market": "$_id.market",
+                "crop_name": "$_id.crop_name",
+                "cutoff": {"$subtract": ["$latest.date_effective", PRICE_TREND_DAYS * 24 * 3600 * 1000]}
+            },
+            "pipeline": [
+                {"$match": {"$expr": {"$and": [
+                    {"$eq": ["$state", "$$state"]},
+                    {"$eq": ["$region", "$$region"]},
+                    {"$eq": ["$crop_name", "$$crop_name"]},
+                    {"$eq": [{"$ifNull": ["$market", "$region"]}, "$$market"]},
+                    {"$lte": ["$date_effective", "$$cutoff"]}
+                ]}}},
+                {"$sort": {"date_effective": -1, "_id": -1}},
+                {"$limit": 1},
+                {"$project": {"_id": 0, "price": 1, "date_effective": 1}}
+            ],
+            "as": "reference"
+        }},
+        {"$set": {"reference": {"$arrayElemAt": ["$reference", 0]}}},
+        {"$project": {
+            "state": "$_id.state",
+            "region": "$_id.region",
+            "market": "$_id.market",
+            "crop_name": "$_id.crop_name",
+            "price_id": "$latest.price_id",
+            "price": "$latest.price",
+            "date_effective": "$latest.date_effective",
+            "image_url": "$latest.image_url",
+            "latitude": "$latest.latitude",
+            "longitude": "$latest.longitude",
+            # GeoJSON point for the 2dsphere index; left out when coordinates are missing or invalid
+            "location": {"$cond": [
+                {"$and": [
+                    {"$isNumber": "$latest.latitude"},
+                    {"$isNumber": "$latest.longitude"},
+                    {"$gte": ["$latest.latitude", -90]}, {"$lte": ["$latest.latitude", 90]},
+                    {"$gte": ["$latest.longitude", -180]}, {"$lte": ["$latest.longitude", 180]}
+                ]},
+                {"type": "Point", "coordinates": ["$latest.longitude", "$latest.latitude"]},
+                "$$REMOVE"
+            ]},
+            "created_at": "$latest.created_at",
+            "updated_at": "$latest.updated_at",
+            "previous_price": "$previous.price",
+            "previous_date": "$previous.date_effective",
+            "reference_price": "$reference.price",
+            "reference_date": "$reference.date_effective",
+            # Marks entries computed with the current reference rule
+            "trend_days": {"$literal": PRICE_TREND_DAYS},
+            # Percent change since the reference price, as GET /api/prices has always reported it
+            "change": {"$cond": [
+                {"$gt": [{"$ifNull": ["$reference.price", 0]}, 0]},
+                {"$round": [{"$multiply": [
+                    {"$divide": [{"$subtract": ["$latest.price", "$reference.price"]}, "$reference.price"]},
+                    100
+                ]}, 1]},
+                0
+            ]}
+        }}
+    ]
+
+def _refresh_latest_prices(keys: List[Dict], session=None) -> None:
+    """Recompute the latest_prices entries for keys from the price history.
+
+    Callers invalidate the latest_prices response cache once the write has
+    committed, so a read cannot re-cache the entries it replaced.
+    """
+    if not keys:
+        return
+    keys = list({tuple(key.values()): key for key in keys}.values())
+    match = {"$or": [
+        {"state": key["state"], "region": key["region"], "crop_name": key["crop_name"],
+         "market": key["market"] if key["market"] != key["region"] else {"$in": [key["market"], None]}}
+        for key in keys
+    ]}
+    entries = {
+        tuple(entry["_id"].values()): entry
+        for entry in prices_collection.aggregate(_latest_prices_pipeline(match), session=session)
+    }
+    operations = []
+    for key in keys:
+        entry = entries.get(tuple(key.values()))
+        if entry is None:
+            operations.append(pymongo.DeleteOne({"_id": key}))
+        else:
+            operations.append(pymongo.ReplaceOne({"_id": key}, entry, upsert=True))
+    latest_prices_collection.bulk_write(operations, ordered=False, session=session)
+
+_transactions_supported = True
+
+def _run_in_transaction(callback):
+    """Run callback(session) in a transaction, or without one on a standalone server"""
+    global _transactions_supported
+    if _transactions_supported:
+        try:
+            with mongo_client().start_session() as session:
+                return session.with_transaction(callback)
+        except pymongo.errors.OperationFailure as e:
+            # IllegalOperation: transactions need a replica set or mongos
+            if e.code != 20:
+                raise
+            _transactions_supported = False
+            print("MongoDB transactions unsupported; latest_prices is maintained without them")
+    return callback(None)
+
+def rebuild_latest_prices() -> int:
+    """Recompute latest_prices from the full price history and return the number of entries"""
+    try:
+        pipeline = _latest_prices_pipeline({}) + [{"$out": latest_prices_collection.name}]
+        prices_collection.aggregate(pipeline, allowDiskUse=True)
+        invalidate("latest_prices")
+        return latest_prices_collection.count_documents({})
+    except Exception as e:
+        print(f"Error rebuilding latest prices: {e}")
+        raise
+
+def _date_string(field: str, date_format: str = "%Y-%m-%d") -> Dict:
+    """Projection expression formatting a date field on the server, omitted when missing"""
+    return {"$cond": [
+        {"$ifNull": [f"${field}", False]},
+        {"$dateToString": {"format": date_format, "date": f"${field}"}},
+        "$$REMOVE"
+    ]}
+
+# latest_prices entries shaped like a price row with trend fields, formatted by the server
+LATEST_PRICE_PROJECTION = {
+    "_id": {"$toString": "$price_id"},
+    "state": 1, "region": 1, "market": 1, "crop_name": 1, "price": 1,
+    "image_url": 1, "latitude": 1, "longitude": 1, "previous_price": 1,
+    "date_effective": _date_string("date_effective"),
+    "previous_date": _date_string("previous_date"),
+    "reference_price": 1,
+    "reference_date": _date_string("reference_date"),
+    "created_at": _date_string("created_at", "%Y-%m-%d %H:%M:%S"),
+    "updated_at": _date_string("updated_at", "%Y-%m-%d %H:%M:%S"),
+    "change": {"$abs": {"$ifNull": ["$change", 0]}},
+    "trend": {"$switch": {
+        "branches": [
+            {"case": {"$gt": [{"$ifNull": ["$change", 0]}, 0]}, "then": "up"},
+            {"case": {"$lt": [{"$ifNull": ["$change", 0]}, 0]}, "then": "down"}
+        ],
+        "default": "stable"
+    }}
+}
+
+def _format_latest_price(entry: Dict) -> Dict:
+    """Shape a raw latest_prices entry like LATEST_PRICE_PROJECTION does"""
+    entry.pop("_id", None)
+    entry.pop("location", None)
+    entry.pop("trend_days", None)
+    entry["_id"] = str(entry.pop("price_id"))
+    entry["date_effective"] = entry["date_effective"].strftime("%Y-%m-%d")
+    for field in ("previous_date", "reference_date"):
+        if entry.get(field):
+            entry[field] = entry[field].strftime("%Y-%m-%d")
+    if entry.get("created_at"):
+        entry["created_at"] = entry["created_at"].strftime("%Y-%m-%d %H:%M:%S")
+    if entry.get("updated_at"):
+        entry["updated_at"] = entry["updated_at"].strftime("%Y-%m-%d %H:%M:%S")
+    change = entry.get("change") or 0
+    entry["trend"] = "up" if change > 0 else "down" if change < 0 else "stable"
+    entry["change"] = abs(change)
+    return entry
+
+def get_latest_prices(state: Optional[str] = None, region: Optional[str] = None,
+                      crop_name: Optional[str] = None) -> List[Dict]:
+    """Get the latest price of every crop and market, with change against the price PRICE_TREND_DAYS earlier"""
+    try:
+        query = {}
+        if state:
+            query["state"] = state
+        if region:
+            query["region"] = region
+        if crop_name:
+            query["crop_name"] = crop_name
+        return list(public_latest_prices.find(query, LATEST_PRICE_PROJECTION)
+                    .sort([("date_effective", -1), ("crop_name", 1)]))
+    except Exception as e:
+        print(f"Error getting latest prices: {e}")
+        raise
+
+def get_nearby_latest_prices(latitude: float, longitude: float, max_distance_km: Optional[float] = None,
+                             limit: Optional[int] = None, crop_name: Optional[str] = None) -> List[Dict]:
+    """Get the latest prices of the markets nearest to a point, with distance in km"""
+    try:
+        geo_near = {
+            "near": {"type": "Point", "coordinates": [longitude, latitude]},
+            "distanceField": "distance",
+            "distanceMultiplier": 0.001,
+            "spherical": True
+        }
+        if max_distance_km is not None:
+            geo_near["maxDistance"] = max_distance_km * 1000
+        if crop_name:
+            geo_near["query"] = {"crop_name": crop_name}
+
+        try:
+            return list(public_latest_prices.aggregate([
+                {"$geoNear": geo_near},
+                {"$limit": clamp_limit(limit)},
+                {"$project": {**LATEST_PRICE_PROJECTION, "distance": {"$round": ["$distance", 2]}}}
+            ]))
+        except pymongo.errors.OperationFailure as e:
+            # No usable 2dsphere index (e.g. not created yet): rank in-process instead
+            print(f"$geoNear unavailable, using coordinate snapshot: {e}")
+        prices = []
+        for entry in _nearby_from_snapshot(latitude, longitude, max_distance_km, clamp_limit(limit), crop_name):
+            entry["distance"] = round(entry["distance"], 2)
+            prices.append(_format_latest_price(entry))
+        return prices
+    except Exception as e:
+        print(f"Error getting nearby prices: {e}")
+        raise
+
+# Cached market coordinates for ranking by distance without $geoNear
+market_coordinates = MarketCoordinates(public_latest_prices)
+
+def _nearby_from_snapshot(latitude: float, longitude: float, max_distance_km: Optional[float],
+                          limit: int, crop_name: Optional[str]) -> List[Dict]:
+    """Nearest latest_prices entries ranked with the vectorized haversine kernel"""
+    nearest = market_coordinates.nearest(latitude, longitude, limit, max_distance_km, crop_name)
+    entries = {
+        tuple(entry["_id"].values()): entry
+        for entry in public_latest_prices.find({"_id": {"$in": [entry_id for entry_id, _ in nearest]}})
+    }
+    results = []
+    for entry_id, distance in nearest:
+        entry = entries.get(tuple(entry_id.values()))
+        if entry:
+            entry["distance"] = distance
+            results.append(entry)
+    return results
+
+def latest_prices_need_rebuild() -> bool:
+    """True when latest_prices is empty or predates a field the pipeline now adds"""
+    if latest_prices_collection.estimated_document_count() == 0:
+        return prices_collection.estimated_document_count() > 0
+    if latest_prices_collection.count_documents({"trend_days": {"$ne": PRICE_TREND_DAYS}}, limit=1) > 0:
+        return True
+    # Same conditions under which _latest_prices_pipeline sets location, so entries
+    # left without one for invalid coordinates do not trigger a rebuild on every boot
+    return latest_prices_collection.count_documents(
+        {
+            "location": {"$exists": False},
+            "latitude": {"$type": "number", "$gte": -90, "$lte": 90},
+            "longitude": {"$type": "number", "$gte": -180, "$lte": 180}
+        },
+        limit=1
+    ) > 0
+
+def get_price(price_id: str) -> Optional[Dict]:
+    """Get a single price entry"""
+    try:
+        price = prices_collection.find_one({"_id": ObjectId(price_id)})
+        return _format_price(price) if price else None
+    except Exception as e:
+        print(f"Error getting price: {e}")
+        raise
+
 def create_price(crop_name: str, price: float, state: str, region: str, 
                  date_effective: str, image_url: Optional[str] = None,
                  market: Optional[str] = None, latitude: Optional[float] = None,
-                 longitude: Optional[float] = None) -> str:
+                 longitude: Optional[float] = None, image_key: Optional[str] = None) -> str:
     """Create a new price entry"""
     try:
         price_data = {
@@ -237,16 +707,61 @@ def create_price(crop_name: str, price: float, state: str, region: str,
         
         if image_url:
             price_data["image_url"] = image_url
+        if image_key:
+            price_data["image_key"] = image_key
         if latitude is not None and longitude is not None:
             price_data["latitude"] = latitude
             price_data["longitude"] = longitude
 
-        result = prices_collection.insert_one(price_data)
-        return str(result.inserted_id)
+        def write(session):
+            result = prices_collection.insert_one(price_data, session=session)
+            _refresh_latest_prices([_latest_price_key(price_data)], session)
+            return str(result.inserted_id)
+
+        try:
+            price_id = _run_in_transaction(write)
+        except pymongo.errors.DuplicateKeyError:
+            raise ValueError("A price for this crop, market and date already exists")
+        invalidate("latest_prices")
+        return price_id
     except Exception as e:
         print(f"Error creating price: {e}")
         raise
 
+def bulk_upsert_prices(price_rows: List[Dict]) -> Dict:
+    """Upsert validated price rows in one bulk write, keyed on (state, region, crop_name, market, date_effective)"""
+    try:
+        if not price_rows:
+            return {"inserted": 0, "updated": 0}
+        now = datetime.datetime.utcnow()
+        operations = [
+            pymongo.UpdateOne(
+                {
+                    "state": row["state"],
+                    "region": row["region"],
+                    "crop_name": row["crop_name"],
+                    "market": row["market"],
+                    "date_effective": row["date_effective"]
+                },
+                {
+                    "$set": {**row, "updated_at": now},
+                    "$setOnInsert": {"created_at": now}
+                },
+                upsert=True
+            )
+            for row in price_rows
+        ]
+        try:
+            result = prices_collection.bulk_write(operations, ordered=False)
+        finally:
+            # Not transactional: a failed chunk still refreshes whatever rows it wrote
+            _refresh_latest_prices([_latest_price_key(row) for row in price_rows])
+            invalidate("latest_prices")
+        return {"inserted": result.upserted_count, "updated": result.modified_count}
+    except Exception as e:
+        print(f"Error bulk upserting prices: {e}")
+        raise
+
 def update_price(price_id: str, updates: Dict) -> None:
     """Update an existing price entry"""
     try:
@@ -256,12 +771,23 @@ def update_price(price_id: str, updates: Dict) -> None:
             updates["date_effective"] = datetime.datetime.strptime(updates["date_effective"], "%Y-%m-%d")
         
         updates["updated_at"] = datetime.datetime.utcnow()
-        result = prices_collection.update_one(
-            {"_id": ObjectId(price_id)},
-            {"$set": updates}
-        )
-        if result.matched_count == 0:
-            raise ValueError("Price entry not found")
+
+        def write(session):
+            before = prices_collection.find_one_and_update(
+                {"_id": ObjectId(price_id)},
+                {"$set": updates},
+                session=session
+            )
+            if before is None:
+                raise ValueError("Price entry not found")
+            # The key changes when the crop, market or region is edited
+            _refresh_latest_prices([_latest_price_key(before), _latest_price_key({**before, **updates})], session)
+
+        try:
+            _run_in_transaction(write)
+        except pymongo.errors.DuplicateKeyError:
+            raise ValueError("A price for this crop, market and date already exists")
+        invalidate("latest_prices")
     except Exception as e:
         print(f"Error updating price: {e}")
         raise
@@ -280,9 +806,14 @@ def delete_price(price_id: str) -> None:
             delete_from_s3(price_entry["image_key"])
         
         # Delete from database
-        result = prices_collection.delete_one({"_id": ObjectId(price_id)})
-        if result.deleted_count == 0:
-            raise ValueError("Price entry not found")
+        def write(session):
+            result = prices_collection.delete_one({"_id": ObjectId(price_id)}, session=session)
+            if result.deleted_count == 0:
+                raise ValueError("Price entry not found")
+            _refresh_latest_prices([_latest_price_key(price_entry)], session)
+
+        _run_in_transaction(write)
+        invalidate("latest_prices")
     except Exception as e:
         print(f"Error deleting price: {e}")
         raise
@@ -313,8 +844,9 @@ def get_historical_prices(crop_name: str, market: str, days: int = 7) -> List[Di
         raise
 
 # Image Upload Management
-def save_upload_history(user_id: str, file_path: str, analysis_result: str) -> str:
-    """Save image upload history"""
+def save_upload_history(user_id: str, file_path: str, analysis_result: str,
+                        image_hash: Optional[str] = None, analysis_version: Optional[str] = None) -> str:
+    """Save image upload history, with the perceptual hash of the image when known"""
     try:
         upload_entry = {
             "user_id": user_id,
@@ -322,20 +854,111 @@ def save_upload_history(user_id: str, file_path: str, analysis_result: str) -> s
             "analysis_result": analysis_result,
             "uploaded_at": datetime.datetime.utcnow()
         }
+        if image_hash:
+            upload_entry["image_hash"] = image_hash
+            upload_entry["analysis_version"] = analysis_version
         result = uploads_collection.insert_one(upload_entry)
         return str(result.inserted_id)
     except Exception as e:
         print(f"Error saving upload history: {e}")
         raise
 
-def get_user_uploads(user_id: str) -> List[Dict]:
-    """Get upload history for a user"""
+# Analysis Job Management
+# Jobs a web worker is still expected to finish; their lease is renewed by that worker
+ACTIVE_ANALYSIS_JOB_STATUSES = ["queued", "running"]
+ANALYSIS_JOB_INTERRUPTED = "the server restarted before the analysis finished, please upload the image again"
+
+def create_analysis_job(user_id: str, filename: str, lease_seconds: int = 60) -> str:
+    """Create a queued image analysis job leased to the calling worker"""
     try:
-        uploads = list(uploads_collection.find({"user_id": user_id}).sort("uploaded_at", -1))
-        for upload in uploads:
-            upload["_id"] = str(upload["_id"])
-            upload["uploaded_at"] = upload["uploaded_at"].strftime("%Y-%m-%d %H:%M:%S")
-        return uploads
+        now = datetime.datetime.utcnow()
+        job = {
+            "user_id": user_id,
+            "filename": filename,
+            "status": "queued",
+            "progress": 0,
+            "lease_until": now + datetime.timedelta(seconds=lease_seconds),
+            "created_at": now,
+            "updated_at": now
+        }
+        result = analysis_jobs_collection.insert_one(job)
+        return str(result.inserted_id)
+    except Exception as e:
+        print(f"Error creating analysis job: {e}")
+        raise
+
+def update_analysis_job(job_id: str, updates: Dict) -> None:
+    """Update the status, progress or result of an analysis job"""
+    try:
+        updates["updated_at"] = datetime.datetime.utcnow()
+        analysis_jobs_collection.update_one(
+            {"_id": ObjectId(job_id)},
+            {"$set": updates}
+        )
+    except Exception as e:
+        print(f"Error updating analysis job: {e}")
+        raise
+
+def renew_analysis_job_leases(job_ids: List[str], lease_seconds: int) -> None:
+    """Extend the leases of unfinished jobs held by a live worker"""
+    try:
+        analysis_jobs_collection.update_many(
+            {"_id": {"$in": [ObjectId(job_id) for job_id in job_ids]},
+             "status": {"$in": ACTIVE_ANALYSIS_JOB_STATUSES}},
+            {"$set": {"lease_until": datetime.datetime.utcnow() + datetime.timedelta(seconds=lease_seconds)}}
+        )
+    except Exception as e:
+        print(f"Error renewing analysis job leases: {e}")
+        raise
+
+def fail_expired_analysis_jobs(job_filter: Optional[Dict] = None) -> int:
+    """Mark unfinished jobs whose worker stopped renewing the lease as failed.
+
+    The uploaded image only lived in that worker's memory, so the job cannot
+    be requeued; failing it lets the polling client stop and ask for a retry.
+    """
+    try:
+        now = datetime.datetime.utcnow()
+        query = {"status": {"$in": ACTIVE_ANALYSIS_JOB_STATUSES}, "lease_until": {"$lt": now}}
+        if job_filter:
+            query.update(job_filter)
+        result = analysis_jobs_collection.update_many(
+            query,
+            {"$set": {"status": "failed", "error": ANALYSIS_JOB_INTERRUPTED, "updated_at": now}}
+        )
+        return result.modified_count
+    except Exception as e:
+        print(f"Error failing expired analysis jobs: {e}")
+        raise
+
+def get_analysis_job(job_id: str, user_id: str) -> Optional[Dict]:
+    """Get an analysis job owned by the given user"""
+    try:
+        query = {"_id": ObjectId(job_id), "user_id": user_id}
+        job = analysis_jobs_collection.find_one(query)
+        if job and job["status"] in ACTIVE_ANALYSIS_JOB_STATUSES and \
+                job.get("lease_until") and job["lease_until"] < datetime.datetime.utcnow():
+            # Fail it now rather than waiting for the next periodic sweep
+            fail_expired_analysis_jobs(query)
+            job = analysis_jobs_collection.find_one(query)
+        if job:
+            job["_id"] = str(job["_id"])
+            job.pop("lease_until", None)
+            job["created_at"] = job["created_at"].strftime("%Y-%m-%d %H:%M:%S")
+            job["updated_at"] = job["updated_at"].strftime("%Y-%m-%d %H:%M:%S")
+        return job
+    except Exception as e:
+        print(f"Error getting analysis job: {e}")
+        raise
+
+def get_user_uploads(user_id: str, limit: Optional[int] = None,
+                     cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+    """Get a page of upload history for a user and the next page cursor"""
+    try:
+        return _paginate(
+            uploads_collection, {"user_id": user_id}, "uploaded_at", pymongo.DESCENDING, limit, cursor,
+            projection={"user_id": 1, "file_path": 1, "analysis_result": 1, "uploaded_at": 1}
+        )
     except Exception as e:
         print(f"Error getting user uploads: {e}")
         raise
@@ -356,30 +979,34 @@ def create_expert_article(title: str, description: str, author: str, category: s
             "status": "active"
         }
         result = expert_articles_collection.insert_one(article)
+        invalidate("expert_articles")
         return str(result.inserted_id)
     except Exception as e:
         print(f"Error creating expert article: {e}")
         raise
 
-def get_expert_articles(category: Optional[str] = None) -> List[Dict]:
-    """Get all expert articles, optionally filtered by category"""
+def get_expert_articles(category: Optional[str] = None, limit: Optional[int] = None,
+                        cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+    """Get a page of expert articles, optionally filtered by category, and the next page cursor"""
     try:
         query = {"status": "active"}
         if category and category.lower() != "all categories":
             query["category"] = category
             
-        articles = list(expert_articles_collection.find(query).sort("created_at", -1))
+        articles, next_cursor = _paginate(
+            public_expert_articles, query, "created_at", pymongo.DESCENDING, limit, cursor,
+            projection=ARTICLE_LIST_PROJECTION
+        )
         for article in articles:
-            article["_id"] = str(article["_id"])
+            # $dateToString has no month names, so this format stays in Python
             article["created_at"] = article["created_at"].strftime("%B %d, %Y")  # Format: March 15, 2024
-            article["updated_at"] = article["updated_at"].strftime("%Y-%m-%d %H:%M:%S")
             
             # Handle read_time field
             if "read_time" not in article:
                 article["read_time"] = 5  # Default read time
             article["read_time_text"] = f"{article['read_time']} min read"
             
-        return articles
+        return articles, next_cursor
     except Exception as e:
         print(f"Error getting expert articles: {e}")
         raise
@@ -387,7 +1014,7 @@ def get_expert_articles(category: Optional[str] = None) -> List[Dict]:
 def get_expert_article(article_id: str) -> Optional[Dict]:
     """Get a specific expert article by ID"""
     try:
-        article = expert_articles_collection.find_one({"_id": ObjectId(article_id), "status": "active"})
+        article = public_expert_articles.find_one({"_id": ObjectId(article_id), "status": "active"})
         if article:
             article["_id"] = str(article["_id"])
             article["created_at"] = article["created_at"].strftime("%B %d, %Y")
@@ -413,6 +1040,7 @@ def update_expert_article(article_id: str, updates: Dict) -> None:
         )
         if result.matched_count == 0:
             raise ValueError("Article not found")
+        invalidate("expert_articles")
     except Exception as e:
         print(f"Error updating expert article: {e}")
         raise
@@ -426,6 +1054,7 @@ def delete_expert_article(article_id: str) -> None:
         )
         if result.matched_count == 0:
             raise ValueError("Article not found")
+        invalidate("expert_articles")
     except Exception as e:
         print(f"Error deleting expert article: {e}")
         raise
@@ -443,20 +1072,19 @@ def create_daily_news(title: str, description: str, image_url: Optional[str] = N
             "status": "active"
         }
         result = daily_news_collection.insert_one(news)
+        invalidate("daily_news")
         return str(result.inserted_id)
     except Exception as e:
         print(f"Error creating daily news: {e}")
         raise
 
-def get_daily_news() -> List[Dict]:
-    """Get all daily news entries"""
+def get_daily_news(limit: Optional[int] = None, cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+    """Get a page of daily news entries and the next page cursor"""
     try:
-        news_list = list(daily_news_collection.find({"status": "active"}).sort("created_at", -1))
-        for news in news_list:
-            news["_id"] = str(news["_id"])
-            news["created_at"] = news["created_at"].strftime("%Y-%m-%d %H:%M:%S")
-            news["updated_at"] = news["updated_at"].strftime("%Y-%m-%d %H:%M:%S")
-        return news_list
+        return _paginate(
+            public_daily_news, {"status": "active"}, "created_at", pymongo.DESCENDING, limit, cursor,
+            projection=NEWS_LIST_PROJECTION
+        )
     except Exception as e:
         print(f"Error getting daily news: {e}")
         raise
@@ -464,7 +1092,7 @@ def get_daily_news() -> List[Dict]:
 def get_daily_news_item(news_id: str) -> Optional[Dict]:
     """Get a specific daily news item by ID"""
     try:
-        news = daily_news_collection.find_one({"_id": ObjectId(news_id), "status": "active"})
+        news = public_daily_news.find_one({"_id": ObjectId(news_id), "status": "active"})
         if news:
             news["_id"] = str(news["_id"])
             news["created_at"] = news["created_at"].strftime("%Y-%m-%d %H:%M:%S")
@@ -484,6 +1112,7 @@ def update_daily_news(news_id: str, updates: Dict) -> None:
         )
         if result.matched_count == 0:
             raise ValueError("News item not found")
+        invalidate("daily_news")
     except Exception as e:
         print(f"Error updating daily news: {e}")
         raise
@@ -497,10 +1126,241 @@ def delete_daily_news(news_id: str) -> None:
         )
         if result.matched_count == 0:
             raise ValueError("News item not found")
+        invalidate("daily_news")
     except Exception as e:
         print(f"Error deleting daily news: {e}")
         raise
 
+# Notification Outbox Functions
+def enqueue_notification(region: str, notification_data: Dict, notification_type: str,
+                         items: Optional[List[Dict]] = None) -> str:
+    """Queue a push notification fan-out for the notification worker.
+
+    items carries several notifications of the same type that are sent as one digest.
+    """
+    try:
+        job = {
+            "region": region,
+            "notification_data": notification_data,
+            "notification_type": notification_type,
+            "status": "pending",
+            "attempts": 0,
+            "created_at": datetime.datetime.utcnow(),
+            "updated_at": datetime.datetime.utcnow(),
+            "not_before": datetime.datetime.utcnow() + datetime.timedelta(seconds=NOTIFICATION_COALESCE_WINDOW)
+        }
+        if items:
+            job["items"] = items
+        result = notification_outbox_collection.insert_one(job)
+        return str(result.inserted_id)
+    except Exception as e:
+        print(f"Error enqueueing notification: {e}")
+        raise
+
+def requeue_notification(job: Dict, items: List[Dict], user_ids: List, delay_seconds: float) -> Optional[str]:
+    """Queue the digest again for user_ids once the push service's Retry-After has passed.
+
+    Returns the new job id, or None once the send has been deferred
+    NOTIFICATION_MAX_DEFERRALS times.
+    """
+    deferrals = job.get("deferrals", 0) + 1
+    if deferrals > NOTIFICATION_MAX_DEFERRALS:
+        return None
+    try:
+        now = datetime.datetime.utcnow()
+        result = notification_outbox_collection.insert_one({
+            "region": job["region"],
+            "notification_data": items[-1],
+            "notification_type": job["notification_type"],
+            "items": items,
+            "user_ids": user_ids,
+            "deferrals": deferrals,
+            "deferred_from": job["_id"],
+            "status": "pending",
+            "attempts": 0,
+            "created_at": now,
+            "updated_at": now,
+            "not_before": now + datetime.timedelta(seconds=delay_seconds)
+        })
+        return str(result.inserted_id)
+    except Exception as e:
+        print(f"Error requeueing notification: {e}")
+        raise
+
+class NotificationLeaseLost(Exception):
+    """Raised when another worker has taken over a notification job"""
+
+def claim_notification_job(lease_seconds: int = 600) -> Optional[Dict]:
+    """Atomically claim the oldest due pending job, or one whose worker died mid-run.
+
+    The returned job carries a fresh lease_id that later writes must present.
+    """
+    try:
+        now = datetime.datetime.utcnow()
+        return notification_outbox_collection.find_one_and_update(
+            {"$or": [
+                {"status": "pending", "not_before": {"$not": {"$gt": now}}},
+                {"status": "processing", "lease_expires_at": {"$lt": now}}
+            ]},
+            {
+                "$set": {
+                    "status": "processing",
+                    "lease_id": ObjectId(),
+                    "lease_expires_at": now + datetime.timedelta(seconds=lease_seconds),
+                    "updated_at": now
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("created_at", pymongo.ASCENDING)],
+            return_document=pymongo.ReturnDocument.AFTER
+        )
+    except Exception as e:
+        print(f"Error claiming notification job: {e}")
+        raise
+
+def claim_coalesced_notification_jobs(job: Dict, max_jobs: int, lease_seconds: int = 600) -> List[Dict]:
+    """Claim other pending jobs for the same region and type so they go out as one digest.
+
+    Jobs still inside their coalescing window are taken too; they would only
+    repeat the digest's content once their window closed. Partly delivered
+    jobs are left alone so their retry resumes with the same digest.
+    """
+    try:
+        now = datetime.datetime.utcnow()
+        claimed = []
+        while len(claimed) < max_jobs:
+            merged = notification_outbox_collection.find_one_and_update(
+                {
+                    "status": "pending",
+                    "region": job["region"],
+                    "notification_type": job["notification_type"],
+                    "progress": {"$exists": False},
+                    # Rescheduled sends go only to their own users
+                    "user_ids": {"$exists": False}
+                },
+                {
+                    "$set": {
+                        "status": "processing",
+                        "coalesced_into": job["_id"],
+                        "lease_expires_at": now + datetime.timedelta(seconds=lease_seconds),
+                        "updated_at": now
+                    },
+                    "$inc": {"attempts": 1}
+                },
+                sort=[("created_at", pymongo.ASCENDING)],
+                return_document=pymongo.ReturnDocument.AFTER
+            )
+            if merged is None:
+                break
+            claimed.append(merged)
+        return claimed
+    except Exception as e:
+        print(f"Error claiming coalesced notification jobs: {e}")
+        raise
+
+def merge_notification_jobs(job: Dict, items: List[Dict], merged_ids: List) -> None:
+    """Store the digest items on the leading job and complete the jobs merged into it.
+
+    Done before sending, so a retry of the leader resends exactly this digest
+    and the merged jobs are never sent on their own as well.
+    """
+    try:
+        now = datetime.datetime.utcnow()
+        result = notification_outbox_collection.update_one(
+            {"_id": job["_id"], "lease_id": job["lease_id"]},
+            {"$set": {"items": items, "updated_at": now}}
+        )
+        if result.matched_count == 0:
+            raise NotificationLeaseLost(f"Notification job {job['_id']} was taken over")
+        if merged_ids:
+            notification_outbox_collection.update_many(
+                {"_id": {"$in": merged_ids}},
+                {
+                    "$set": {
+                        "status": "completed",
+                        "stats": {"coalesced_into": str(job["_id"])},
+                        "completed_at": now,
+                        "updated_at": now
+                    },
+                    "$unset": {"lease_expires_at": "", "lease_id": ""}
+                }
+            )
+    except Exception as e:
+        print(f"Error merging notification jobs: {e}")
+        raise
+
+def checkpoint_notification_job(job: Dict, last_user_id: ObjectId, stats: Dict, lease_seconds: int = 600) -> None:
+    """Record fan-out progress after a batch and renew the lease.
+
+    Raises NotificationLeaseLost when the lease has passed to another worker,
+    so this one stops sending.
+    """
+    try:
+        now = datetime.datetime.utcnow()
+        result = notification_outbox_collection.update_one(
+            {"_id": job["_id"], "lease_id": job["lease_id"]},
+            {"$set": {
+                "progress": {"last_user_id": last_user_id, "stats": stats},
+                "lease_expires_at": now + datetime.timedelta(seconds=lease_seconds),
+                "updated_at": now
+            }}
+        )
+    except Exception as e:
+        print(f"Error checkpointing notification job: {e}")
+        raise
+    if result.matched_count == 0:
+        raise NotificationLeaseLost(f"Notification job {job['_id']} was taken over")
+
+def finish_notification_job(job: Dict, stats: Dict, error: Optional[str] = None) -> None:
+    """Record delivery stats for a job held under its lease.
+
+    Failed jobs go back to pending with exponential backoff until
+    NOTIFICATION_MAX_ATTEMPTS, keeping their progress so the retry resumes.
+    """
+    try:
+        now = datetime.datetime.utcnow()
+        updates = {"stats": stats, "updated_at": now}
+        unset = {"lease_expires_at": "", "lease_id": ""}
+        if error:
+            updates["error"] = error
+            if job.get("attempts", 0) >= NOTIFICATION_MAX_ATTEMPTS:
+                updates["status"] = "failed"
+            else:
+                updates["status"] = "pending"
+                backoff = min(3600, NOTIFICATION_RETRY_BACKOFF * 2 ** (max(job.get("attempts", 1), 1) - 1))
+                updates["not_before"] = now + datetime.timedelta(seconds=backoff)
+            # A job that was merged but not yet absorbed is coalesced afresh
+            unset["coalesced_into"] = ""
+        else:
+            updates["status"] = "completed"
+            updates["completed_at"] = now
+        notification_outbox_collection.update_one(
+            {"_id": job["_id"], "lease_id": job.get("lease_id")},
+            {"$set": updates, "$unset": unset}
+        )
+    except Exception as e:
+        print(f"Error finishing notification job: {e}")
+        raise
+
+def get_notification_job(job_id: str) -> Optional[Dict]:
+    """Get a notification job and its delivery stats"""
+    try:
+        job = notification_outbox_collection.find_one({"_id": ObjectId(job_id)})
+        if job:
+            job["_id"] = str(job["_id"])
+            if job.get("coalesced_into"):
+                job["coalesced_into"] = str(job["coalesced_into"])
+            job.pop("lease_id", None)
+            if job.get("progress"):
+                job["progress"]["last_user_id"] = str(job["progress"]["last_user_id"])
+            for field in ("created_at", "updated_at", "completed_at", "lease_expires_at", "not_before"):
+                if job.get(field):
+                    job[field] = job[field].strftime("%Y-%m-%d %H:%M:%S")
+        return job
+    except Exception as e:
+        print(f"Error getting notification job: {e}")
+        raise
+
 def update_notification_preferences(user_id: str, preferences: Dict) -> None:
     """Update user's notification preferences"""
     try:
@@ -508,6 +1368,7 @@ def update_notification_preferences(user_id: str, preferences: Dict) -> None:
             {"_id": ObjectId(user_id)},
             {"$set": {"notification_preferences": preferences}}
         )
+        invalidate_user(user_id)
     except Exception as e:
         print(f"Error updating notification preferences: {e}")
         raise
@@ -515,7 +1376,7 @@ def update_notification_preferences(user_id: str, preferences: Dict) -> None:
 def get_notification_preferences(user_id: str) -> Dict:
     """Get user's notification preferences"""
     try:
-        user = users_collection.find_one({"_id": ObjectId(user_id)})
+        user = get_user(user_id)
         if not user:
             raise ValueError("User not found")
         return user.get("notification_preferences", {
@@ -535,6 +1396,7 @@ def save_push_subscription(user_id: str, subscription: Dict) -> None:
             {"_id": ObjectId(user_id)},
             {"$set": {"push_subscription": subscription}}
         )
+        invalidate_user(user_id)
     except Exception as e:
         print(f"Error saving push subscription: {e}")
         raise
@@ -546,6 +1408,83 @@ def remove_push_subscription(user_id: str) -> None:
             {"_id": ObjectId(user_id)},
             {"$unset": {"push_subscription": ""}}
         )
+        invalidate_user(user_id)
     except Exception as e:
         print(f"Error removing push subscription: {e}")
         raise
+
+# Maintenance tasks
+@contextmanager
+def maintenance_lock(name: str, lease_seconds: int = 900):
+    """Hold a cluster-wide lock on a maintenance task; yields False if another process holds it"""
+    now = datetime.datetime.utcnow()
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    try:
+        maintenance_collection.update_one(
+            {"_id": name, "$or": [{"locked_until": {"$lt": now}}, {"locked_until": {"$exists": False}}]},
+            {"$set": {"locked_until": now + datetime.timedelta(seconds=lease_seconds), "locked_by": owner}},
+            upsert=True
+        )
+    except pymongo.errors.DuplicateKeyError:
+        # The task document exists and its lock is still held
+        yield False
+        return
+    try:
+        yield True
+    finally:
+        maintenance_collection.update_one(
+            {"_id": name, "locked_by": owner},
+            {"$unset": {"locked_until": "", "locked_by": ""}}
+        )
+
+def run_once(name: str, task: Callable[[], Any]) -> Tuple[bool, Any]:
+    """Run a one-off task unless it has completed before or is running elsewhere.
+
+    Returns (ran, result); completion is recorded in the maintenance collection.
+    """
+    try:
+        if maintenance_collection.find_one({"_id": name, "completed_at": {"$exists": True}}, {"_id": 1}):
+            return False, None
+        with maintenance_lock(name) as acquired:
+            if not acquired:
+                return False, None
+            result = task()
+            maintenance_collection.update_one(
+                {"_id": name},
+                {"$set": {"completed_at": datetime.datetime.utcnow(), "result": result}}
+            )
+            return True, result
+    except Exception as e:
+        print(f"Error running maintenance task {name}: {e}")
+        raise
+
+def backfill_latest_prices() -> Optional[int]:
+    """Rebuild latest_prices if it needs it, under a lock so only one process runs the $out.
+
+    Returns the number of entries, or None when no rebuild was needed or
+    another process is running it.
+    """
+    with maintenance_lock("latest_prices_rebuild", lease_seconds=3600) as acquired:
+        if acquired and latest_prices_need_rebuild():
+            return rebuild_latest_prices()
+    return None
+
+def migrate_token_blacklist() -> Tuple[bool, Any]:
+    """Hash the raw tokens stored by older versions in token_blacklist, once"""
+    return run_once("token_blacklist_hash_migration", TokenBlacklist(token_blacklist_collection).migrate_raw_tokens)
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="FarmCare database maintenance")
+    parser.add_argument("command", choices=["rebuild-latest-prices", "migrate-token-blacklist"])
+    args = parser.parse_args()
+
+    if args.command == "rebuild-latest-prices":
+        with maintenance_lock("latest_prices_rebuild", lease_seconds=3600) as acquired:
+            if acquired:
+                print(f"latest_prices rebuilt with {rebuild_latest_prices()} entries")
+            else:
+                print("latest_prices rebuild already running elsewhere")
+    elif args.command == "migrate-token-blacklist":
+        ran, migrated = migrate_token_blacklist()
+        print(f"{migrated} token_blacklist entries migrated" if ran else "Migration already done or running elsewhere")
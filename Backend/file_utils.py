@@ -1,24 +1,24 @@
 import mimetypes
 import os
-from typing import Tuple, Optional
+from typing import BinaryIO, Tuple, Optional
 
 def get_mime_type(file_content: bytes, filename: str) -> Tuple[bool, Optional[str]]:
-    """Get MIME type using file extension and content checking"""
+    """Get MIME type using file content signature, falling back to the file extension"""
     try:
-        # Get MIME type from file extension
-        mime_type, _ = mimetypes.guess_type(filename)
+        # Check file signature for common image types
+        mime_type = None
+        if file_content.startswith(b'\xFF\xD8\xFF'):  # JPEG
+            mime_type = 'image/jpeg'
+        elif file_content.startswith(b'\x89PNG\r\n\x1a\n'):  # PNG
+            mime_type = 'image/png'
+        elif file_content.startswith(b'GIF87a') or file_content.startswith(b'GIF89a'):  # GIF
+            mime_type = 'image/gif'
+        elif file_content.startswith(b'RIFF') and file_content[8:12] == b'WEBP':  # WEBP
+            mime_type = 'image/webp'
         
-        # If can't determine from extension, check file signature
+        # If can't determine from content, use the file extension
         if not mime_type:
-            # Check file signature for common image types
-            if file_content.startswith(b'\xFF\xD8\xFF'):  # JPEG
-                mime_type = 'image/jpeg'
-            elif file_content.startswith(b'\x89PNG\r\n\x1a\n'):  # PNG
-                mime_type = 'image/png'
-            elif file_content.startswith(b'GIF87a') or file_content.startswith(b'GIF89a'):  # GIF
-                mime_type = 'image/gif'
-            elif file_content.startswith(b'RIFF') and file_content[8:12] == b'WEBP':  # WEBP
-                mime_type = 'image/webp'
+            mime_type, _ = mimetypes.guess_type(filename)
         
         if not mime_type:
             return False, "Could not determine file type"
@@ -28,4 +28,16 @@ def get_mime_type(file_content: bytes, filename: str) -> Tuple[bool, Optional[st
         
         return True, mime_type
     except Exception as e:
-        return False, str(e) 
\ No newline at end of file
+        return False, str(e)
+
+def read_upload(stream: BinaryIO, max_bytes: int, chunk_size: int = 64 * 1024) -> bytes:
+    """Read an uploaded file stream once, failing as soon as it exceeds max_bytes"""
+    buffer = bytearray()
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        buffer.extend(chunk)
+        if len(buffer) > max_bytes:
+            raise ValueError(f"File size too large. Maximum size: {max_bytes // (1024 * 1024)}MB")
+    return bytes(buffer)
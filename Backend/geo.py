@@ -0,0 +1,89 @@
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from pymongo.collection import Collection
+from cache_utils import subscribe
+
+EARTH_RADIUS_KM = 6371.0
+
+def haversine_km(latitude: float, longitude: float, lat_rad: np.ndarray, lon_rad: np.ndarray,
+                 cos_lat: Optional[np.ndarray] = None) -> np.ndarray:
+    """Great-circle distances in km from one origin to arrays of points given in radians.
+
+    cos_lat can be passed precomputed since it only depends on the points.
+    """
+    origin_lat, origin_lon = np.radians(latitude), np.radians(longitude)
+    if cos_lat is None:
+        cos_lat = np.cos(lat_rad)
+    a = np.sin((lat_rad - origin_lat) / 2) ** 2 + \
+        np.cos(origin_lat) * cos_lat * np.sin((lon_rad - origin_lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def top_k(distances: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k smallest distances, nearest first, without a full sort"""
+    if k <= 0 or not len(distances):
+        return np.empty(0, dtype=np.intp)
+    if k < len(distances):
+        nearest = np.argpartition(distances, k - 1)[:k]
+    else:
+        nearest = np.arange(len(distances))
+    return nearest[np.argsort(distances[nearest], kind="stable")]
+
+class MarketCoordinates:
+    """Snapshot of latest_prices coordinates as compact float64 arrays.
+
+    Used to rank markets by distance when $geoNear is unavailable. The
+    snapshot is reloaded after ttl seconds or when the latest_prices cache
+    namespace is invalidated in this process.
+    """
+
+    def __init__(self, collection: Collection, ttl: float = 60):
+        self.collection = collection
+        self.ttl = ttl
+        self._snapshot: Optional[Tuple] = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        subscribe("latest_prices", self.invalidate)
+
+    def invalidate(self) -> None:
+        self._loaded_at = 0.0
+
+    def _load(self) -> Tuple:
+        ids, crops, latitudes, longitudes = [], [], [], []
+        cursor = self.collection.find(
+            {"latitude": {"$type": "number"}, "longitude": {"$type": "number"}},
+            {"crop_name": 1, "latitude": 1, "longitude": 1}
+        ).batch_size(10000)
+        for entry in cursor:
+            ids.append(entry["_id"])
+            crops.append(entry.get("crop_name"))
+            latitudes.append(entry["latitude"])
+            longitudes.append(entry["longitude"])
+        lat_rad = np.radians(np.asarray(latitudes, dtype=np.float64))
+        lon_rad = np.radians(np.asarray(longitudes, dtype=np.float64))
+        return ids, np.asarray(crops, dtype=object), lat_rad, lon_rad, np.cos(lat_rad)
+
+    def snapshot(self) -> Tuple:
+        """(ids, crop_names, lat_rad, lon_rad, cos_lat), reloaded when stale"""
+        if self._snapshot is None or time.monotonic() - self._loaded_at > self.ttl:
+            with self._lock:
+                if self._snapshot is None or time.monotonic() - self._loaded_at > self.ttl:
+                    self._snapshot = self._load()
+                    self._loaded_at = time.monotonic()
+        return self._snapshot
+
+    def nearest(self, latitude: float, longitude: float, k: int, max_distance_km: Optional[float] = None,
+                crop_name: Optional[str] = None) -> List[Tuple[Dict, float]]:
+        """(latest_prices _id, distance in km) of the k nearest markets"""
+        ids, crops, lat_rad, lon_rad, cos_lat = self.snapshot()
+        distances = haversine_km(latitude, longitude, lat_rad, lon_rad, cos_lat)
+        if crop_name:
+            distances = np.where(crops == crop_name, distances, np.inf)
+        if max_distance_km is not None:
+            distances = np.where(distances <= max_distance_km, distances, np.inf)
+        return [
+            (ids[index], float(distances[index]))
+            for index in top_k(distances, k)
+            if np.isfinite(distances[index])
+        ]
@@ -0,0 +1,127 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class CircuitOpenError(Exception):
+    """Raised while a circuit breaker is rejecting calls"""
+
+class CircuitBreaker:
+    """Stops calling an upstream after repeated failures.
+
+    After failure_threshold consecutive failures the circuit opens and calls
+    fail fast for reset_timeout seconds; then a single trial call is let
+    through and closes the circuit again if it succeeds. trip() opens it for
+    longer when the upstream asks for it with Retry-After.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._open_for = reset_timeout
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self._open_for:
+                return "half-open"
+            return "open"
+
+    def call(self, fn, *args, **kwargs):
+        with self._lock:
+            if self._opened_at is not None:
+                if time.monotonic() - self._opened_at < self._open_for or self._trial_in_flight:
+                    raise CircuitOpenError(f"Circuit {self.name} is open")
+                self._trial_in_flight = True
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            with self._lock:
+                self._failures += 1
+                was_trial = self._trial_in_flight
+                self._trial_in_flight = False
+                if self._failures >= self.failure_threshold or was_trial:
+                    self._open(max(self.reset_timeout, self._remaining()))
+            raise
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+        return result
+
+    def trip(self, seconds: float) -> None:
+        """Open the circuit for at least seconds, e.g. an upstream's Retry-After"""
+        with self._lock:
+            self._open(max(seconds, self._remaining()))
+
+    def _remaining(self) -> float:
+        # Seconds the circuit stays open; called with the lock held
+        if self._opened_at is None:
+            return 0.0
+        return max(0.0, self._open_for - (time.monotonic() - self._opened_at))
+
+    def _open(self, seconds: float) -> None:
+        self._opened_at = time.monotonic()
+        self._open_for = seconds
+
+def create_session(pool_maxsize: int = 10) -> requests.Session:
+    """Session with a keep-alive connection pool"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_maxsize, pool_maxsize=pool_maxsize)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def retry_after_seconds(response: requests.Response) -> Optional[float]:
+    """Parse a Retry-After header given in seconds or as an HTTP date"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def request_with_retries(session: requests.Session, method: str, url: str, retries: int = 2,
+                         backoff: float = 0.2, max_backoff: float = 5.0, **kwargs) -> requests.Response:
+    """Send a request, retrying connection errors, timeouts, 429 and 5xx.
+
+    Waits use full-jitter exponential backoff, or the server's Retry-After
+    when it sends one. A Retry-After longer than max_backoff is not cut short:
+    the response is returned at once so the caller can back off (see
+    CircuitBreaker.trip). The last response (or exception) is returned (or raised).
+    """
+    for attempt in range(retries + 1):
+        try:
+            response = session.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == retries:
+                raise
+            time.sleep(random.uniform(0, min(max_backoff, backoff * 2 ** attempt)))
+            continue
+
+        if response.status_code not in RETRY_STATUSES or attempt == retries:
+            return response
+        delay = retry_after_seconds(response)
+        if delay is None:
+            delay = random.uniform(0, min(max_backoff, backoff * 2 ** attempt))
+        elif delay > max_backoff:
+            return response
+        time.sleep(delay)
+    return response
@@ -0,0 +1,140 @@
+import io
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from bson import ObjectId
+from PIL import Image
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.collection import Collection
+
+def dhash(image: Image.Image, hash_size: int = 8) -> int:
+    """Difference hash of an opened image (hash_size**2 bits)"""
+    gray = image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+    pixels = np.asarray(gray, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+def dhash_bytes(file_content: bytes, hash_size: int = 8) -> int:
+    """Difference hash of encoded image bytes"""
+    image = Image.open(io.BytesIO(file_content))
+    # JPEG: let the decoder downscale while decoding, the hash only needs a few pixels
+    image.draft("L", (hash_size * 16, hash_size * 16))
+    return dhash(image, hash_size)
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+def hash_to_hex(value: int) -> str:
+    # Stored as hex: a 64-bit hash does not fit in a signed BSON int64
+    return f"{value:016x}"
+
+class BKTree:
+    """Burkhard-Keller tree for hamming-distance nearest neighbour search"""
+
+    def __init__(self):
+        self._root: Optional[list] = None  # [hash, value, {distance: child}]
+        self.size = 0
+
+    def add(self, image_hash: int, value) -> None:
+        self.size += 1
+        if self._root is None:
+            self._root = [image_hash, value, {}]
+            return
+        node = self._root
+        while True:
+            distance = hamming_distance(image_hash, node[0])
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [image_hash, value, {}]
+                return
+            node = child
+
+    def search(self, image_hash: int, max_distance: int) -> List[Tuple[int, object]]:
+        """Return (distance, value) pairs within max_distance, closest first"""
+        if self._root is None:
+            return []
+        matches = []
+        candidates = [self._root]
+        while candidates:
+            node = candidates.pop()
+            distance = hamming_distance(image_hash, node[0])
+            if distance <= max_distance:
+                matches.append((distance, node[1]))
+            # Triangle inequality: only children in [d - max, d + max] can match
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    candidates.append(child)
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+class PerceptualIndex:
+    """Near-duplicate lookup over the perceptual hashes stored on uploads.
+
+    The BK-tree holds the most recent uploads analysed under the current
+    prompt version and is refreshed incrementally, so uploads analysed by
+    other workers become visible within refresh_interval seconds.
+    """
+
+    INDEXES = [
+        IndexModel([("analysis_version", ASCENDING), ("_id", DESCENDING)], name="analysis_version_id",
+                   partialFilterExpression={"image_hash": {"$exists": True}}),
+    ]
+
+    def __init__(self, collection: Collection, analysis_version: str, max_distance: int = 4,
+                 max_entries: int = 100000, refresh_interval: float = 30):
+        self.collection = collection
+        self.analysis_version = analysis_version
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self.refresh_interval = refresh_interval
+        self._tree = BKTree()
+        self._last_id: Optional[ObjectId] = None
+        self._last_refresh = 0.0
+        self._lock = threading.Lock()
+
+    def lookup(self, image_hash: int) -> Optional[Dict]:
+        """Find the closest prior analysis within max_distance"""
+        self._maybe_refresh()
+        matches = self._tree.search(image_hash, self.max_distance)
+        for distance, upload_id in matches:
+            upload = self.collection.find_one({"_id": upload_id}, {"analysis_result": 1})
+            if upload:
+                return {
+                    "upload_id": str(upload_id),
+                    "analysis": upload["analysis_result"],
+                    "distance": distance
+                }
+        return None
+
+    def _maybe_refresh(self) -> None:
+        now = time.monotonic()
+        if self._last_id is not None and now - self._last_refresh < self.refresh_interval:
+            return
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            if self._last_id is None or self._tree.size > self.max_entries * 1.25:
+                self._rebuild()
+            else:
+                self._load(self._tree, {"_id": {"$gt": self._last_id}})
+            self._last_refresh = now
+        except Exception as e:
+            print(f"Error refreshing perceptual index: {e}")
+        finally:
+            self._lock.release()
+
+    def _rebuild(self) -> None:
+        # Build off to the side so concurrent lookups keep using the old tree
+        tree = BKTree()
+        self._last_id = ObjectId(b"\x00" * 12)
+        self._load(tree, {}, limit=self.max_entries)
+        self._tree = tree
+
+    def _load(self, tree: BKTree, query: Dict, limit: int = 0) -> None:
+        query = dict(query, analysis_version=self.analysis_version, image_hash={"$exists": True})
+        cursor = self.collection.find(query, {"image_hash": 1}).sort("_id", DESCENDING).limit(limit)
+        for upload in cursor:
+            tree.add(int(upload["image_hash"], 16), upload["_id"])
+            if upload["_id"] > self._last_id:
+                self._last_id = upload["_id"]
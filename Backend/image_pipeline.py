@@ -0,0 +1,49 @@
+import io
+from typing import Tuple
+from PIL import Image, ImageOps
+
+def downscale_image(file_content: bytes, max_size: Tuple[int, int] = (800, 800), quality: int = 85) -> bytes:
+    """Fit an image into max_size and re-encode it as JPEG.
+
+    JPEGs are decoded in draft mode at the smallest DCT scale that still
+    covers max_size, and large images are shrunk with reduce() before the
+    final resample, so big phone photos never get fully decoded and filtered.
+    """
+    image = Image.open(io.BytesIO(file_content))
+    image.draft("RGB", max_size)
+
+    # Apply the EXIF orientation so portrait photos are not sent sideways
+    image = ImageOps.exif_transpose(image)
+
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+
+    # Cheap integer box reduction down to at most 2x the target, then a quality resample
+    factor = min(image.size[0] // max_size[0], image.size[1] // max_size[1]) // 2
+    if factor > 1:
+        image = image.reduce(factor)
+    if image.size[0] > max_size[0] or image.size[1] > max_size[1]:
+        image.thumbnail(max_size, Image.Resampling.LANCZOS)
+
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=quality)
+    return output.getvalue()
+
+def prepare_for_inference(file_content: bytes, mime_type: str, max_edge: int = 1024,
+                          quality: int = 85) -> Tuple[bytes, str]:
+    """Shrink an uploaded image before it is sent to the model.
+
+    Returns the bytes and MIME type to submit. Images that already fit and
+    need no rotation are passed through untouched.
+    """
+    try:
+        image = Image.open(io.BytesIO(file_content))
+        orientation = image.getexif().get(0x0112, 1)
+        if max(image.size) <= max_edge and orientation == 1 and \
+                mime_type in ("image/jpeg", "image/png", "image/webp"):
+            return file_content, mime_type
+        return downscale_image(file_content, (max_edge, max_edge), quality), "image/jpeg"
+    except Exception as e:
+        # Let the model see the original rather than failing the analysis
+        print(f"Error preparing image for inference: {str(e)}")
+        return file_content, mime_type
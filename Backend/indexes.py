@@ -0,0 +1,182 @@
+import argparse
+from typing import Dict, List, Tuple
+from pymongo import ASCENDING, DESCENDING, GEOSPHERE, IndexModel
+from pymongo.collection import Collection
+from pymongo.errors import OperationFailure
+from analysis_cache import AnalysisCache
+from db import (
+    users_collection, schemes_collection, prices_collection, uploads_collection,
+    expert_articles_collection, daily_news_collection, analysis_jobs_collection,
+    notification_outbox_collection, latest_prices_collection, analysis_cache_collection,
+    token_blacklist_collection
+)
+from image_hash import PerceptualIndex
+from token_cache import TokenBlacklist
+
+# Registry of (collection, indexes) declaring the compound index each query shape needs
+INDEX_REGISTRY: List[Tuple[Collection, List[IndexModel]]] = []
+
+def register_indexes(collection: Collection, indexes: List[IndexModel]) -> None:
+    """Declare indexes for a collection so they are created at boot"""
+    for registered_collection, registered_indexes in INDEX_REGISTRY:
+        if registered_collection.full_name == collection.full_name:
+            registered_indexes.extend(indexes)
+            return
+    INDEX_REGISTRY.append((collection, list(indexes)))
+
+# get_user_by_email_or_mobile ($or on email / mobile)
+register_indexes(users_collection, [
+    IndexModel([("email", ASCENDING)], name="email_1"),
+    IndexModel([("mobile", ASCENDING)], name="mobile_1"),
+    # notify_digest_in_region (region + push_subscription, walked in _id batches)
+    IndexModel(
+        [("region", ASCENDING), ("_id", ASCENDING)],
+        name="region_id_subscribed",
+        partialFilterExpression={"push_subscription": {"$exists": True}}
+    ),
+])
+
+# get_schemes (optional state filter, paged on _id)
+register_indexes(schemes_collection, [
+    IndexModel([("state", ASCENDING), ("_id", ASCENDING)], name="state_id"),
+])
+
+# get_prices (state / region / crop_name, paged on date_effective + _id)
+register_indexes(prices_collection, [
+    IndexModel(
+        [("state", ASCENDING), ("region", ASCENDING), ("crop_name", ASCENDING),
+         ("date_effective", DESCENDING)],
+        name="state_region_crop_date"
+    ),
+    IndexModel([("date_effective", DESCENDING), ("_id", DESCENDING)], name="date_effective_id"),
+    # get_historical_prices (crop_name / market + date range)
+    IndexModel(
+        [("crop_name", ASCENDING), ("market", ASCENDING), ("date_effective", DESCENDING)],
+        name="crop_market_date"
+    ),
+    # One price per market and day; the bulk_upsert_prices key. Market names repeat across
+    # states, so state and region are part of the key. Not built while duplicate rows exist.
+    IndexModel(
+        [("state", ASCENDING), ("region", ASCENDING), ("crop_name", ASCENDING),
+         ("market", ASCENDING), ("date_effective", ASCENDING)],
+        name="state_region_crop_market_date_unique",
+        unique=True
+    ),
+])
+
+# get_latest_prices (state / region / crop_name, newest first), get_nearby_latest_prices ($geoNear)
+register_indexes(latest_prices_collection, [
+    IndexModel([("state", ASCENDING), ("region", ASCENDING), ("crop_name", ASCENDING)], name="state_region_crop"),
+    IndexModel([("date_effective", DESCENDING), ("crop_name", ASCENDING)], name="date_effective_crop"),
+    IndexModel([("location", GEOSPHERE)], name="location_2dsphere"),
+])
+
+# get_user_uploads / analysis count (user_id, paged on uploaded_at + _id)
+register_indexes(uploads_collection, [
+    IndexModel([("user_id", ASCENDING), ("uploaded_at", DESCENDING), ("_id", DESCENDING)],
+               name="user_uploaded_at_id"),
+])
+
+# PerceptualIndex refresh (uploads analysed under the current prompt version)
+register_indexes(uploads_collection, PerceptualIndex.INDEXES)
+
+# AnalysisCache entries expire after ANALYSIS_CACHE_TTL_DAYS
+register_indexes(analysis_cache_collection, AnalysisCache.indexes())
+
+# TokenBlacklist lookups by token hash; entries expire with their token
+register_indexes(token_blacklist_collection, TokenBlacklist.INDEXES)
+
+# get_analysis_job (by owner); finished jobs are dropped after a day
+register_indexes(analysis_jobs_collection, [
+    IndexModel([("user_id", ASCENDING)], name="user_id_1"),
+    # fail_expired_analysis_jobs (unfinished jobs whose lease ran out)
+    IndexModel([("status", ASCENDING), ("lease_until", ASCENDING)], name="status_lease_until"),
+    IndexModel([("created_at", ASCENDING)], name="created_at_ttl", expireAfterSeconds=24 * 3600),
+])
+
+# claim_notification_job (pending or lease expired, oldest first), claim_coalesced_notification_jobs
+# (pending for one region and type); finished jobs kept a week
+register_indexes(notification_outbox_collection, [
+    IndexModel([("status", ASCENDING), ("created_at", ASCENDING)], name="status_created_at"),
+    IndexModel(
+        [("status", ASCENDING), ("region", ASCENDING), ("notification_type", ASCENDING), ("created_at", ASCENDING)],
+        name="status_region_type_created_at"
+    ),
+    IndexModel([("completed_at", ASCENDING)], name="completed_at_ttl", expireAfterSeconds=7 * 24 * 3600),
+])
+
+# get_expert_articles (status + optional category, paged on created_at + _id)
+register_indexes(expert_articles_collection, [
+    IndexModel([("status", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+               name="status_created_at_id"),
+    IndexModel(
+        [("status", ASCENDING), ("category", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+        name="status_category_created_at_id"
+    ),
+])
+
+# get_daily_news (status, paged on created_at + _id)
+register_indexes(daily_news_collection, [
+    IndexModel([("status", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+               name="status_created_at_id"),
+])
+
+def ensure_indexes() -> Dict[str, List[str]]:
+    """Create all registered indexes. Safe to run repeatedly.
+
+    Unique indexes are built one per call, so existing duplicate documents
+    only keep that index from being built and not the rest of the batch.
+    """
+    created = {}
+    for collection, indexes in INDEX_REGISTRY:
+        created[collection.full_name] = []
+        batches = [[index for index in indexes if not index.document.get("unique")]]
+        batches += [[index] for index in indexes if index.document.get("unique")]
+        for batch in batches:
+            if not batch:
+                continue
+            try:
+                created[collection.full_name] += collection.create_indexes(batch)
+            except OperationFailure as e:
+                # An index with the same name but different options already exists,
+                # or a unique index meets duplicate documents
+                print(f"Error creating indexes on {collection.full_name}: {e}")
+    return created
+
+def report_indexes() -> Dict[str, Dict[str, List[str]]]:
+    """Report missing declared indexes and existing indexes that are never used"""
+    report = {}
+    for collection, indexes in INDEX_REGISTRY:
+        declared = {index.document["name"] for index in indexes}
+        existing = set(collection.index_information().keys())
+
+        try:
+            stats = collection.aggregate([{"$indexStats": {}}])
+            unused = sorted(
+                stat["name"] for stat in stats
+                if stat["name"] != "_id_" and stat["accesses"]["ops"] == 0
+            )
+        except OperationFailure as e:
+            print(f"Error reading index stats on {collection.full_name}: {e}")
+            unused = []
+
+        report[collection.full_name] = {
+            "missing": sorted(declared - existing),
+            "undeclared": sorted(existing - declared - {"_id_"}),
+            "unused": unused
+        }
+    return report
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Manage FarmCare MongoDB indexes")
+    parser.add_argument("command", choices=["ensure", "report"])
+    args = parser.parse_args()
+
+    if args.command == "ensure":
+        for name, index_names in ensure_indexes().items():
+            print(f"{name}: {', '.join(index_names) or 'no changes'}")
+    else:
+        for name, entry in report_indexes().items():
+            print(name)
+            for key in ("missing", "undeclared", "unused"):
+                print(f"  {key}: {', '.join(entry[key]) or '-'}")
@@ -0,0 +1,75 @@
+import bisect
+import threading
+from typing import Dict, List, Optional
+
+# Latency buckets in milliseconds
+DEFAULT_BUCKETS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+class Histogram:
+    """Thread-safe bucketed histogram"""
+
+    def __init__(self, buckets: Optional[List[float]] = None):
+        self.buckets = sorted(buckets or DEFAULT_BUCKETS)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._sum += value
+            self._count += 1
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th percentile"""
+        with self._lock:
+            if not self._count:
+                return None
+            rank = q / 100 * self._count
+            seen = 0
+            for index, count in enumerate(self._counts):
+                seen += count
+                if seen >= rank:
+                    return self.buckets[index] if index < len(self.buckets) else float("inf")
+        return None
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            buckets = {f"le_{bound}": count for bound, count in zip(self.buckets, self._counts)}
+            buckets["le_inf"] = self._counts[-1]
+            count, total = self._count, self._sum
+        return {
+            "count": count,
+            "mean": round(total / count, 2) if count else None,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "buckets": buckets
+        }
+
+_histograms: Dict[str, Histogram] = {}
+_counters: Dict[str, float] = {}
+_lock = threading.Lock()
+
+def histogram(name: str, buckets: Optional[List[float]] = None) -> Histogram:
+    """Get or create a named histogram"""
+    with _lock:
+        if name not in _histograms:
+            _histograms[name] = Histogram(buckets)
+        return _histograms[name]
+
+def increment(name: str, value: float = 1) -> None:
+    """Increase a named counter"""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+def snapshot() -> Dict:
+    """All metrics recorded by this worker process"""
+    with _lock:
+        histograms = dict(_histograms)
+        counters = dict(_counters)
+    return {
+        "histograms": {name: h.snapshot() for name, h in sorted(histograms.items())},
+        "counters": dict(sorted(counters.items()))
+    }
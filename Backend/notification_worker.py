@@ -0,0 +1,98 @@
+import os
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore
+from dotenv import load_dotenv
+from db import (
+    claim_notification_job, claim_coalesced_notification_jobs, merge_notification_jobs,
+    checkpoint_notification_job, finish_notification_job, requeue_notification, NotificationLeaseLost
+)
+from push_notifications import PushNotification, delivery_engine
+
+# Load environment variables
+load_dotenv()
+
+CONCURRENCY = int(os.getenv("NOTIFICATION_WORKER_CONCURRENCY", 4))
+POLL_INTERVAL = float(os.getenv("NOTIFICATION_WORKER_POLL_INTERVAL", 1))
+# Most queued notifications merged into one digest
+COALESCE_MAX_BATCH = int(os.getenv("NOTIFICATION_COALESCE_MAX_BATCH", 20))
+
+def defer(job: dict, items: list, user_ids: list, seconds: float) -> bool:
+    """Reschedule sends the push service asked to retry after seconds; False once deferred too often"""
+    deferred_job_id = requeue_notification(job, items, user_ids, seconds)
+    if deferred_job_id is None:
+        print(f"Notification job {job['_id']}: {len(user_ids)} sends deferred too many times")
+        return False
+    print(f"Notification job {job['_id']}: {len(user_ids)} sends deferred {seconds:.0f}s as {deferred_job_id}")
+    return True
+
+def process_job(job: dict) -> None:
+    """Fan out one outbox job, merged with queued jobs for the same region and type.
+
+    A retried job resumes after the last user of its recorded progress with
+    the digest stored on its first attempt. Sends deferred by a Retry-After
+    are queued again as a job for just those users.
+    """
+    jobs = [job]
+    try:
+        progress = job.get("progress") or {}
+        if progress:
+            items = job["items"]
+        else:
+            if not job.get("user_ids"):
+                jobs += claim_coalesced_notification_jobs(job, COALESCE_MAX_BATCH - 1)
+            items = []
+            for queued in jobs:
+                items += queued.get("items") or [queued["notification_data"]]
+            merge_notification_jobs(job, items, [merged["_id"] for merged in jobs[1:]])
+            # The merged jobs are completed now; only the leader is retried
+            jobs = [job]
+
+        stats = PushNotification.notify_digest_in_region(
+            job["region"], items, job["notification_type"],
+            after_user_id=progress.get("last_user_id"),
+            stats=progress.get("stats"),
+            checkpoint=lambda last_user_id, totals: checkpoint_notification_job(job, last_user_id, totals),
+            user_ids=job.get("user_ids"),
+            defer=lambda user_ids, seconds: defer(job, items, user_ids, seconds)
+        )
+        stats["coalesced"] = len(items)
+        finish_notification_job(job, stats)
+        print(f"Notification job {job['_id']} completed: {stats}")
+        print(f"Push delivery totals: {delivery_engine.stats()}")
+    except NotificationLeaseLost as e:
+        # Another worker holds the job now and carries on from the last checkpoint
+        print(str(e))
+    except Exception as e:
+        print(f"Notification job {job['_id']} failed: {str(e)}")
+        traceback.print_exc()
+        for failed in jobs:
+            finish_notification_job(failed, {}, error=str(e))
+
+def run() -> None:
+    """Drain the notification outbox, running up to CONCURRENCY jobs at once"""
+    print(f"Notification worker started (concurrency={CONCURRENCY})")
+    slots = BoundedSemaphore(CONCURRENCY)
+
+    def run_job(job):
+        try:
+            process_job(job)
+        finally:
+            slots.release()
+
+    with ThreadPoolExecutor(max_workers=CONCURRENCY, thread_name_prefix="notify") as executor:
+        while True:
+            slots.acquire()
+            try:
+                job = claim_notification_job()
+            except Exception:
+                job = None
+            if job is None:
+                slots.release()
+                time.sleep(POLL_INTERVAL)
+                continue
+            executor.submit(run_job, job)
+
+if __name__ == '__main__':
+    run()
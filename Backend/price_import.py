@@ -0,0 +1,171 @@
+import csv
+import datetime
+import io
+import json
+import math
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+from pymongo.errors import BulkWriteError
+from db import bulk_upsert_prices, enqueue_notification
+
+# Rows written per bulk_write round trip
+IMPORT_CHUNK_SIZE = 500
+# Row errors listed in the report; the rest are only counted
+MAX_REPORTED_ERRORS = 1000
+
+REQUIRED_FIELDS = ['crop_name', 'price', 'state', 'region', 'date_effective']
+
+def detect_format(filename: str, requested: Optional[str] = None) -> Optional[str]:
+    """'csv' or 'jsonl' from an explicit format or the file extension"""
+    fmt = (requested or '').lower()
+    if not fmt and '.' in filename:
+        fmt = filename.rsplit('.', 1)[-1].lower()
+    if fmt in ('json', 'ndjson'):
+        fmt = 'jsonl'
+    return fmt if fmt in ('csv', 'jsonl') else None
+
+def read_rows(stream: BinaryIO, fmt: str) -> Iterator[Tuple[int, Optional[Dict], Optional[str]]]:
+    """Yield (line number, row, parse error) without loading the whole file"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, {key.strip(): value for key, value in row.items() if key}, None
+        return
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_number, None, f"Invalid JSON: {e.msg}"
+            continue
+        if not isinstance(row, dict):
+            yield line_number, None, "Each line must be a JSON object"
+            continue
+        yield line_number, row, None
+
+def _optional_float(row: Dict, field: str) -> Optional[float]:
+    value = row.get(field)
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError(f"{field} must be a finite number")
+    return number
+
+def validate_row(row: Dict) -> Dict:
+    """Normalise one import row into a price document; raises ValueError on bad input"""
+    missing = [field for field in REQUIRED_FIELDS if not str(row.get(field) or '').strip()]
+    if missing:
+        raise ValueError(f"Missing required fields: {', '.join(missing)}")
+
+    try:
+        price = float(row['price'])
+    except (TypeError, ValueError):
+        raise ValueError("Invalid price format")
+    if not math.isfinite(price):
+        raise ValueError("Invalid price format")
+    if price <= 0:
+        raise ValueError("Price must be greater than 0")
+
+    try:
+        date_effective = datetime.datetime.strptime(str(row['date_effective']).strip(), "%Y-%m-%d")
+    except ValueError:
+        raise ValueError("Invalid date format. Use YYYY-MM-DD")
+
+    region = str(row['region']).strip()
+    price_data = {
+        "crop_name": str(row['crop_name']).strip(),
+        "price": price,
+        "state": str(row['state']).strip(),
+        "region": region,
+        "market": str(row.get('market') or '').strip() or region,
+        "date_effective": date_effective
+    }
+
+    try:
+        latitude = _optional_float(row, 'latitude')
+        longitude = _optional_float(row, 'longitude')
+    except (TypeError, ValueError):
+        raise ValueError("Invalid latitude or longitude")
+    if (latitude is None) != (longitude is None):
+        raise ValueError("latitude and longitude must be given together")
+    if latitude is not None:
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ValueError("latitude or longitude out of range")
+        price_data["latitude"] = latitude
+        price_data["longitude"] = longitude
+
+    if row.get('image_url'):
+        price_data["image_url"] = str(row['image_url']).strip()
+    return price_data
+
+def import_prices(stream: BinaryIO, fmt: str, chunk_size: int = IMPORT_CHUNK_SIZE) -> Dict:
+    """Validate and upsert a price sheet, then queue one notification per region.
+
+    Returns counts plus a per-row error report keyed on the line number.
+    """
+    report = {"rows": 0, "inserted": 0, "updated": 0, "unchanged": 0, "error_count": 0,
+              "errors": [], "notification_job_ids": {}}
+    # Latest price per crop and region by date_effective, for the notification digests
+    regions: Dict[str, Dict[str, Tuple[datetime.datetime, Dict]]] = {}
+
+    def add_error(line_number: int, message: str) -> None:
+        report["error_count"] += 1
+        if len(report["errors"]) < MAX_REPORTED_ERRORS:
+            report["errors"].append({"row": line_number, "error": message})
+
+    def flush(chunk: Dict[Tuple, Tuple[int, Dict]]) -> None:
+        rows = list(chunk.values())
+        try:
+            result = bulk_upsert_prices([price_data for _, price_data in rows])
+        except BulkWriteError as e:
+            details = e.details
+            result = {"inserted": details.get("nUpserted", 0), "updated": details.get("nModified", 0)}
+            failed = set()
+            for write_error in details.get("writeErrors", []):
+                failed.add(write_error["index"])
+                add_error(rows[write_error["index"]][0], write_error.get("errmsg", "Write failed"))
+            rows = [row for index, row in enumerate(rows) if index not in failed]
+        report["inserted"] += result["inserted"]
+        report["updated"] += result["updated"]
+        report["unchanged"] += len(rows) - result["inserted"] - result["updated"]
+        for _, price_data in rows:
+            crops = regions.setdefault(price_data["region"], {})
+            latest = crops.get(price_data["crop_name"])
+            # Sheets are not sorted by date, so an older row later in the file must not win
+            if latest is None or price_data["date_effective"] >= latest[0]:
+                crops[price_data["crop_name"]] = (price_data["date_effective"], {
+                    "crop_name": price_data["crop_name"],
+                    "price": price_data["price"],
+                    "region": price_data["region"]
+                })
+        chunk.clear()
+
+    # Rows are keyed on the upsert key so a repeated row in one chunk keeps the last value
+    chunk: Dict[Tuple, Tuple[int, Dict]] = {}
+    for line_number, row, error in read_rows(stream, fmt):
+        report["rows"] += 1
+        if error:
+            add_error(line_number, error)
+            continue
+        try:
+            price_data = validate_row(row)
+        except ValueError as e:
+            add_error(line_number, str(e))
+            continue
+        key = (price_data["state"], price_data["region"], price_data["crop_name"],
+               price_data["market"], price_data["date_effective"])
+        chunk.pop(key, None)
+        chunk[key] = (line_number, price_data)
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+    if chunk:
+        flush(chunk)
+
+    for region, crops in regions.items():
+        items: List[Dict] = [item for _, item in crops.values()]
+        report["notification_job_ids"][region] = enqueue_notification(
+            region, items[-1], "market_price", items=items
+        )
+    return report
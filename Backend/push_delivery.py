@@ -0,0 +1,151 @@
+import json
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Optional, Tuple
+from urllib.parse import urlsplit
+import requests
+import metrics
+from http_utils import RETRY_STATUSES, create_session, request_with_retries, retry_after_seconds
+
+logger = logging.getLogger(__name__)
+
+class DeliveryEngine:
+    """Concurrent push delivery over per-host keep-alive connection pools.
+
+    Requests have strict connect/read timeouts, 429 and 5xx responses are
+    retried with backoff (honouring Retry-After), and subscriptions the push
+    service reports as gone (404/410) are handed to on_gone for pruning.
+    A send the push service asks to retry later is reported as "retry_after"
+    with the delay, for the caller to reschedule.
+    """
+
+    def __init__(self, concurrency: int = 16, timeout: Tuple[float, float] = (3.05, 10),
+                 retries: int = 2, on_gone: Optional[Callable[[str], None]] = None):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.on_gone = on_gone
+        self._sessions: Dict[str, requests.Session] = {}
+        self._sessions_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="push")
+        self._latency = metrics.histogram("push.delivery_ms")
+        self._failures: Counter = Counter()
+        self._sent = 0
+        self._started = time.monotonic()
+        self._stats_lock = threading.Lock()
+
+    def _session(self, url: str) -> requests.Session:
+        host = urlsplit(url).netloc
+        with self._sessions_lock:
+            if host not in self._sessions:
+                self._sessions[host] = create_session(pool_maxsize=self.concurrency)
+            return self._sessions[host]
+
+    def deliver(self, subscription_info: Dict, payload: Dict,
+                user_id: Optional[str] = None) -> Tuple[bool, Optional[str], Optional[float]]:
+        """Send one notification. Returns (sent, failure_reason, retry_after seconds)."""
+        start = time.perf_counter()
+        reason = None
+        retry_after = None
+        try:
+            endpoint = subscription_info["endpoint"]
+            response = request_with_retries(
+                self._session(endpoint), "POST", endpoint,
+                retries=self.retries,
+                data=json.dumps(payload),
+                headers={
+                    "Content-Type": "application/json",
+                    "Authorization": f"key={subscription_info['keys']['auth']}"
+                },
+                timeout=self.timeout
+            )
+            if response.status_code in (404, 410):
+                reason = "gone"
+                if user_id and self.on_gone:
+                    try:
+                        self.on_gone(user_id)
+                    except Exception:
+                        logger.exception("Error pruning push subscription")
+            elif response.status_code in RETRY_STATUSES and retry_after_seconds(response) is not None:
+                # Retries ran out or the wait exceeds what request_with_retries sleeps through
+                reason = "retry_after"
+                retry_after = retry_after_seconds(response)
+            elif not 200 <= response.status_code < 300:
+                reason = f"http_{response.status_code}"
+        except requests.Timeout:
+            reason = "timeout"
+        except requests.ConnectionError:
+            reason = "connection_error"
+        except (KeyError, TypeError):
+            reason = "invalid_subscription"
+        except Exception:
+            logger.exception("Error sending push notification")
+            reason = "error"
+        finally:
+            self._latency.observe((time.perf_counter() - start) * 1000)
+
+        with self._stats_lock:
+            if reason:
+                self._failures[reason] += 1
+            else:
+                self._sent += 1
+        metrics.increment(f"push.failed.{reason}" if reason else "push.sent")
+        return reason is None, reason, retry_after
+
+    def deliver_many(self, recipients: Iterable[Tuple[Optional[str], Dict]], payload: Dict) -> Dict:
+        """Send the same payload to many (user_id, subscription) pairs.
+
+        Recipients are consumed lazily with at most 2 x concurrency sends in
+        flight, so a large cursor is never materialised. Sends deferred by a
+        Retry-After are listed in stats["deferred"] as (user_id, seconds)
+        instead of being counted as failed.
+        """
+        stats = {"recipients": 0, "sent": 0, "failed": 0, "pruned": 0, "failure_reasons": {}, "deferred": []}
+        lock = threading.Lock()
+        in_flight = threading.BoundedSemaphore(self.concurrency * 2)
+
+        def send(user_id, subscription):
+            try:
+                sent, reason, retry_after = self.deliver(subscription, payload, user_id)
+                with lock:
+                    if sent:
+                        stats["sent"] += 1
+                    elif reason == "retry_after":
+                        stats["deferred"].append((user_id, retry_after))
+                    else:
+                        stats["failed"] += 1
+                        stats["failure_reasons"][reason] = stats["failure_reasons"].get(reason, 0) + 1
+                        if reason == "gone" and user_id:
+                            stats["pruned"] += 1
+            finally:
+                in_flight.release()
+
+        futures = []
+        for user_id, subscription in recipients:
+            in_flight.acquire()
+            stats["recipients"] += 1
+            futures.append(self._executor.submit(send, user_id, subscription))
+            # Keep the futures list from growing with the cursor
+            if len(futures) >= self.concurrency * 8:
+                futures = [future for future in futures if not future.done()]
+        for future in futures:
+            future.result()
+        return stats
+
+    def stats(self) -> Dict:
+        """Throughput, latency and failure reasons since the engine started"""
+        with self._stats_lock:
+            sent, failures = self._sent, dict(self._failures)
+        elapsed = max(time.monotonic() - self._started, 1e-9)
+        latency = self._latency.snapshot()
+        return {
+            "sent": sent,
+            "failed": sum(failures.values()),
+            "sends_per_second": round((sent + sum(failures.values())) / elapsed, 2),
+            "p50_ms": latency["p50"],
+            "p99_ms": latency["p99"],
+            "failure_reasons": failures
+        }
@@ -1,159 +1,255 @@
-from typing import Dict, List
-import json
-import requests
+from typing import Callable, Dict, List, Optional, Tuple
+import os
 from datetime import datetime
-from db import users_collection
 from bson import ObjectId
+from db import users_collection, get_user, remove_push_subscription
+from push_delivery import DeliveryEngine
+
+# Users fetched per round trip when fanning out to a region
+NOTIFY_BATCH_SIZE = 200
+
+# Lines listed in a digest body before it is summarised as "+N more"
+DIGEST_PREVIEW_LINES = 5
+
+DIGEST_TITLES = {
+    "market_price": "Market Price Updates",
+    "expert_article": "New Expert Articles",
+    "daily_news": "Daily Agriculture News",
+    "govt_scheme": "New Government Schemes"
+}
+
+delivery_engine = DeliveryEngine(
+    concurrency=int(os.getenv("PUSH_CONCURRENCY", "16")),
+    timeout=(float(os.getenv("PUSH_CONNECT_TIMEOUT", "3.05")), float(os.getenv("PUSH_READ_TIMEOUT", "10"))),
+    retries=int(os.getenv("PUSH_RETRIES", "2")),
+    on_gone=remove_push_subscription
+)
 
 class PushNotification:
     @staticmethod
-    def send_notification(subscription_info: Dict, title: str, body: str, icon: str = None, tag: str = None) -> bool:
-        try:
-            notification_data = {
-                "notification": {
-                    "title": title,
-                    "body": body,
-                    "icon": icon or "/favicon.ico",
-                    "tag": tag or "farmcare-notification",
-                    "requireInteraction": True,
-                    "timestamp": datetime.utcnow().isoformat()
-                }
+    def build_payload(title: str, body: str, icon: str = None, tag: str = None) -> Dict:
+        return {
+            "notification": {
+                "title": title,
+                "body": body,
+                "icon": icon or "/favicon.ico",
+                "tag": tag or "farmcare-notification",
+                "requireInteraction": True,
+                "timestamp": datetime.utcnow().isoformat()
             }
+        }
 
-            response = requests.post(
-                subscription_info["endpoint"],
-                data=json.dumps(notification_data),
-                headers={
-                    "Content-Type": "application/json",
-                    "Authorization": f"key={subscription_info['keys']['auth']}"
-                }
+    @staticmethod
+    def send_notification(subscription_info: Dict, title: str, body: str, icon: str = None, tag: str = None,
+                          user_id: str = None) -> bool:
+        """Deliver one notification; a gone subscription is pruned when user_id is given"""
+        payload = PushNotification.build_payload(title, body, icon, tag)
+        sent, _, _ = delivery_engine.deliver(subscription_info, payload, user_id)
+        return sent
+
+    @staticmethod
+    def render_market_price_update(price_data: Dict) -> Tuple[str, str, str]:
+        title = "Market Price Update"
+        
+        # If we have change information, include it in the notification
+        if 'change' in price_data and 'old_price' in price_data:
+            change_direction = "📈" if price_data['change'] > 0 else "📉"
+            body = (
+                f"{change_direction} {price_data['crop_name']} price in {price_data['region']}\n"
+                f"Old: ₹{price_data['old_price']}/kg → New: ₹{price_data['price']}/kg\n"
+                f"Change: {abs(price_data['change'])}%"
             )
-            return response.status_code == 201
-        except Exception as e:
-            print(f"Error sending push notification: {str(e)}")
-            return False
+        else:
+            body = f"New price update for {price_data['crop_name']} in {price_data['region']}: ₹{price_data['price']}/kg"
+        return title, body, "market-price"
 
     @staticmethod
-    def send_market_price_update(user_id: str, price_data: Dict) -> bool:
-        try:
-            user = users_collection.find_one({"_id": ObjectId(user_id)})
-            if not user or not user.get("push_subscription"):
-                return False
+    def render_expert_article_notification(article_data: Dict) -> Tuple[str, str, str]:
+        title = "New Expert Article"
+        body = (
+            f"📚 {article_data['title']}\n"
+            f"By: {article_data.get('author', 'FarmCare Expert')}\n"
+            f"Category: {article_data.get('category', 'General')}"
+        )
+        return title, body, "expert-article"
 
-            title = "Market Price Update"
-            
-            # If we have change information, include it in the notification
-            if 'change' in price_data and 'old_price' in price_data:
-                change_direction = "📈" if price_data['change'] > 0 else "📉"
-                body = (
-                    f"{change_direction} {price_data['crop_name']} price in {price_data['region']}\n"
-                    f"Old: ₹{price_data['old_price']}/kg → New: ₹{price_data['price']}/kg\n"
-                    f"Change: {abs(price_data['change'])}%"
-                )
-            else:
-                body = f"New price update for {price_data['crop_name']} in {price_data['region']}: ₹{price_data['price']}/kg"
-            
-            return PushNotification.send_notification(
-                user["push_subscription"],
-                title,
-                body,
-                tag="market-price"
-            )
-        except Exception as e:
-            print(f"Error sending market price notification: {str(e)}")
-            return False
+    @staticmethod
+    def render_news_notification(news_data: Dict) -> Tuple[str, str, str]:
+        title = "Daily Agriculture News"
+        body = f"📰 {news_data['title']}\n{news_data.get('description', '')[:100]}..."
+        return title, body, "daily-news"
 
     @staticmethod
-    def send_expert_article_notification(user_id: str, article_data: Dict) -> bool:
-        try:
-            user = users_collection.find_one({"_id": ObjectId(user_id)})
-            if not user or not user.get("push_subscription"):
-                return False
+    def render_scheme_notification(scheme_data: Dict) -> Tuple[str, str, str]:
+        title = "New Government Scheme"
+        body = (
+            f"🏛️ {scheme_data['name']}\n"
+            f"State: {scheme_data['state']}\n"
+            f"Click to view details and benefits"
+        )
+        return title, body, "govt-scheme"
 
-            title = "New Expert Article"
-            body = (
-                f"📚 {article_data['title']}\n"
-                f"By: {article_data['author']}\n"
-                f"Category: {article_data.get('category', 'General')}"
-            )
-            
-            return PushNotification.send_notification(
-                user["push_subscription"],
-                title,
-                body,
-                tag="expert-article"
-            )
-        except Exception as e:
-            print(f"Error sending expert article notification: {str(e)}")
-            return False
+    @staticmethod
+    def render(notification_type: str, notification_data: Dict) -> Optional[Tuple[str, str, str]]:
+        """Render (title, body, tag) for a notification type, or None if the type is unknown"""
+        renderers = {
+            "market_price": PushNotification.render_market_price_update,
+            "expert_article": PushNotification.render_expert_article_notification,
+            "daily_news": PushNotification.render_news_notification,
+            "govt_scheme": PushNotification.render_scheme_notification
+        }
+        renderer = renderers.get(notification_type)
+        return renderer(notification_data) if renderer else None
 
     @staticmethod
-    def send_news_notification(user_id: str, news_data: Dict) -> bool:
+    def digest_line(notification_type: str, notification_data: Dict) -> Tuple[str, str]:
+        """One (key, line) entry for a digest; a later entry with the same key replaces an earlier one"""
+        if notification_type == "market_price":
+            line = f"{notification_data['crop_name']}: ₹{notification_data['price']}/kg"
+            if 'change' in notification_data:
+                direction = "📈" if notification_data['change'] > 0 else "📉"
+                line = f"{direction} {line} ({notification_data['change']:+}%)"
+            return notification_data['crop_name'], line
+        if notification_type == "govt_scheme":
+            return notification_data['name'], f"🏛️ {notification_data['name']}"
+        icon = "📚" if notification_type == "expert_article" else "📰"
+        return notification_data['title'], f"{icon} {notification_data['title']}"
+
+    @staticmethod
+    def render_digest(notification_type: str, items: List[Dict], region: str = None) -> Optional[Tuple[str, str, str]]:
+        """Render several notifications of one type as a single (title, body, tag)"""
+        if len(items) == 1:
+            return PushNotification.render(notification_type, items[0])
+        rendered = PushNotification.render(notification_type, items[-1])
+        if rendered is None:
+            return None
+        _, _, tag = rendered
+
+        lines = {}
+        for item in items:
+            key, line = PushNotification.digest_line(notification_type, item)
+            lines.pop(key, None)
+            lines[key] = line
+        if len(lines) == 1:
+            return rendered
+
+        lines = list(lines.values())
+        body = "\n".join(lines[-DIGEST_PREVIEW_LINES:])
+        if len(lines) > DIGEST_PREVIEW_LINES:
+            body += f"\n+{len(lines) - DIGEST_PREVIEW_LINES} more"
+        title = DIGEST_TITLES[notification_type] + (f" in {region}" if region else "")
+        return title, body, tag
+
+    @staticmethod
+    def send_to_user(user_id: str, notification_type: str, notification_data: Dict) -> bool:
+        """Send one notification to a single user's push subscription"""
         try:
-            user = users_collection.find_one({"_id": ObjectId(user_id)})
+            user = get_user(user_id)
             if not user or not user.get("push_subscription"):
                 return False
 
-            title = "Daily Agriculture News"
-            body = f"📰 {news_data['title']}\n{news_data.get('description', '')[:100]}..."
-            
+            title, body, tag = PushNotification.render(notification_type, notification_data)
             return PushNotification.send_notification(
                 user["push_subscription"],
                 title,
                 body,
-                tag="daily-news"
+                tag=tag,
+                user_id=user_id
             )
         except Exception as e:
-            print(f"Error sending news notification: {str(e)}")
+            print(f"Error sending {notification_type} notification: {str(e)}")
             return False
 
+    @staticmethod
+    def send_market_price_update(user_id: str, price_data: Dict) -> bool:
+        return PushNotification.send_to_user(user_id, "market_price", price_data)
+
+    @staticmethod
+    def send_expert_article_notification(user_id: str, article_data: Dict) -> bool:
+        return PushNotification.send_to_user(user_id, "expert_article", article_data)
+
+    @staticmethod
+    def send_news_notification(user_id: str, news_data: Dict) -> bool:
+        return PushNotification.send_to_user(user_id, "daily_news", news_data)
+
     @staticmethod
     def send_scheme_notification(user_id: str, scheme_data: Dict) -> bool:
-        try:
-            user = users_collection.find_one({"_id": ObjectId(user_id)})
-            if not user or not user.get("push_subscription"):
-                return False
+        return PushNotification.send_to_user(user_id, "govt_scheme", scheme_data)
 
-            title = "New Government Scheme"
-            body = (
-                f"🏛️ {scheme_data['name']}\n"
-                f"State: {scheme_data['state']}\n"
-                f"Click to view details and benefits"
-            )
-            
-            return PushNotification.send_notification(
-                user["push_subscription"],
-                title,
-                body,
-                tag="govt-scheme"
-            )
-        except Exception as e:
-            print(f"Error sending scheme notification: {str(e)}")
-            return False
+    @staticmethod
+    def notify_users_in_region(region: str, notification_data: Dict, notification_type: str) -> Dict:
+        """Send a notification to every subscribed user in a region and return delivery stats"""
+        return PushNotification.notify_digest_in_region(region, [notification_data], notification_type)
 
     @staticmethod
-    def notify_users_in_region(region: str, notification_data: Dict, notification_type: str) -> None:
-        try:
-            users = users_collection.find({
-                "region": region,
-                "push_subscription": {"$exists": True},
-                "notification_preferences": {
-                    "$elemMatch": {
-                        "type": notification_type,
-                        "enabled": True
-                    }
+    def notify_digest_in_region(region: str, items: List[Dict], notification_type: str,
+                                after_user_id=None, stats: Optional[Dict] = None,
+                                checkpoint: Optional[Callable[[object, Dict], None]] = None,
+                                user_ids: Optional[List] = None,
+                                defer: Optional[Callable[[List, float], bool]] = None) -> Dict:
+        """Send one digest of several notifications to every subscribed user in a region.
+
+        Users are sent to in _id order, NOTIFY_BATCH_SIZE at a time, starting
+        after after_user_id and limited to user_ids when given.
+        checkpoint(last_user_id, stats) is called after each batch so an
+        interrupted fan-out can resume where it stopped; stats carries the
+        totals of earlier attempts. Sends the push service asked to retry
+        later are passed to defer(user_ids, seconds) before the checkpoint,
+        and counted as failed when it returns False.
+        """
+        stats = stats or {"recipients": 0, "sent": 0, "failed": 0, "pruned": 0, "failure_reasons": {}}
+        stats.setdefault("deferred", 0)
+        rendered = PushNotification.render_digest(notification_type, items, region)
+        if rendered is None:
+            return stats
+        payload = PushNotification.build_payload(*rendered)
+        query = {
+            "region": region,
+            "push_subscription": {"$exists": True},
+            "notification_preferences": {
+                "$elemMatch": {
+                    "type": notification_type,
+                    "enabled": True
                 }
-            })
-
-            for user in users:
-                if notification_type == "market_price":
-                    PushNotification.send_market_price_update(str(user["_id"]), notification_data)
-                elif notification_type == "expert_article":
-                    PushNotification.send_expert_article_notification(str(user["_id"]), notification_data)
-                elif notification_type == "daily_news":
-                    PushNotification.send_news_notification(str(user["_id"]), notification_data)
-                elif notification_type == "govt_scheme":
-                    PushNotification.send_scheme_notification(str(user["_id"]), notification_data)
+            }
+        }
 
+        try:
+            while True:
+                id_filter = {}
+                if user_ids is not None:
+                    id_filter["$in"] = user_ids
+                if after_user_id is not None:
+                    id_filter["$gt"] = after_user_id
+                if id_filter:
+                    query["_id"] = id_filter
+                # Only the subscription is needed
+                users = list(users_collection.find(query, {"push_subscription": 1})
+                             .sort("_id", 1).limit(NOTIFY_BATCH_SIZE))
+                if not users:
+                    break
+                batch = delivery_engine.deliver_many(
+                    ((str(user["_id"]), user["push_subscription"]) for user in users),
+                    payload
+                )
+                for key in ("recipients", "sent", "failed", "pruned"):
+                    stats[key] += batch[key]
+                for reason, count in batch["failure_reasons"].items():
+                    stats["failure_reasons"][reason] = stats["failure_reasons"].get(reason, 0) + count
+                deferred = batch["deferred"]
+                if deferred and defer and defer([ObjectId(user_id) for user_id, _ in deferred],
+                                                max(seconds for _, seconds in deferred)):
+                    stats["deferred"] += len(deferred)
+                elif deferred:
+                    stats["failed"] += len(deferred)
+                    stats["failure_reasons"]["retry_after"] = \
+                        stats["failure_reasons"].get("retry_after", 0) + len(deferred)
+                after_user_id = users[-1]["_id"]
+                if checkpoint:
+                    checkpoint(after_user_id, stats)
+                if len(users) < NOTIFY_BATCH_SIZE:
+                    break
         except Exception as e:
-            print(f"Error notifying users in region: {str(e)}") 
\ No newline at end of file
+            print(f"Error notifying users in region: {str(e)}")
+            raise
+        return stats
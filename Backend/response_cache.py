@@ -0,0 +1,63 @@
+import datetime
+import hashlib
+from functools import wraps
+from typing import Dict
+from flask import current_app, g, make_response, request
+from cache_utils import TTLCache, subscribe
+
+class ResponseCache:
+    """Caches rendered GET responses and answers revalidations with 304.
+
+    Entries are keyed on path and query arguments within a namespace and are
+    dropped when cache_utils.invalidate(namespace) is called by a write in
+    this process. The TTL bounds staleness for writes made by other workers.
+    Requests that read from the primary (g.read_primary, set for admins)
+    bypass the cache so they see their own writes.
+    """
+
+    def __init__(self, ttl: float = 60, maxsize: int = 256):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._caches: Dict[str, TTLCache] = {}
+
+    def _cache(self, namespace: str) -> TTLCache:
+        if namespace not in self._caches:
+            self._caches[namespace] = TTLCache(maxsize=self.maxsize, ttl=self.ttl)
+            subscribe(namespace, self._caches[namespace].clear)
+        return self._caches[namespace]
+
+    def cached(self, namespace: str, cache_control: str = "public, no-cache"):
+        """Decorate a GET view. Only 200 responses are cached."""
+        cache = self._cache(namespace)
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if g.get("read_primary", False):
+                    return view(*args, **kwargs)
+                key = (request.path, tuple(sorted(request.args.items(multi=True))))
+                entry = cache.get(key)
+                if entry is None:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    body = response.get_data()
+                    entry = (
+                        body,
+                        response.mimetype,
+                        hashlib.sha256(body).hexdigest()[:32],
+                        datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+                    )
+                    cache.set(key, entry)
+
+                body, mimetype, etag, last_modified = entry
+                response = current_app.response_class(body, mimetype=mimetype)
+                response.set_etag(etag)
+                response.last_modified = last_modified
+                response.headers["Cache-Control"] = cache_control
+                return response.make_conditional(request)
+            return wrapper
+        return decorator
+
+    def stats(self) -> Dict:
+        return {namespace: cache.stats() for namespace, cache in self._caches.items()}
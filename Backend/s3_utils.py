@@ -1,12 +1,13 @@
 import boto3
 import os
 from botocore.exceptions import ClientError
-from PIL import Image
-import io
 from datetime import datetime
-from typing import Tuple, Optional
+from typing import Dict, Tuple, Optional
+from cache_utils import TTLCache
 from file_utils import get_mime_type
+from image_pipeline import downscale_image
 from dotenv import load_dotenv
+from services import registry
 
 # Load environment variables
 load_dotenv()
@@ -18,17 +19,38 @@ AWS_REGION = os.getenv('AWS_REGION')
 AWS_BUCKET_NAME = os.getenv('AWS_BUCKET_NAME')
 AWS_BUCKET_URL = os.getenv('AWS_BUCKET_URL')
 
-# Verify credentials are available
-if not all([AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, AWS_REGION, AWS_BUCKET_NAME, AWS_BUCKET_URL]):
-    raise ValueError("Missing AWS credentials in environment variables")
+def _create_s3_client():
+    """Build the S3 client; registered with the service registry and built on first use"""
+    # Verify credentials are available
+    if not all([AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, AWS_REGION, AWS_BUCKET_NAME, AWS_BUCKET_URL]):
+        raise ValueError("Missing AWS credentials in environment variables")
+    return boto3.client(
+        's3',
+        aws_access_key_id=AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+        region_name=AWS_REGION
+    )
 
-# Initialize S3 client
-s3_client = boto3.client(
-    's3',
-    aws_access_key_id=AWS_ACCESS_KEY_ID,
-    aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-    region_name=AWS_REGION
-)
+registry.register("s3", _create_s3_client)
+
+def get_s3_client():
+    return registry.get("s3")
+
+# Result of the last credential check, reused so /health does not call S3 on every probe
+_credential_check = TTLCache(maxsize=1, ttl=300)
+
+def check_credentials() -> Dict:
+    """Verify the S3 credentials and bucket, caching the result for a few minutes"""
+    result = _credential_check.get("s3")
+    if result is None:
+        try:
+            get_s3_client().head_bucket(Bucket=AWS_BUCKET_NAME)
+            result = {"status": "ok"}
+        except Exception as e:
+            print(f"Warning: AWS credentials verification failed: {str(e)}")
+            result = {"status": "error", "message": str(e)}
+        _credential_check.set("s3", result)
+    return result
 
 def validate_image(file_content: bytes, filename: str) -> Tuple[bool, Optional[str]]:
     """Validate if the file is an image and its type"""
@@ -37,20 +59,7 @@ def validate_image(file_content: bytes, filename: str) -> Tuple[bool, Optional[s
 def process_image(file_content: bytes, max_size: Tuple[int, int] = (800, 800)) -> bytes:
     """Process and resize image if needed"""
     try:
-        image = Image.open(io.BytesIO(file_content))
-        
-        # Convert to RGB if necessary
-        if image.mode in ('RGBA', 'P'):
-            image = image.convert('RGB')
-        
-        # Resize if larger than max_size
-        if image.size[0] > max_size[0] or image.size[1] > max_size[1]:
-            image.thumbnail(max_size, Image.Resampling.LANCZOS)
-        
-        # Save processed image
-        output = io.BytesIO()
-        image.save(output, format='JPEG', quality=85)
-        return output.getvalue()
+        return downscale_image(file_content, max_size, quality=85)
     except Exception as e:
         print(f"Error processing image: {str(e)}")
         raise ValueError(f"Error processing image: {str(e)}")
@@ -78,7 +87,7 @@ def upload_to_s3(file_content: bytes, original_filename: str) -> Tuple[str, str]
         # Upload to S3
         try:
             print("Attempting S3 upload...")
-            s3_client.put_object(
+            get_s3_client().put_object(
                 Bucket=AWS_BUCKET_NAME,
                 Key=unique_filename,
                 Body=processed_content,
@@ -107,18 +116,10 @@ def upload_to_s3(file_content: bytes, original_filename: str) -> Tuple[str, str]
 def delete_from_s3(key: str) -> bool:
     """Delete file from S3"""
     try:
-        s3_client.delete_object(
+        get_s3_client().delete_object(
             Bucket=AWS_BUCKET_NAME,
             Key=key
         )
         return True
     except ClientError as e:
         raise Exception(f"Error deleting from S3: {str(e)}")
-
-# Test AWS credentials on module load
-try:
-    print("Testing AWS credentials...")
-    s3_client.list_buckets()
-    print("AWS credentials verified successfully")
-except Exception as e:
-    print(f"Warning: AWS credentials verification failed: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,51 @@
+import datetime
+import json
+from typing import Any
+from bson import ObjectId
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Formats the API has always used for timestamps and dates
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+DATE_FORMAT = "%Y-%m-%d"
+
+if orjson is not None:
+    # Datetimes go through default() so they keep the API format instead of RFC 3339
+    ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS
+
+def default(value: Any) -> Any:
+    """Encode ObjectId and datetime values found in Mongo documents"""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime.datetime):
+        return value.strftime(DATETIME_FORMAT)
+    if isinstance(value, datetime.date):
+        return value.strftime(DATE_FORMAT)
+    return DefaultJSONProvider.default(value)
+
+def dumps(obj: Any) -> bytes:
+    """Compact JSON for obj, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=default, option=ORJSON_OPTIONS)
+    return json.dumps(obj, default=default, sort_keys=True, separators=(",", ":")).encode()
+
+class MongoJSONProvider(DefaultJSONProvider):
+    """jsonify() that accepts raw Mongo documents.
+
+    ObjectId and datetime values are converted inside the encoder, so read
+    helpers can return documents without a Python pass over every row.
+    Responses are encoded with orjson when it is installed, except in debug
+    mode where the indented stdlib output is kept.
+    """
+
+    default = staticmethod(default)
+
+    def response(self, *args, **kwargs):
+        if orjson is None or (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj) + b"\n", mimetype=self.mimetype)
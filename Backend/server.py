@@ -1,27 +1,46 @@
+import time
+_import_started = time.perf_counter()
+
 import google.generativeai as genai
-from flask import Flask, request, jsonify
+from flask import Flask, g, request, jsonify
 from flask_cors import CORS
 from dotenv import load_dotenv
 import os
-from pathlib import Path
+import threading
 import jwt
 import datetime
 from functools import wraps
 from bson import ObjectId
 from db import (
-    create_user, get_user_by_email_or_mobile,
+    create_user, get_user_by_email_or_mobile, get_user, update_user, invalidate_user, user_cache_stats,
     create_scheme, update_scheme, delete_scheme, get_schemes,
-    create_price, update_price, delete_price, get_prices,
-    get_historical_prices, create_expert_article, get_expert_articles,
+    create_price, update_price, delete_price, get_price, get_latest_prices,
+    backfill_latest_prices, get_nearby_latest_prices,
+    create_expert_article, get_expert_articles,
     get_expert_article, update_expert_article, delete_expert_article,
     create_daily_news, get_daily_news, get_daily_news_item,
-    update_daily_news, delete_daily_news, users_collection, uploads_collection
+    update_daily_news, delete_daily_news, users_collection, uploads_collection,
+    get_analysis_job, save_upload_history, analysis_cache_collection,
+    enqueue_notification, get_notification_job, get_user_uploads, token_blacklist_collection,
+    migrate_token_blacklist
 )
+from analysis_cache import AnalysisCache
+from analysis_jobs import AnalysisJobQueue, QueueFullError
+from image_hash import PerceptualIndex, dhash_bytes, hash_to_hex
+from image_pipeline import prepare_for_inference
+from indexes import ensure_indexes
+from file_utils import get_mime_type, read_upload
 from s3_utils import upload_to_s3
+from price_import import detect_format, import_prices
+from response_cache import ResponseCache
+from serialization import MongoJSONProvider
 import requests  # Add this at the top with other imports
-import math
-from push_notifications import PushNotification
-from pymongo import MongoClient
+from push_notifications import PushNotification, delivery_engine
+from weather import WeatherService, WeatherProviderError, create_weather_backend
+import metrics
+from token_cache import TokenBlacklist, VerifiedTokenCache
+import services
+import s3_utils
 import logging
 import re
 from werkzeug.security import generate_password_hash
@@ -30,12 +49,16 @@ from auth import hash_password, verify_password, validate_password, validate_ema
 
 # Load environment variables
 load_dotenv()
+services.record_boot_phase("imports", _import_started)
+_module_init_started = time.perf_counter()
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+# Encodes ObjectId and datetime values returned by the db read helpers
+app.json = MongoJSONProvider(app)
 
 # Configure CORS with proper settings
 CORS(app, resources={
@@ -62,18 +85,38 @@ def after_request(response):
         response.headers.add('Access-Control-Max-Age', '3600')
     return response
 
-# MongoDB connection
-try:
-    mongo_uri = os.getenv('MONGO_URI')
-    if not mongo_uri:
-        raise ValueError("MONGO_URI environment variable not set")
-    client = MongoClient(mongo_uri)
-    db = client.get_database('farmcare')
-    blacklist_collection = db.get_collection('token_blacklist')  # Initialize blacklist collection
-    logger.info("Connected to MongoDB successfully!")
-except Exception as e:
-    logger.error(f"Error connecting to MongoDB: {e}")
-    raise
+# The Mongo client connects on first use
+token_blacklist = TokenBlacklist(token_blacklist_collection)
+
+def run_boot_maintenance():
+    """Ensure indexes, run one-off migrations and backfill latest_prices off the import path"""
+    # Create the indexes declared in indexes.py (idempotent; disable with ENSURE_INDEXES_ON_BOOT=false)
+    if os.getenv('ENSURE_INDEXES_ON_BOOT', 'true').lower() != 'false':
+        try:
+            with services.timed("ensure_indexes"):
+                ensure_indexes()
+            logger.info("MongoDB indexes ensured")
+        except Exception as e:
+            logger.warning(f"Could not ensure MongoDB indexes: {e}")
+
+    # Hash raw tokens left by older versions; recorded as done so it runs once per deployment
+    try:
+        with services.timed("token_blacklist_migration"):
+            ran, migrated = migrate_token_blacklist()
+            if ran:
+                logger.info(f"token_blacklist migration rewrote {migrated} entries")
+    except Exception as e:
+        logger.warning(f"Could not migrate token_blacklist: {e}")
+
+    # Backfill the latest_prices view when it is empty or missing fields added since;
+    # one worker rebuilds while the others skip
+    try:
+        with services.timed("latest_prices_backfill"):
+            entries = backfill_latest_prices()
+            if entries is not None:
+                logger.info(f"latest_prices backfilled with {entries} entries")
+    except Exception as e:
+        logger.warning(f"Could not backfill latest_prices: {e}")
 
 # Root route
 @app.route('/', methods=['GET'])
@@ -90,7 +133,7 @@ def root():
             },
             "analysis": {
                 "upload": "/upload/image",
-                "history": "/analysis/history",
+                "history": "/user/analysis/history",
                 "count": "/user/analysis/count"
             }
         }
@@ -101,12 +144,15 @@ def root():
 def health_check():
     try:
         # Check MongoDB connection
-        client.admin.command('ping')
+        services.mongo_client().admin.command('ping')
         return jsonify({
             "status": "healthy",
             "message": "Server is running and database is connected",
             "database": "connected",
-            "api": "running"
+            "api": "running",
+            "storage": s3_utils.check_credentials(),
+            "ai": {"configured": bool(os.getenv("GOOGLE_API_KEY"))},
+            "boot": services.boot_report()
         }), 200
     except Exception as e:
         logger.error(f"Health check failed: {e}")
@@ -145,9 +191,9 @@ def handle_error(error):
 
 # Set JWT Secret Key
 app.config['SECRET_KEY'] = os.getenv("SECRET_KEY")
+verified_tokens = VerifiedTokenCache(app.config['SECRET_KEY'], maxsize=int(os.getenv("VERIFIED_TOKEN_CACHE_SIZE", 10000)))
 
-# Configure Google Gemini API
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+GEMINI_MODEL_NAME = "gemini-1.5-flash"
 
 generation_config = {
     "temperature": 0.4,
@@ -161,23 +207,44 @@ safety_settings = [
     for category in ["HARASSMENT", "HATE_SPEECH", "SEXUALLY_EXPLICIT", "DANGEROUS_CONTENT"]
 ]
 
-model = genai.GenerativeModel(
-    model_name="gemini-1.5-flash",
-    generation_config=generation_config,
-    safety_settings=safety_settings,
-)
+def create_gemini_model():
+    """Configure Google Gemini API and build the model on first use"""
+    genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+    return genai.GenerativeModel(
+        model_name=GEMINI_MODEL_NAME,
+        generation_config=generation_config,
+        safety_settings=safety_settings,
+    )
 
-def read_image_data(file_path):
-    image_path = Path(file_path)
-    if not image_path.exists():
-        raise FileNotFoundError(f"Could not find image: {image_path}")
-    return {"mime_type": "image/jpeg", "data": image_path.read_bytes()}
+services.registry.register("gemini", create_gemini_model)
 
-def generate_gemini_response(prompt, image_path):
-    image_data = read_image_data(image_path)
-    response = model.generate_content([prompt, image_data])
+def generate_gemini_response(prompt, image_data, mime_type):
+    model = services.registry.get("gemini")
+    response = model.generate_content([prompt, {"mime_type": mime_type, "data": image_data}])
     return response.text
 
+# Images are shrunk before submission; disease detection does not need full phone resolution
+image_preprocessing = {
+    "max_edge": int(os.getenv('ANALYSIS_MAX_EDGE', 1024)),
+    "quality": int(os.getenv('ANALYSIS_JPEG_QUALITY', 85))
+}
+
+def analyze_upload(image_data, mime_type, cache_key):
+    """Run the disease analysis for a queued, already prepared upload and cache the result"""
+    analysis = generate_gemini_response(input_prompt, image_data, mime_type)
+    analysis_cache.set(cache_key, analysis)
+    return analysis
+
+# Largest image accepted for disease analysis
+MAX_ANALYSIS_UPLOAD_BYTES = int(os.getenv('MAX_ANALYSIS_UPLOAD_BYTES', 10 * 1024 * 1024))
+
+analysis_jobs = AnalysisJobQueue(
+    analyze_upload,
+    max_workers=int(os.getenv('ANALYSIS_WORKERS', 4)),
+    max_pending=int(os.getenv('ANALYSIS_MAX_PENDING', 32)),
+    lease_seconds=int(os.getenv('ANALYSIS_JOB_LEASE_SECONDS', 60))
+)
+
 # Initial input prompt for plant disease detection
 input_prompt = '''
 As a highly skilled plant pathologist, provide simple and easy-to-understand advice for farmers. Use basic language and clear explanations. Avoid technical terms where possible, and when you must use them, explain their meaning in simple words.
@@ -226,6 +293,22 @@ As a highly skilled plant pathologist, provide simple and easy-to-understand adv
 Please look at the plant image and give advice that any farmer can easily understand and use.
 '''
 
+analysis_cache = AnalysisCache(
+    analysis_cache_collection,
+    prompt=input_prompt,
+    generation_config=generation_config,
+    # GenerativeModel.model_name carries the models/ prefix
+    model_name=f"models/{GEMINI_MODEL_NAME}",
+    preprocessing=image_preprocessing
+)
+
+# Near-duplicate uploads (re-compressed or slightly cropped) reuse earlier analyses
+perceptual_index = PerceptualIndex(
+    uploads_collection,
+    analysis_version=analysis_cache.version,
+    max_distance=int(os.getenv('PERCEPTUAL_MATCH_DISTANCE', 4))
+)
+
 def token_required(f):
     """Decorator to check if a request has a valid JWT token"""
     @wraps(f)
@@ -237,9 +320,9 @@ def token_required(f):
         token = token_header.split(" ")[1]  # Extract actual token
         
         try:
-            decoded_data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
+            decoded_data = verified_tokens.verify(token)
             request.user = decoded_data  # Attach user data to request
-            print(f"Decoded Token: {decoded_data}")  # Debugging
+            logger.debug("Authenticated user_id=%s is_admin=%s", decoded_data.get("user_id"), decoded_data.get("is_admin"))
         except jwt.ExpiredSignatureError:
             return jsonify({"error": "Token expired"}), 401
         except jwt.InvalidTokenError:
@@ -267,6 +350,18 @@ def user_or_admin_required(f):
         return f(*args, **kwargs)
     return decorated
 
+# Weather responses are cached per ~5km grid cell (see weather.py)
+weather_service = WeatherService(
+    create_weather_backend(),
+    precision=int(os.getenv('WEATHER_GEOHASH_PRECISION', 5))
+)
+
+# Default radius of the nearest-market search
+MARKET_SEARCH_RADIUS_KM = float(os.getenv('MARKET_SEARCH_RADIUS_KM', 200))
+
+# Rendered public GET responses revalidated with ETags; admin writes invalidate them
+response_cache = ResponseCache(ttl=float(os.getenv('RESPONSE_CACHE_TTL', 60)))
+
 # Dictionary of Indian states and their regions/cities
 INDIAN_STATES_AND_REGIONS = {
     'Andhra Pradesh': ['Visakhapatnam', 'Vijayawada', 'Guntur', 'Nellore', 'Kurnool', 'Rajahmundry', 'Tirupati'],
@@ -421,12 +516,10 @@ def user_logout():
 def blacklist_token(token):
     """Add token to blacklist collection"""
     try:
-        blacklist_collection.insert_one({
-            "token": token,
-            "created_at": datetime.datetime.utcnow()
-        })
-    except Exception as e:
-        print(f"Error blacklisting token: {e}")
+        token_blacklist.revoke(token)
+        verified_tokens.forget(token)
+    except Exception:
+        logger.exception("Error blacklisting token")
         raise
 
 @app.before_request
@@ -437,23 +530,36 @@ def verify_token_not_blacklisted():
         if auth_header:
             try:
                 token = auth_header.split(' ')[1]
+                # Forged or expired tokens are rejected by token_required; only
+                # verified tokens are checked and remembered by the blacklist
+                verified_tokens.verify(token)
                 # Check if token is blacklisted
-                if blacklist_collection.find_one({"token": token}):
+                if token_blacklist.is_revoked(token, verified=True):
                     return jsonify({"error": "Token has been revoked"}), 401
             except:
                 pass
 
+@app.before_request
+def route_admin_reads_to_primary():
+    """Serve admin views from the primary, past the response cache, so they show their own writes"""
+    auth_header = request.headers.get('Authorization')
+    if auth_header and auth_header.startswith('Bearer '):
+        try:
+            g.read_primary = bool(verified_tokens.verify(auth_header.split(' ')[1]).get("is_admin"))
+        except jwt.InvalidTokenError:
+            pass
+
 @app.route('/user/profile', methods=['GET'])
 @token_required
 def get_profile():
     """Get user profile information"""
     try:
         user_id = request.user["user_id"]
-        print(f"Getting profile for user_id: {user_id}")
+        logger.debug("Getting profile for user_id: %s", user_id)
         
         # Get user data
-        user = users_collection.find_one({"_id": ObjectId(user_id)})
-        print(f"User found: {user is not None}")
+        user = get_user(user_id)
+        logger.debug("User found: %s", user is not None)
         
         if not user:
             return jsonify({"error": "User not found"}), 404
@@ -473,8 +579,8 @@ def get_profile():
             }
         }), 200
 
-    except Exception as e:
-        print(f"Error getting profile: {str(e)}")
+    except Exception:
+        logger.exception("Error getting profile")
         return jsonify({"error": "Failed to get profile"}), 500
 
 @app.route('/user/profile', methods=['PUT'])
@@ -485,12 +591,12 @@ def update_profile():
         data = request.get_json()
         user_id = request.user["user_id"]
         
-        print(f"Updating profile for user_id: {user_id}")
-        print(f"Update data received: {data}")
+        logger.debug("Updating profile for user_id: %s", user_id)
+        logger.debug("Update data received: %s", data)
         
-        # Get current user data
-        current_user = users_collection.find_one({"_id": ObjectId(user_id)})
-        print(f"Current user found: {current_user is not None}")
+        # Get current user data (uncached, since the password is checked against it)
+        current_user = get_user(user_id, fresh=True)
+        logger.debug("Current user found: %s", current_user is not None)
         
         if not current_user:
             return jsonify({"error": "User not found"}), 404
@@ -541,31 +647,23 @@ def update_profile():
 
         # Explicitly ignore mobile number updates
         if "mobile" in data:
-            print("Mobile number update attempted but ignored as it's not allowed")
+            logger.debug("Mobile number update attempted but ignored as it's not allowed")
 
         if not update_data:
             return jsonify({"error": "No updates provided"}), 400
 
-        print(f"Update data to be applied: {update_data}")
+        logger.debug("Update data to be applied: %s", update_data)
 
         # Add updated timestamp
         update_data["updated_at"] = datetime.datetime.utcnow()
 
-        # Update user data
-        result = users_collection.update_one(
-            {"_id": ObjectId(user_id)},
-            {"$set": update_data}
-        )
+        # Update user data and get the updated document back in one round trip
+        updated_user = update_user(user_id, update_data)
+        logger.debug("Updated user retrieved: %s", updated_user is not None)
 
-        print(f"Update result - matched_count: {result.matched_count}, modified_count: {result.modified_count}")
-
-        if result.modified_count == 0:
-            return jsonify({"error": "No changes made to profile"}), 400
+        if not updated_user:
+            return jsonify({"error": "User not found"}), 404
 
-        # Get updated user data
-        updated_user = users_collection.find_one({"_id": ObjectId(user_id)})
-        print(f"Updated user retrieved: {updated_user is not None}")
-        
         return jsonify({
             "message": "Profile updated successfully",
             "user": {
@@ -582,11 +680,8 @@ def update_profile():
             }
         }), 200
 
-    except Exception as e:
-        print(f"Error updating profile - Full error: {str(e)}")
-        print(f"Error type: {type(e)}")
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")
+    except Exception:
+        logger.exception("Error updating profile")
         return jsonify({"error": "Failed to update profile"}), 500
 
 @app.route('/user/profile/image', methods=['POST'])
@@ -594,75 +689,63 @@ def update_profile():
 def update_profile_image():
     """Update user's profile image"""
     try:
-        print(f"Processing profile image update for user_id: {request.user['user_id']}")
-        print(f"Request method: {request.method}")
-        print(f"Request headers: {dict(request.headers)}")
-        print(f"Request files: {request.files}")
+        logger.debug("Processing profile image update for user_id: %s", request.user['user_id'])
+        logger.debug("Request files: %s", request.files)
         
         if 'image' not in request.files:
-            print("No image file in request")
+            logger.debug("No image file in request")
             return jsonify({"error": "No image file provided"}), 400
 
         file = request.files['image']
         if not file.filename:
-            print("No selected filename")
+            logger.debug("No selected filename")
             return jsonify({"error": "No selected file"}), 400
 
-        print(f"Received file: {file.filename}")
+        logger.debug("Received file: %s", file.filename)
         
         # Validate file type
         allowed_extensions = {'jpg', 'jpeg', 'png', 'gif', 'webp'}
         if '.' not in file.filename or \
            file.filename.rsplit('.', 1)[1].lower() not in allowed_extensions:
-            print(f"Invalid file type: {file.filename}")
+            logger.debug("Invalid file type: %s", file.filename)
             return jsonify({"error": "Invalid file type. Allowed types: JPG, PNG, GIF, WEBP"}), 400
 
         # Read file content
         file_content = file.read()
         file_size = len(file_content)
-        print(f"File size: {file_size} bytes")
+        logger.debug("File size: %s bytes", file_size)
         
         # Check file size (limit to 5MB)
         if file_size > 5 * 1024 * 1024:  # 5MB in bytes
-            print(f"File too large: {file_size} bytes")
+            logger.debug("File too large: %s bytes", file_size)
             return jsonify({"error": "File size too large. Maximum size: 5MB"}), 400
         
         # Upload to S3
         try:
-            print("Attempting S3 upload...")
+            logger.debug("Attempting S3 upload...")
             image_url, image_key = upload_to_s3(file_content, file.filename)
-            print(f"S3 upload successful. URL: {image_url}")
+            logger.debug("S3 upload successful. URL: %s", image_url)
         except Exception as e:
-            print(f"S3 upload failed: {str(e)}")
+            logger.exception("S3 upload failed")
             return jsonify({"error": f"Failed to upload image: {str(e)}"}), 500
 
         # Update user's profile image in database
         try:
-            print("Updating user profile in database...")
-            result = users_collection.update_one(
-                {"_id": ObjectId(request.user["user_id"])},
-                {
-                    "$set": {
-                        "profile_image": {
-                            "url": image_url,
-                            "key": image_key
-                        },
-                        "updated_at": datetime.datetime.utcnow()
-                    }
-                }
-            )
-            print(f"Database update result - matched_count: {result.matched_count}, modified_count: {result.modified_count}")
-            
-            if result.matched_count == 0:
-                print("User not found in database")
+            logger.debug("Updating user profile in database...")
+            updated_user = update_user(request.user["user_id"], {
+                "profile_image": {
+                    "url": image_url,
+                    "key": image_key
+                },
+                "updated_at": datetime.datetime.utcnow()
+            })
+
+            if not updated_user:
+                logger.debug("User not found in database")
                 return jsonify({"error": "User not found"}), 404
-                
-            if result.modified_count == 0:
-                print("No changes made to database")
-                return jsonify({"error": "Failed to update profile image in database"}), 500
-                
-        except Exception as e:
-            print(f"Database update failed: {str(e)}")
+
+        except Exception:
+            logger.exception("Database update failed")
             return jsonify({"error": "Failed to update profile image in database"}), 500
 
         return jsonify({
@@ -673,11 +756,8 @@ def update_profile_image():
             }
         }), 200
 
-    except Exception as e:
-        print(f"Error updating profile image - Full error: {str(e)}")
-        print(f"Error type: {type(e)}")
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")
+    except Exception:
+        logger.exception("Error updating profile image")
         return jsonify({"error": "Failed to update profile image"}), 500
 
 @app.route('/admin/register', methods=['POST'])
@@ -744,46 +824,29 @@ def admin_login():
         }
     }), 200
 
+def page_args():
+    """limit and cursor query parameters of a paged list request"""
+    return request.args.get('limit', type=int), request.args.get('cursor')
+
 # Public Routes (No Authentication Required)
 @app.route('/schemes', methods=['GET'])
+@response_cache.cached('schemes')
 def get_schemes_route():
     """Get all schemes, optionally filtered by state (Public Access)"""
     state = request.args.get('state')
     try:
-        schemes = get_schemes(state)
-        return jsonify({"schemes": schemes}), 200
+        schemes, next_cursor = get_schemes(state, *page_args())
+        return jsonify({"schemes": schemes, "next_cursor": next_cursor}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
 @app.route('/api/prices', methods=['GET'])
 def get_prices_route():
-    """Get all prices, optionally filtered by state and region (Public Access)"""
+    """Get the latest price of each crop and market, optionally filtered by state and region (Public Access)"""
     try:
         state = request.args.get('state')
         region = request.args.get('region')
-        prices = get_prices(state, region)
-        
-        # Add trend and change calculation for each price
-        for price in prices:
-            # Get historical data for trend calculation (last week's price)
-            last_week = datetime.datetime.now() - datetime.timedelta(days=7)
-            historical_prices = get_prices(
-                state=price['state'],
-                region=price['region'],
-                crop_name=price['crop_name'],
-                before_date=last_week
-            )
-            
-            if historical_prices:
-                old_price = historical_prices[0]['price']
-                current_price = price['price']
-                change = ((current_price - old_price) / old_price) * 100
-                price['trend'] = 'up' if change > 0 else 'down' if change < 0 else 'stable'
-                price['change'] = round(abs(change), 1)
-            else:
-                price['trend'] = 'stable'
-                price['change'] = 0
-        
+        prices = get_latest_prices(state, region)
         return jsonify({"prices": prices}), 200
     except Exception as e:
         logger.error(f"Error fetching prices: {str(e)}")
@@ -791,32 +854,27 @@ def get_prices_route():
 
 @app.route('/api/market-prices', methods=['GET'])
 def get_market_prices_route():
-    """Get market prices based on location and calculate distance"""
+    """Get latest market prices, nearest markets first when a location is given"""
     try:
+        # The web client sends latitude/longitude; lat/lng is also accepted
         lat = request.args.get('lat', type=float)
         lng = request.args.get('lng', type=float)
-        
-        # Get all prices first
-        prices = get_prices()
-        
-        # If location is provided, calculate distances and sort by proximity
-        if lat and lng:
-            for price in prices:
-                # Calculate distance if market has coordinates
-                if 'latitude' in price and 'longitude' in price:
-                    distance = calculate_distance(
-                        lat1=lat,
-                        lon1=lng,
-                        lat2=price['latitude'],
-                        lon2=price['longitude']
-                    )
-                    price['distance'] = round(distance, 2)
-                else:
-                    price['distance'] = None
-            
-            # Sort prices by distance if available
-            prices.sort(key=lambda x: (x['distance'] is None, x['distance']))
-        
+        if lat is None:
+            lat = request.args.get('latitude', type=float)
+        if lng is None:
+            lng = request.args.get('longitude', type=float)
+        
+        if lat is None or lng is None:
+            return jsonify({"prices": get_latest_prices()}), 200
+
+        # Indexed k-nearest query on the latest_prices 2dsphere index; distance is in km
+        prices = get_nearby_latest_prices(
+            lat,
+            lng,
+            max_distance_km=request.args.get('max_distance', MARKET_SEARCH_RADIUS_KM, type=float),
+            limit=request.args.get('limit', type=int),
+            crop_name=request.args.get('crop_name')
+        )
         return jsonify({"prices": prices}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 400
@@ -849,8 +907,8 @@ def create_price_route():
             longitude=data.get('longitude')
         )
         
-        # Send notifications to users in the region
-        PushNotification.notify_users_in_region(
+        # Queue notifications to users in the region
+        notification_job_id = enqueue_notification(
             data['region'],
             {
                 "crop_name": data['crop_name'],
@@ -860,7 +918,11 @@ def create_price_route():
             "market_price"
         )
         
-        return jsonify({"message": "Price created successfully", "id": price_id}), 201
+        return jsonify({
+            "message": "Price created successfully",
+            "id": price_id,
+            "notification_job_id": notification_job_id
+        }), 201
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
@@ -868,57 +930,132 @@ def create_price_route():
 @app.route('/user/upload', methods=['POST'])
 @user_or_admin_required
 def upload_image():
-    """Upload an image and process it with Gemini AI (User Access)"""
+    """Upload an image and queue it for Gemini AI analysis (User Access)"""
     try:
-        print("Received upload request")
+        logger.debug("Received upload request")
         if 'file' not in request.files:
-            print("No file in request")
+            logger.debug("No file in request")
             return jsonify({"error": "No file uploaded"}), 400
         
         file = request.files['file']
         if file.filename == '':
-            print("Empty filename")
+            logger.debug("Empty filename")
             return jsonify({"error": "No selected file"}), 400
             
         # Validate file type
         allowed_extensions = {'jpg', 'jpeg', 'png', 'gif', 'webp'}
         if '.' not in file.filename or \
            file.filename.rsplit('.', 1)[1].lower() not in allowed_extensions:
-            print(f"Invalid file type: {file.filename}")
+            logger.debug("Invalid file type: %s", file.filename)
             return jsonify({"error": "Invalid file type. Allowed types: JPG, JPEG, PNG, GIF, WEBP"}), 400
 
-        # Create uploads directory if it doesn't exist
-        if not os.path.exists("uploads"):
-            os.makedirs("uploads")
-        
-        file_path = os.path.join("uploads", file.filename)
-        file.save(file_path)  # Save the uploaded file
-        print(f"File saved to {file_path}")
-
+        # Read the upload once into memory; nothing is written to disk
         try:
-            response_text = generate_gemini_response(input_prompt, file_path)
-            result = {
-                "file_path": file_path, 
-                "analysis": response_text,
+            file_content = read_upload(file.stream, MAX_ANALYSIS_UPLOAD_BYTES)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        is_image, mime_type = get_mime_type(file_content, file.filename)
+        if not is_image:
+            return jsonify({"error": mime_type}), 400
+
+        # Key the cache on the image the model sees, so copies of a photo that differ only in
+        # metadata or encoding share an entry once resized
+        image_data, inference_mime_type = prepare_for_inference(file_content, mime_type, **image_preprocessing)
+
+        # Identical image already analysed with the current prompt: answer without calling the model
+        cache_key = analysis_cache.key(image_data)
+        cached_analysis = analysis_cache.get(cache_key)
+        if cached_analysis is not None:
+            upload_id = save_upload_history(request.user["user_id"], file.filename, cached_analysis)
+            return jsonify({
+                "status": "completed",
+                "analysis": cached_analysis,
+                "upload_id": upload_id,
+                "cached": True,
                 "user_id": request.user["user_id"]
-            }
-            print("Analysis completed successfully")
-            return jsonify(result), 200
+            }), 200
+
+        try:
+            image_hash = dhash_bytes(file_content)
         except Exception as e:
-            print(f"Error in analysis: {str(e)}")
-            return jsonify({"error": f"Analysis failed: {str(e)}"}), 500
-        finally:
-            # Clean up the uploaded file
-            try:
-                os.remove(file_path)
-                print(f"Cleaned up file {file_path}")
-            except Exception as e:
-                print(f"Error cleaning up file: {str(e)}")
+            logger.warning("Could not compute perceptual hash: %s", e)
+            image_hash = None
+
+        if image_hash is not None:
+            match = perceptual_index.lookup(image_hash)
+            if match:
+                upload_id = save_upload_history(
+                    request.user["user_id"], file.filename, match["analysis"],
+                    image_hash=hash_to_hex(image_hash), analysis_version=analysis_cache.version
+                )
+                return jsonify({
+                    "status": "completed",
+                    "analysis": match["analysis"],
+                    "upload_id": upload_id,
+                    "cached": True,
+                    "matched_upload_id": match["upload_id"],
+                    "user_id": request.user["user_id"]
+                }), 200
+
+        # Analysis runs in the background on the in-memory bytes
+        try:
+            history = {}
+            if image_hash is not None:
+                history = {"image_hash": hash_to_hex(image_hash), "analysis_version": analysis_cache.version}
+            job_id = analysis_jobs.submit(request.user["user_id"], file.filename,
+                                          image_data, inference_mime_type, cache_key, history=history)
+        except QueueFullError:
+            return jsonify({"error": "Too many analyses in progress. Please try again shortly."}), 503
+
+        return jsonify({
+            "job_id": job_id,
+            "status": "queued",
+            "status_url": f"/user/analysis/{job_id}",
+            "user_id": request.user["user_id"]
+        }), 202
 
     except Exception as e:
-        print(f"Upload error: {str(e)}")
+        logger.exception("Upload error")
         return jsonify({"error": str(e)}), 500
 
+def format_analysis_job(job):
+    """Shape an analysis job document for the status endpoints"""
+    result = {
+        "job_id": job["_id"],
+        "status": job["status"],
+        "progress": job.get("progress", 0),
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"]
+    }
+    if job["status"] == "completed":
+        result["analysis"] = job["analysis"]
+        result["upload_id"] = job.get("upload_id")
+    elif job["status"] == "failed":
+        result["error"] = f"Analysis failed: {job.get('error', 'unknown error')}"
+    return result
+
+@app.route('/user/analysis/<job_id>', methods=['GET'])
+@user_or_admin_required
+def get_analysis_job_route(job_id):
+    """Get the status and result of an image analysis job (User Access)"""
+    try:
+        job = get_analysis_job(job_id, request.user["user_id"])
+        if not job:
+            return jsonify({"error": "Analysis job not found"}), 404
+        return jsonify(format_analysis_job(job)), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route('/admin/analysis/cache/stats', methods=['GET'])
+@admin_required
+def get_analysis_cache_stats():
+    """Get analysis cache hit rate for this worker (Admin Only)"""
+    try:
+        return jsonify({"cache": analysis_cache.stats()}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
 # Admin Routes (Requires Admin Authentication)
 @app.route('/admin/schemes', methods=['POST'])
 @admin_required
@@ -938,8 +1075,8 @@ def add_scheme():
             data['benefits'],
             data['state']
         )
-        # Send notifications to users in the region
-        PushNotification.notify_users_in_region(
+        # Queue notifications to users in the region
+        notification_job_id = enqueue_notification(
             data['state'],
             {
                 "name": data['name'],
@@ -951,7 +1088,8 @@ def add_scheme():
         return jsonify({
             "message": "Scheme created successfully", 
             "scheme_id": scheme_id,
-            "admin_id": request.user["user_id"]
+            "admin_id": request.user["user_id"],
+            "notification_job_id": notification_job_id
         }), 201
     except Exception as e:
         return jsonify({"error": str(e)}), 400
@@ -963,8 +1101,8 @@ def update_scheme_route(scheme_id):
     data = request.get_json()
     try:
         update_scheme(scheme_id, data)
-        # Send notifications to users in the region
-        PushNotification.notify_users_in_region(
+        # Queue notifications to users in the region
+        notification_job_id = enqueue_notification(
             data['state'],
             {
                 "name": data['name'],
@@ -975,7 +1113,8 @@ def update_scheme_route(scheme_id):
         )
         return jsonify({
             "message": "Scheme updated successfully",
-            "admin_id": request.user["user_id"]
+            "admin_id": request.user["user_id"],
+            "notification_job_id": notification_job_id
         }), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 400
@@ -1002,9 +1141,7 @@ def add_price():
         data = request.form.to_dict()
         file = request.files.get('image')
         
-        # Debug print
-        print("Received data:", data)
-        print("Required fields:", ['crop_name', 'price', 'state', 'region', 'date_effective'])
+        logger.debug("Received price data: %s", data)
         
         # Validate required fields
         required_fields = ['crop_name', 'price', 'state', 'region', 'date_effective']
@@ -1046,12 +1183,13 @@ def add_price():
             data['state'],
             data['region'],
             data['date_effective'],
-            image_url,
-            image_key
+            image_url=image_url,
+            market=data.get('market'),
+            image_key=image_key
         )
         
-        # Send notifications to users in the region
-        PushNotification.notify_users_in_region(
+        # Queue notifications to users in the region
+        notification_job_id = enqueue_notification(
             data['region'],
             {
                 "crop_name": data['crop_name'],
@@ -1065,11 +1203,33 @@ def add_price():
             "message": "Price created successfully",
             "price_id": price_id,
             "admin_id": request.user["user_id"],
-            "image_url": image_url
+            "image_url": image_url,
+            "notification_job_id": notification_job_id
         }), 201
         
     except Exception as e:
-        print(f"Error in add_price: {str(e)}")
+        logger.exception("Error in add_price")
+        return jsonify({"error": str(e)}), 400
+
+@app.route('/admin/prices/import', methods=['POST'])
+@admin_required
+def import_prices_route():
+    """Bulk import a CSV or JSONL price sheet (Admin Only)"""
+    try:
+        file = request.files.get('file')
+        if not file or file.filename == '':
+            return jsonify({"error": "No file uploaded"}), 400
+
+        fmt = detect_format(file.filename, request.args.get('format'))
+        if fmt is None:
+            return jsonify({"error": "Unsupported format. Upload a .csv or .jsonl file"}), 400
+
+        report = import_prices(file.stream, fmt)
+        report["admin_id"] = request.user["user_id"]
+        return jsonify(report), 200
+
+    except Exception as e:
+        logger.exception("Error in import_prices_route")
         return jsonify({"error": str(e)}), 400
 
 @app.route('/admin/prices/<price_id>', methods=['PUT'])
@@ -1098,14 +1258,17 @@ def update_price_route(price_id):
                 return jsonify({"error": "Invalid price value"}), 400
         
         # Get the current price data before update
-        current_price = get_prices(price_id=price_id)[0]
+        current_price = get_price(price_id)
+        if not current_price:
+            return jsonify({"error": "Price entry not found"}), 404
         
         # Update price
         update_price(price_id, data)
         
-        # Send notifications to users in the region if price has changed
+        # Queue notifications to users in the region if price has changed
+        notification_job_id = None
         if 'price' in data and data['price'] != current_price['price']:
-            PushNotification.notify_users_in_region(
+            notification_job_id = enqueue_notification(
                 current_price['region'],
                 {
                     "crop_name": current_price['crop_name'],
@@ -1119,7 +1282,8 @@ def update_price_route(price_id):
         
         return jsonify({
             "message": "Price updated successfully",
-            "admin_id": request.user["user_id"]
+            "admin_id": request.user["user_id"],
+            "notification_job_id": notification_job_id
         }), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 400
@@ -1137,17 +1301,16 @@ def delete_price_route(price_id):
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
-# Add this after other routes
 @app.route('/weather', methods=['GET'])
 def get_weather():
     """Get detailed weather data for agriculture"""
     try:
-        lat = request.args.get('lat')
-        lon = request.args.get('lon')
+        lat = request.args.get('lat', type=float)
+        lon = request.args.get('lon', type=float)
         
         logger.info(f"Weather request received for coordinates: lat={lat}, lon={lon}")
         
-        if not lat or not lon:
+        if lat is None or lon is None:
             logger.warning("Missing coordinates in weather request")
             return jsonify({"error": "Location coordinates required"}), 400
 
@@ -1157,66 +1320,7 @@ def get_weather():
             logger.error("OpenWeather API key not configured")
             return jsonify({"error": "Weather API key not configured"}), 500
 
-        weather_url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={api_key}&units=metric"
-        forecast_url = f"https://api.openweathermap.org/data/2.5/forecast?lat={lat}&lon={lon}&appid={api_key}&units=metric"
-
-        logger.info("Fetching weather data from OpenWeatherMap API")
-        
-        # Get current weather and forecast
-        weather_response = requests.get(weather_url, timeout=5)
-        forecast_response = requests.get(forecast_url, timeout=5)
-
-        if weather_response.status_code != 200 or forecast_response.status_code != 200:
-            logger.error(f"OpenWeatherMap API error - Weather status: {weather_response.status_code}, Forecast status: {forecast_response.status_code}")
-            return jsonify({"error": "Failed to fetch weather data from external service"}), 500
-
-        weather_data = weather_response.json()
-        forecast_data = forecast_response.json()
-
-        logger.info("Successfully fetched weather data")
-
-        # Calculate agricultural metrics
-        agricultural_metrics = {
-            "growing_degree_days": max(0, (weather_data["main"]["temp_max"] + weather_data["main"]["temp_min"]) / 2 - 10),
-            "evapotranspiration": calculate_evapotranspiration(weather_data),
-            "frost_risk": "High" if weather_data["main"]["temp"] < 2 else "Low",
-            "irrigation_need": calculate_irrigation_need(weather_data)
-        }
-
-        # Format forecast data
-        formatted_forecast = [
-            {
-                "date": item["dt_txt"],
-                "temperature": item["main"]["temp"],
-                "humidity": item["main"]["humidity"],
-                "description": item["weather"][0]["description"],
-                "wind_speed": item["wind"]["speed"],
-                "rainfall_chance": item["pop"] * 100  # Probability of precipitation
-            }
-            for item in forecast_data["list"][:8]  # Next 24 hours (3-hour intervals)
-        ]
-
-        # Generate farming advice
-        farming_advice = generate_farming_advice(weather_data, forecast_data)
-
-        # Combine all data
-        agricultural_weather = {
-            "current": {
-                "temperature": weather_data["main"]["temp"],
-                "humidity": weather_data["main"]["humidity"],
-                "wind_speed": weather_data["wind"]["speed"],
-                "description": weather_data["weather"][0]["description"],
-                "rainfall": weather_data.get("rain", {}).get("1h", 0),
-                "soil_temp": weather_data["main"]["temp"] - 2,  # Approximate soil temperature
-            },
-            "agricultural_metrics": agricultural_metrics,
-            "forecast": formatted_forecast,
-            "farming_advice": {
-                "risk_indicator": farming_advice["risk_indicator"],
-                "weather_summary": farming_advice["weather_summary"],
-                "recommendations": farming_advice["advice"]
-            }
-        }
+        agricultural_weather = weather_service.get_agricultural_weather(lat, lon, api_key)
 
         logger.info("Successfully processed weather data")
         return jsonify(agricultural_weather), 200
@@ -1224,179 +1328,37 @@ def get_weather():
     except requests.Timeout:
         logger.error("Timeout while fetching weather data")
         return jsonify({"error": "Weather service timeout. Please try again."}), 504
+    except WeatherProviderError as e:
+        logger.error(str(e))
+        return jsonify({"error": "Failed to fetch weather data from external service"}), 500
     except Exception as e:
         logger.error(f"Error processing weather data: {str(e)}")
         return jsonify({"error": "Failed to process weather data"}), 500
 
-def calculate_evapotranspiration(weather_data):
-    """Simple estimation of evapotranspiration"""
-    temp = weather_data["main"]["temp"]
-    humidity = weather_data["main"]["humidity"]
-    wind_speed = weather_data["wind"]["speed"]
-    
-    # Basic estimation formula
-    et = (0.0023 * (temp + 17.8) * (max(0, temp - 0.0) ** 0.5)) * (100 - humidity) / 100
-    return round(max(0, et), 2)
-
-def calculate_irrigation_need(weather_data):
-    """Calculate irrigation needs based on weather"""
-    temp = weather_data["main"]["temp"]
-    humidity = weather_data["main"]["humidity"]
-    rainfall = weather_data.get("rain", {}).get("1h", 0)
-    
-    if rainfall > 5:
-        return "No irrigation needed - Recent rainfall sufficient"
-    elif temp > 30 and humidity < 50:
-        return "High - Consider immediate irrigation"
-    elif temp > 25:
-        return "Moderate - Monitor soil moisture"
-    else:
-        return "Low - Regular schedule adequate"
-
-def generate_farming_advice(weather_data, forecast_data):
-    """Generate AI-based farming advice based on current weather conditions and forecast"""
-    try:
-        temp = weather_data["main"]["temp"]
-        humidity = weather_data["main"]["humidity"]
-        wind_speed = weather_data["wind"]["speed"]
-        description = weather_data["weather"][0]["description"]
-        rainfall = weather_data.get("rain", {}).get("1h", 0)
-        
-        # Get forecast data for next 24 hours
-        next_24h_forecast = forecast_data["list"][:8]  # 3-hour intervals
-        
-        advice = []
-        risk_level = "low"
-        
-        # Temperature-based advice
-        if temp > 35:
-            risk_level = "high"
-            advice.extend([
-                "High Temperature Alert:",
-                "• Use shade nets or temporary covers to protect sensitive crops",
-                "• Increase irrigation frequency but reduce water quantity per session",
-                "• Apply mulching to retain soil moisture",
-                "• Best time for irrigation: Early morning or late evening",
-                "• Monitor for heat stress symptoms in plants"
-            ])
-        elif temp < 5:
-            risk_level = "high"
-            advice.extend([
-                "Cold Temperature Alert:",
-                "• Cover sensitive crops with row covers or frost protection sheets",
-                "• Maintain soil moisture to prevent frost damage",
-                "• Delay fertilizer application until temperature rises",
-                "• Monitor for cold damage symptoms",
-                "• Consider using cold frames for vulnerable seedlings"
-            ])
-        
-        # Humidity-based advice
-        if humidity > 80:
-            risk_level = "moderate" if risk_level == "low" else risk_level
-            advice.extend([
-                "High Humidity Management:",
-                "• Monitor for fungal disease development",
-                "• Increase plant spacing for better air circulation",
-                "• Consider preventive fungicide application",
-                "• Avoid overhead irrigation",
-                "• Remove affected leaves to prevent disease spread"
-            ])
-        elif humidity < 30:
-            risk_level = "moderate" if risk_level == "low" else risk_level
-            advice.extend([
-                "Low Humidity Management:",
-                "• Increase irrigation frequency",
-                "• Apply mulching to conserve soil moisture",
-                "• Consider drip irrigation implementation",
-                "• Best times for crop operations: Early morning or late evening",
-                "• Monitor for signs of water stress"
-            ])
-        
-        # Wind-based advice
-        if wind_speed > 20:
-            risk_level = "high"
-            advice.extend([
-                "Strong Wind Advisory:",
-                "• Delay pesticide/fertilizer spraying",
-                "• Provide wind breaks for vulnerable crops",
-                "• Check and reinforce crop support structures",
-                "• Monitor for physical damage to crops",
-                "• Consider emergency irrigation if soil is drying"
-            ])
-        
-        # Rain-based advice
-        if rainfall > 5:
-            risk_level = "moderate" if risk_level == "low" else risk_level
-            advice.extend([
-                "Rainfall Management:",
-                "• Hold off on irrigation for next 24-48 hours",
-                "• Monitor soil drainage in low-lying areas",
-                "• Check for water logging and improve drainage if needed",
-                "• Delay fertilizer application",
-                "• Watch for signs of root diseases"
-            ])
-        
-        # Forecast-based advice
-        forecast_conditions = [item["weather"][0]["main"] for item in next_24h_forecast]
-        if "Rain" in forecast_conditions:
-            advice.extend([
-                "Rain Expected in Next 24 Hours:",
-                "• Plan harvesting activities accordingly",
-                "• Prepare drainage systems",
-                "• Delay any planned chemical applications",
-                "• Consider protective covering for sensitive crops",
-                "• Have equipment ready for water management"
-            ])
-        
-        # General advice based on weather description
-        if "clear" in description.lower():
-            advice.extend([
-                "Clear Weather Operations:",
-                "• Ideal time for pest monitoring",
-                "• Good conditions for spraying operations",
-                "• Consider soil moisture management",
-                "• Optimal time for harvesting operations"
-            ])
-        elif "cloud" in description.lower():
-            advice.extend([
-                "Cloudy Conditions Management:",
-                "• Good time for transplanting activities",
-                "• Monitor humidity levels",
-                "• Check for pest presence under leaves",
-                "• Ideal conditions for foliar applications"
-            ])
-        
-        # Add risk level indicator
-        risk_indicator = {
-            "low": "Low Risk - Regular monitoring sufficient",
-            "moderate": "Moderate Risk - Increased vigilance needed",
-            "high": "High Risk - Immediate attention required"
-        }
-        
-        return {
-            "risk_level": risk_level,
-            "risk_indicator": risk_indicator[risk_level],
-            "weather_summary": f"Current Conditions: {description.capitalize()}, {temp}°C, {humidity}% Humidity, Wind {wind_speed}m/s",
-            "advice": advice if advice else ["No specific farming advice needed for current conditions. Continue regular monitoring."]
-        }
-        
-    except Exception as e:
-        logger.error(f"Error generating farming advice: {str(e)}")
-        return {
-            "risk_level": "unknown",
-            "risk_indicator": "Risk Level Unknown",
-            "weather_summary": "Weather data unavailable",
-            "advice": ["Unable to generate specific farming advice. Please check weather data."]
-        }
+@app.route('/admin/metrics', methods=['GET'])
+@admin_required
+def get_metrics():
+    """Get latency histograms and counters recorded by this worker (Admin Only)"""
+    return jsonify({
+        "metrics": metrics.snapshot(),
+        "circuits": {"openweathermap": weather_service.breaker.state},
+        "push_delivery": delivery_engine.stats(),
+        "response_cache": response_cache.stats(),
+        "boot": services.boot_report(),
+        "mongo_pool": services.pool_report(),
+        "verified_tokens": verified_tokens.stats(),
+        "user_cache": user_cache_stats()
+    }), 200
 
 # Expert Articles Routes
 @app.route('/expert-articles', methods=['GET'])
+@response_cache.cached('expert_articles')
 def get_expert_articles_route():
     """Get all expert articles (Public Access)"""
     try:
         category = request.args.get('category')
-        articles = get_expert_articles(category)
-        return jsonify({"articles": articles}), 200
+        articles, next_cursor = get_expert_articles(category, *page_args())
+        return jsonify({"articles": articles, "next_cursor": next_cursor}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
@@ -1445,8 +1407,8 @@ def add_expert_article():
             image_url=image_url
         )
         
-        # Send notifications to users in the region
-        PushNotification.notify_users_in_region(
+        # Queue notifications to users in the region
+        notification_job_id = enqueue_notification(
             data['region'],
             {
                 "title": data['title'],
@@ -1459,14 +1421,16 @@ def add_expert_article():
         return jsonify({
             "message": "Expert article created successfully",
             "article_id": article_id,
-            "admin_id": request.user["user_id"]
+            "admin_id": request.user["user_id"],
+            "notification_job_id": notification_job_id
         }), 201
         
     except Exception as e:
-        print(f"Error in add_expert_article: {str(e)}")
+        logger.exception("Error in add_expert_article")
         return jsonify({"error": str(e)}), 400
 
 @app.route('/expert-articles/<article_id>', methods=['GET'])
+@response_cache.cached('expert_articles')
 def get_expert_article_route(article_id):
     """Get a specific expert article (Public Access)"""
     try:
@@ -1549,8 +1513,8 @@ def add_daily_news():
             image_url=image_url
         )
         
-        # Send notifications to users in the region
-        PushNotification.notify_users_in_region(
+        # Queue notifications to users in the region
+        notification_job_id = enqueue_notification(
             data['region'],
             {
                 "title": data['title'],
@@ -1563,23 +1527,26 @@ def add_daily_news():
         return jsonify({
             "message": "Daily news created successfully",
             "news_id": news_id,
-            "admin_id": request.user["user_id"]
+            "admin_id": request.user["user_id"],
+            "notification_job_id": notification_job_id
         }), 201
         
     except Exception as e:
-        print(f"Error in add_daily_news: {str(e)}")
+        logger.exception("Error in add_daily_news")
         return jsonify({"error": str(e)}), 400
 
 @app.route('/daily-news', methods=['GET'])
+@response_cache.cached('daily_news')
 def get_daily_news_route():
     """Get all daily news entries (Public Access)"""
     try:
-        news_list = get_daily_news()
-        return jsonify({"news": news_list}), 200
+        news_list, next_cursor = get_daily_news(*page_args())
+        return jsonify({"news": news_list, "next_cursor": next_cursor}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
 @app.route('/daily-news/<news_id>', methods=['GET'])
+@response_cache.cached('daily_news')
 def get_daily_news_item_route(news_id):
     """Get a specific daily news item (Public Access)"""
     try:
@@ -1628,6 +1595,18 @@ def delete_daily_news_route(news_id):
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
+@app.route('/admin/notifications/<job_id>', methods=['GET'])
+@admin_required
+def get_notification_job_route(job_id):
+    """Get the status and delivery stats of a queued notification (Admin Only)"""
+    try:
+        job = get_notification_job(job_id)
+        if not job:
+            return jsonify({"error": "Notification job not found"}), 404
+        return jsonify({"job": job}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
 @app.route('/user/notifications/subscribe', methods=['POST'])
 @token_required
 def subscribe_push_notifications():
@@ -1655,13 +1634,14 @@ def subscribe_push_notifications():
             }
         )
         
+        invalidate_user(request.user["user_id"])
         if result.modified_count == 0:
             return jsonify({"error": "Failed to update subscription"}), 400
             
         return jsonify({"message": "Successfully subscribed to notifications"}), 200
         
     except Exception as e:
-        print(f"Error in subscribe_push_notifications: {str(e)}")
+        logger.exception("Error in subscribe_push_notifications")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/user/notifications/unsubscribe', methods=['POST'])
@@ -1680,13 +1660,14 @@ def unsubscribe_push_notifications():
             }
         )
         
+        invalidate_user(request.user["user_id"])
         if result.modified_count == 0:
             return jsonify({"error": "Failed to unsubscribe"}), 400
             
         return jsonify({"message": "Successfully unsubscribed from notifications"}), 200
         
     except Exception as e:
-        print(f"Error in unsubscribe_push_notifications: {str(e)}")
+        logger.exception("Error in unsubscribe_push_notifications")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/user/notifications/preferences', methods=['GET'])
@@ -1694,7 +1675,7 @@ def unsubscribe_push_notifications():
 def get_notification_preferences():
     """Get user's notification preferences"""
     try:
-        user = users_collection.find_one({"_id": ObjectId(request.user["user_id"])})
+        user = get_user(request.user["user_id"])
         if not user:
             return jsonify({"error": "User not found"}), 404
             
@@ -1702,7 +1683,7 @@ def get_notification_preferences():
         return jsonify({"preferences": preferences}), 200
         
     except Exception as e:
-        print(f"Error in get_notification_preferences: {str(e)}")
+        logger.exception("Error in get_notification_preferences")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/user/notifications/preferences', methods=['PUT'])
@@ -1731,13 +1712,14 @@ def update_notification_preferences():
             {"$set": {"notification_preferences": preferences}}
         )
         
+        invalidate_user(request.user["user_id"])
         if result.modified_count == 0:
             return jsonify({"error": "Failed to update preferences"}), 400
             
         return jsonify({"message": "Preferences updated successfully"}), 200
         
     except Exception as e:
-        print(f"Error in update_notification_preferences: {str(e)}")
+        logger.exception("Error in update_notification_preferences")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/test/notification', methods=['POST'])
@@ -1746,7 +1728,7 @@ def test_notification():
     """Test endpoint to send a push notification"""
     try:
         user_id = request.user["user_id"]
-        user = users_collection.find_one({"_id": ObjectId(user_id)})
+        user = get_user(user_id)
         
         if not user or not user.get("push_subscription"):
             return jsonify({"error": "No push subscription found"}), 404
@@ -1765,30 +1747,41 @@ def test_notification():
         return jsonify({"message": "Test notification sent successfully"}), 200
         
     except Exception as e:
-        print(f"Error sending test notification: {str(e)}")
+        logger.exception("Error sending test notification")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/user/analysis/history', methods=['GET'])
+@token_required
+def get_analysis_history():
+    """Get a page of the user's past analyses, newest first"""
+    try:
+        uploads, next_cursor = get_user_uploads(request.user["user_id"], *page_args())
+        return jsonify({"uploads": uploads, "next_cursor": next_cursor}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
 @app.route('/user/analysis/count', methods=['GET'])
 @token_required
 def get_analysis_count():
     """Get the count of AI analyses done by the user"""
     try:
         user_id = request.user["user_id"]
-        print(f"Getting analysis count for user: {user_id}")  # Debug log
+        logger.debug("Getting analysis count for user: %s", user_id)
         
         # Get uploads count from database
         count = uploads_collection.count_documents({"user_id": user_id})
-        print(f"Found {count} uploads for user")  # Debug log
+        logger.debug("Found %s uploads for user", count)
         
         return jsonify({
             "count": count,
             "user_id": user_id
         }), 200
     except Exception as e:
-        print(f"Error getting analysis count: {str(e)}")  # Debug log
+        logger.exception("Error getting analysis count")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/states', methods=['GET'])
+@response_cache.cached('states', cache_control='public, max-age=86400')
 def get_states():
     """Get list of all Indian states"""
     try:
@@ -1802,6 +1795,7 @@ def get_states():
         return jsonify({"error": "Failed to fetch states"}), 500
 
 @app.route('/api/regions', methods=['GET'])
+@response_cache.cached('states', cache_control='public, max-age=86400')
 def get_regions():
     """Get regions for a specific state"""
     try:
@@ -1822,8 +1816,11 @@ def get_regions():
         logger.error(f"Error fetching regions: {str(e)}")
         return jsonify({"error": "Failed to fetch regions"}), 500
 
+services.record_boot_phase("module_init", _module_init_started)
+
+# Index and backfill maintenance needs the network, so it runs in the background
+threading.Thread(target=run_boot_maintenance, name="boot-maintenance", daemon=True).start()
+
 if __name__ == '__main__':
-    if not os.path.exists("uploads"):
-        os.makedirs("uploads")
     port = int(os.getenv('PORT', 5000))
     app.run(host='0.0.0.0', port=port)
@@ -0,0 +1,261 @@
+import os
+import threading
+import time
+import warnings
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+import pymongo
+from flask import g, has_request_context
+from pymongo import ReadPreference, monitoring
+import metrics
+from cache_utils import invalidated_within
+
+class ServiceRegistry:
+    """Shared clients built on first use instead of at import.
+
+    Construction is guarded by a lock so concurrent first requests build a
+    client once. Instances are dropped in forked children (gunicorn
+    --preload), since Mongo and HTTP clients must not be shared across a
+    fork; each worker builds its own on first use.
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._instances: Dict[str, Any] = {}
+        self._init_ms: Dict[str, float] = {}
+        self._lock = threading.RLock()
+        self._pid = os.getpid()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def register(self, name: str, factory: Callable[[], Any]) -> None:
+        with self._lock:
+            self._factories[name] = factory
+
+    def get(self, name: str) -> Any:
+        if self._pid != os.getpid():
+            self._after_fork()
+        try:
+            return self._instances[name]
+        except KeyError:
+            pass
+        with self._lock:
+            if name not in self._instances:
+                start = time.perf_counter()
+                self._instances[name] = self._factories[name]()
+                self._init_ms[name] = round((time.perf_counter() - start) * 1000, 1)
+            return self._instances[name]
+
+    def initialized(self, name: str) -> bool:
+        return name in self._instances
+
+    def _after_fork(self) -> None:
+        self._lock = threading.RLock()
+        self._instances = {}
+        self._init_ms = {}
+        self._pid = os.getpid()
+
+    def report(self) -> Dict[str, Dict]:
+        """Which services this process has built and how long each took"""
+        return {
+            name: {"initialized": name in self._instances, "init_ms": self._init_ms.get(name)}
+            for name in sorted(self._factories)
+        }
+
+registry = ServiceRegistry()
+
+# Boot phase durations of this process in milliseconds
+_boot_timings: Dict[str, float] = {}
+
+@contextmanager
+def timed(phase: str):
+    """Record how long a boot phase takes"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _boot_timings[phase] = round((time.perf_counter() - start) * 1000, 1)
+
+def record_boot_phase(phase: str, started: float) -> None:
+    """Record a boot phase that began at time.perf_counter() value started"""
+    _boot_timings[phase] = round((time.perf_counter() - started) * 1000, 1)
+
+def boot_report() -> Dict:
+    return {"phases": dict(_boot_timings), "services": registry.report()}
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """Tracks connection pool utilisation per server from pymongo pool events"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pools: Dict[str, Dict[str, int]] = {}
+        self._wait = metrics.histogram("mongo.checkout_wait_ms", [1, 5, 10, 50, 100, 500, 1000, 5000])
+
+    def reset(self) -> None:
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pools = {}
+
+    def _update(self, address, **changes) -> None:
+        key = f"{address[0]}:{address[1]}"
+        with self._lock:
+            pool = self._pools.setdefault(key, {
+                "open": 0, "in_use": 0, "waiting": 0, "peak_in_use": 0, "checkout_failures": 0
+            })
+            for field, delta in changes.items():
+                pool[field] += delta
+            pool["peak_in_use"] = max(pool["peak_in_use"], pool["in_use"])
+
+    def connection_created(self, event):
+        self._update(event.address, open=1)
+
+    def connection_closed(self, event):
+        self._update(event.address, open=-1)
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+        self._update(event.address, waiting=1)
+
+    def connection_checked_out(self, event):
+        started = getattr(self._local, "started", None)
+        if started is not None:
+            self._wait.observe((time.perf_counter() - started) * 1000)
+        self._update(event.address, waiting=-1, in_use=1)
+
+    def connection_check_out_failed(self, event):
+        self._update(event.address, waiting=-1, checkout_failures=1)
+
+    def connection_checked_in(self, event):
+        self._update(event.address, in_use=-1)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {address: dict(pool) for address, pool in self._pools.items()}
+
+pool_metrics = PoolMetricsListener()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=pool_metrics.reset)
+
+READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST
+}
+
+# Seconds after a write during which public reads of that data stay on the primary
+PUBLIC_READ_MAX_LAG = float(os.getenv("MONGO_PUBLIC_READ_MAX_LAG", 30))
+
+def mongo_options() -> Dict:
+    """Client options from the environment; unavailable compressors are skipped by pymongo"""
+    return {
+        "maxPoolSize": int(os.getenv("MONGO_MAX_POOL_SIZE", 50)),
+        "minPoolSize": int(os.getenv("MONGO_MIN_POOL_SIZE", 0)),
+        "maxIdleTimeMS": int(os.getenv("MONGO_MAX_IDLE_TIME_MS", 300000)),
+        "waitQueueTimeoutMS": int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 2000)),
+        "serverSelectionTimeoutMS": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 10000)),
+        "compressors": os.getenv("MONGO_COMPRESSORS", "zstd,snappy,zlib"),
+        "appname": os.getenv("MONGO_APP_NAME", "farmcare-backend")
+    }
+
+def _create_mongo_client() -> pymongo.MongoClient:
+    mongo_uri = os.getenv("MONGO_URI")
+    if not mongo_uri:
+        raise ValueError("MONGO_URI environment variable not set")
+    with warnings.catch_warnings():
+        # Compressors whose libraries are not installed are dropped with a warning
+        warnings.simplefilter("ignore", UserWarning)
+        return pymongo.MongoClient(mongo_uri, event_listeners=[pool_metrics], **mongo_options())
+
+registry.register("mongo", _create_mongo_client)
+
+def mongo_client() -> pymongo.MongoClient:
+    return registry.get("mongo")
+
+def pool_report() -> Dict:
+    """Pool limits and per-server utilisation of this process's client"""
+    options = mongo_options()
+    return {
+        "initialized": registry.initialized("mongo"),
+        "max_pool_size": options["maxPoolSize"],
+        "min_pool_size": options["minPoolSize"],
+        "pools": pool_metrics.snapshot(),
+        "checkout_wait_ms": metrics.histogram("mongo.checkout_wait_ms").snapshot()
+    }
+
+class LazyCollection:
+    """Stands in for a pymongo Collection and resolves it on first use.
+
+    name and full_name are known up front so indexes can be declared
+    without connecting. A read preference override is dropped for the
+    primary while cache_namespace was invalidated within PUBLIC_READ_MAX_LAG,
+    and for requests that set g.read_primary, so a cache refilled after a
+    write or an admin view never reads a lagging secondary.
+    """
+
+    def __init__(self, database_name: str, name: str, read_preference=None,
+                 cache_namespace: Optional[str] = None):
+        self.database_name = database_name
+        self.name = name
+        self.full_name = f"{database_name}.{name}"
+        self.read_preference_override = read_preference
+        self.cache_namespace = cache_namespace
+        self._resolved: Optional[tuple] = None
+
+    def _read_from_primary(self) -> bool:
+        if self.cache_namespace and invalidated_within(self.cache_namespace, PUBLIC_READ_MAX_LAG):
+            return True
+        return has_request_context() and g.get("read_primary", False)
+
+    def _collection(self):
+        client = mongo_client()
+        resolved = self._resolved
+        if resolved is None or resolved[0] is not client:
+            collection = client[self.database_name][self.name]
+            override = collection
+            if self.read_preference_override is not None:
+                override = collection.with_options(read_preference=self.read_preference_override)
+            resolved = (client, collection, override)
+            self._resolved = resolved
+        if resolved[2] is not resolved[1] and self._read_from_primary():
+            return resolved[1]
+        return resolved[2]
+
+    def __getattr__(self, attr: str):
+        return getattr(self._collection(), attr)
+
+    def __repr__(self) -> str:
+        return f"LazyCollection({self.full_name!r})"
+
+def collection(database_name: str, name: str) -> LazyCollection:
+    return LazyCollection(database_name, name)
+
+def public_read(lazy_collection: LazyCollection, cache_namespace: Optional[str] = None) -> LazyCollection:
+    """The same collection read with MONGO_PUBLIC_READ_PREFERENCE (default secondaryPreferred).
+
+    For public GET routes that tolerate replication lag; writes and
+    read-after-write paths keep using the primary. cache_namespace names the
+    cache_utils namespace its writes invalidate.
+    """
+    mode = os.getenv("MONGO_PUBLIC_READ_PREFERENCE", "secondaryPreferred")
+    if mode not in READ_PREFERENCES:
+        raise ValueError(f"Unknown MONGO_PUBLIC_READ_PREFERENCE: {mode}")
+    return LazyCollection(lazy_collection.database_name, lazy_collection.name, READ_PREFERENCES[mode],
+                          cache_namespace)
@@ -0,0 +1,74 @@
+import pytest
+import cache_utils
+from cache_utils import TTLCache
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(cache_utils.time, "monotonic", fake)
+    return fake
+
+def test_entry_expires_after_ttl(clock):
+    cache = TTLCache(maxsize=10, ttl=5)
+    cache.set("key", "value")
+    clock.now += 4.9
+    assert cache.get("key") == "value"
+    clock.now += 0.2
+    assert cache.get("key") is None
+    assert len(cache) == 0
+
+def test_per_entry_ttl_overrides_default(clock):
+    cache = TTLCache(maxsize=10, ttl=5)
+    cache.set("short", 1, ttl=1)
+    cache.set("long", 2)
+    clock.now += 2
+    assert cache.get("short") is None
+    assert cache.get("long") == 2
+
+def test_no_ttl_never_expires(clock):
+    cache = TTLCache(maxsize=10)
+    cache.set("key", "value")
+    clock.now += 10 ** 6
+    assert cache.get("key") == "value"
+
+def test_past_expires_at_is_not_stored(clock):
+    cache = TTLCache(maxsize=10, ttl=5)
+    cache.set("key", "value", expires_at=cache_utils.time.time() - 1)
+    assert cache.get("key") is None
+
+def test_evicts_least_recently_used(clock):
+    cache = TTLCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    # Reading a makes b the least recently used entry
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+def test_stats_count_hits_and_misses(clock):
+    cache = TTLCache(maxsize=2)
+    cache.set("a", 1)
+    cache.get("a")
+    cache.get("missing")
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (1, 1, 1)
+    assert stats["hit_rate"] == 0.5
+
+def test_invalidate_notifies_subscribers_and_records_time(clock):
+    cache = TTLCache(maxsize=2)
+    cache.set("a", 1)
+    cache_utils.subscribe("test_namespace", cache.clear)
+    cache_utils.invalidate("test_namespace")
+    assert cache.get("a") is None
+    assert cache_utils.invalidated_within("test_namespace", 1)
+    clock.now += 2
+    assert not cache_utils.invalidated_within("test_namespace", 1)
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+from geo import haversine_km, top_k
+
+def points(coordinates):
+    latitudes, longitudes = zip(*coordinates)
+    return np.radians(np.array(latitudes)), np.radians(np.array(longitudes))
+
+def test_haversine_known_distances():
+    # Pune to Mumbai is about 120 km; a degree of latitude is about 111 km
+    lat_rad, lon_rad = points([(19.0760, 72.8777), (19.5204, 73.8567), (18.5204, 73.8567)])
+    distances = haversine_km(18.5204, 73.8567, lat_rad, lon_rad)
+    assert distances[0] == pytest.approx(120, abs=5)
+    assert distances[1] == pytest.approx(111.2, abs=0.5)
+    assert distances[2] == pytest.approx(0, abs=1e-9)
+
+def test_haversine_antipodes_do_not_overflow():
+    lat_rad, lon_rad = points([(0, 180)])
+    assert haversine_km(0, 0, lat_rad, lon_rad)[0] == pytest.approx(np.pi * 6371.0)
+
+def test_haversine_precomputed_cos_lat():
+    lat_rad, lon_rad = points([(10, 20), (-30, 150)])
+    assert np.allclose(haversine_km(1, 2, lat_rad, lon_rad),
+                       haversine_km(1, 2, lat_rad, lon_rad, np.cos(lat_rad)))
+
+def test_top_k_returns_nearest_first():
+    distances = np.array([5.0, 1.0, 9.0, 3.0, 7.0])
+    assert top_k(distances, 3).tolist() == [1, 3, 0]
+
+def test_top_k_larger_than_input():
+    assert top_k(np.array([2.0, 1.0]), 10).tolist() == [1, 0]
+
+@pytest.mark.parametrize("distances, k", [(np.array([1.0, 2.0]), 0), (np.array([]), 3)])
+def test_top_k_empty(distances, k):
+    assert len(top_k(distances, k)) == 0
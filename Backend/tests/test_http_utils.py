@@ -0,0 +1,44 @@
+import time
+from email.utils import formatdate
+import pytest
+import requests
+from http_utils import CircuitBreaker, CircuitOpenError, retry_after_seconds
+
+def response_with(headers):
+    response = requests.Response()
+    response.status_code = 429
+    response.headers.update(headers)
+    return response
+
+@pytest.mark.parametrize("value, expected", [("120", 120.0), ("0", 0.0), ("-5", 0.0), ("1.5", 1.5)])
+def test_retry_after_seconds(value, expected):
+    assert retry_after_seconds(response_with({"Retry-After": value})) == expected
+
+def test_retry_after_http_date():
+    seconds = retry_after_seconds(response_with({"Retry-After": formatdate(time.time() + 90, usegmt=True)}))
+    assert seconds == pytest.approx(90, abs=2)
+
+def test_retry_after_date_in_the_past():
+    assert retry_after_seconds(response_with({"Retry-After": formatdate(time.time() - 90, usegmt=True)})) == 0.0
+
+@pytest.mark.parametrize("headers", [{}, {"Retry-After": ""}, {"Retry-After": "soon"}])
+def test_retry_after_missing_or_invalid(headers):
+    assert retry_after_seconds(response_with(headers)) is None
+
+def test_trip_keeps_the_circuit_open_for_retry_after():
+    breaker = CircuitBreaker("test", reset_timeout=1)
+    breaker.trip(3600)
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.call(lambda: None)
+
+def test_circuit_opens_after_threshold_failures():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=60)
+
+    def fail():
+        raise RuntimeError("upstream down")
+
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            breaker.call(fail)
+    assert breaker.state == "open"
@@ -0,0 +1,48 @@
+import io
+import random
+import numpy as np
+from PIL import Image
+from image_hash import BKTree, dhash, dhash_bytes, hamming_distance
+
+def gradient_image(size: int = 64) -> Image.Image:
+    x = np.linspace(0, 255, size)
+    pixels = np.add.outer(np.sin(x / 40) * 100, x) % 256
+    return Image.fromarray(pixels.astype(np.uint8), "L").convert("RGB")
+
+def test_dhash_is_64_bits_and_stable():
+    image = gradient_image()
+    assert dhash(image) == dhash(image)
+    assert 0 <= dhash(image) < 2 ** 64
+
+def test_dhash_tolerates_resizing_and_reencoding():
+    image = gradient_image(256)
+    buffer = io.BytesIO()
+    image.resize((200, 200)).save(buffer, format="JPEG", quality=70)
+    assert hamming_distance(dhash(image), dhash_bytes(buffer.getvalue())) <= 4
+
+def test_dhash_separates_different_images():
+    assert hamming_distance(dhash(gradient_image()), dhash(gradient_image().rotate(90))) > 10
+
+def test_hamming_distance():
+    assert hamming_distance(0b1011, 0b1011) == 0
+    assert hamming_distance(0b1011, 0b0010) == 2
+
+def test_bk_tree_search_matches_linear_scan():
+    rng = random.Random(0)
+    hashes = [rng.getrandbits(64) for _ in range(500)]
+    tree = BKTree()
+    for index, value in enumerate(hashes):
+        tree.add(value, index)
+    assert tree.size == 500
+
+    for query in hashes[:20] + [value ^ 0b111 for value in hashes[20:40]]:
+        expected = sorted(
+            (hamming_distance(query, value), index) for index, value in enumerate(hashes)
+            if hamming_distance(query, value) <= 6
+        )
+        found = tree.search(query, 6)
+        assert sorted(found) == expected
+        assert [distance for distance, _ in found] == sorted(distance for distance, _ in found)
+
+def test_bk_tree_search_empty_tree():
+    assert BKTree().search(0, 10) == []
@@ -0,0 +1,95 @@
+import datetime
+import pymongo
+import pytest
+import db
+
+class FakePrices:
+    """aggregate() returns the given latest_prices entries and records the pipeline"""
+
+    name = "prices"
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.pipelines = []
+
+    def aggregate(self, pipeline, session=None, **kwargs):
+        self.pipelines.append(pipeline)
+        return iter(self.entries)
+
+class FakeLatestPrices:
+    def __init__(self):
+        self.operations = []
+
+    def bulk_write(self, operations, ordered=True, session=None):
+        self.operations += operations
+
+def entry(key, price=110.0, change=10.0):
+    return {"_id": dict(key), **key, "price_id": "p1", "price": price, "change": change,
+            "date_effective": datetime.datetime(2024, 3, 15)}
+
+@pytest.fixture
+def wheat_key():
+    return db._latest_price_key({"state": "Rajasthan", "region": "Udaipur", "crop_name": "Wheat"})
+
+@pytest.fixture
+def latest(monkeypatch):
+    collection = FakeLatestPrices()
+    monkeypatch.setattr(db, "latest_prices_collection", collection)
+    return collection
+
+def test_refresh_replaces_recomputed_entries(monkeypatch, latest, wheat_key):
+    monkeypatch.setattr(db, "prices_collection", FakePrices([entry(wheat_key)]))
+    db._refresh_latest_prices([wheat_key, dict(wheat_key)])
+    # Repeated keys are refreshed once
+    assert len(latest.operations) == 1
+    operation = latest.operations[0]
+    assert isinstance(operation, pymongo.ReplaceOne)
+    assert operation._filter == {"_id": wheat_key}
+    assert operation._doc["price"] == 110.0
+    assert operation._upsert
+
+def test_refresh_deletes_entries_without_history(monkeypatch, latest, wheat_key):
+    rice_key = {**wheat_key, "crop_name": "Rice"}
+    monkeypatch.setattr(db, "prices_collection", FakePrices([entry(wheat_key)]))
+    db._refresh_latest_prices([wheat_key, rice_key])
+    deletes = [operation for operation in latest.operations if isinstance(operation, pymongo.DeleteOne)]
+    assert [operation._filter for operation in deletes] == [{"_id": rice_key}]
+
+def test_refresh_matches_rows_without_a_market(monkeypatch, latest, wheat_key):
+    prices = FakePrices([])
+    monkeypatch.setattr(db, "prices_collection", prices)
+    db._refresh_latest_prices([wheat_key, {**wheat_key, "market": "Hiran Magri"}])
+    match = prices.pipelines[0][0]["$match"]["$or"]
+    # market defaults to the region, so rows stored before market existed belong to that entry
+    assert match[0]["market"] == {"$in": ["Udaipur", None]}
+    assert match[1]["market"] == "Hiran Magri"
+
+def test_refresh_without_keys_does_nothing(monkeypatch, latest):
+    db._refresh_latest_prices([])
+    assert latest.operations == []
+
+def test_pipeline_compares_with_the_trend_reference():
+    pipeline = db._latest_prices_pipeline({})
+    lookup = next(stage["$lookup"] for stage in pipeline if "$lookup" in stage)
+    cutoff = lookup["let"]["cutoff"]["$subtract"]
+    assert cutoff == ["$latest.date_effective", db.PRICE_TREND_DAYS * 24 * 3600 * 1000]
+    projected = pipeline[-1]["$project"]
+    assert projected["change"]["$cond"][0] == {"$gt": [{"$ifNull": ["$reference.price", 0]}, 0]}
+    assert projected["trend_days"] == {"$literal": db.PRICE_TREND_DAYS}
+
+@pytest.mark.parametrize("change, trend", [(12.5, "up"), (-4.0, "down"), (0, "stable"), (None, "stable")])
+def test_format_latest_price(change, trend):
+    raw = {
+        "_id": {"state": "S"}, "price_id": "p1", "price": 10.0, "change": change,
+        "location": {"type": "Point", "coordinates": [0, 0]}, "trend_days": db.PRICE_TREND_DAYS,
+        "date_effective": datetime.datetime(2024, 3, 15),
+        "reference_date": datetime.datetime(2024, 3, 8),
+        "created_at": datetime.datetime(2024, 3, 15, 9, 30)
+    }
+    formatted = db._format_latest_price(raw)
+    assert formatted["_id"] == "p1"
+    assert formatted["trend"] == trend
+    assert formatted["change"] == abs(change or 0)
+    assert formatted["reference_date"] == "2024-03-08"
+    assert formatted["created_at"] == "2024-03-15 09:30:00"
+    assert "location" not in formatted and "trend_days" not in formatted
@@ -0,0 +1,222 @@
+import datetime
+import pymongo
+import pytest
+from bson import ObjectId
+import db
+import notification_worker
+
+def matches(doc, query):
+    """The subset of query operators the outbox functions build"""
+    for field, condition in query.items():
+        if field == "$or":
+            if not any(matches(doc, part) for part in condition):
+                return False
+        elif isinstance(condition, dict) and all(key.startswith("$") for key in condition):
+            for operator, value in condition.items():
+                if operator == "$exists" and (field in doc) != value:
+                    return False
+                if operator == "$in" and doc.get(field) not in value:
+                    return False
+                if operator == "$lt" and not (field in doc and doc[field] < value):
+                    return False
+                if operator == "$not" and matches(doc, {field: value}):
+                    return False
+                if operator == "$gt" and not (field in doc and doc[field] > value):
+                    return False
+        elif doc.get(field) != condition:
+            return False
+    return True
+
+class UpdateResult:
+    def __init__(self, matched_count):
+        self.matched_count = matched_count
+
+class InsertResult:
+    def __init__(self, inserted_id):
+        self.inserted_id = inserted_id
+
+class FakeOutbox:
+    def __init__(self, docs=()):
+        self.docs = [dict(doc) for doc in docs]
+
+    @staticmethod
+    def _apply(doc, update):
+        doc.update(update.get("$set", {}))
+        for field, amount in update.get("$inc", {}).items():
+            doc[field] = doc.get(field, 0) + amount
+        for field in update.get("$unset", {}):
+            doc.pop(field, None)
+
+    def insert_one(self, doc):
+        doc = {"_id": ObjectId(), **doc}
+        self.docs.append(doc)
+        return InsertResult(doc["_id"])
+
+    def find_one_and_update(self, query, update, sort=None, return_document=None):
+        found = [doc for doc in self.docs if matches(doc, query)]
+        for field, direction in reversed(sort or []):
+            found.sort(key=lambda doc: doc[field], reverse=direction == pymongo.DESCENDING)
+        if not found:
+            return None
+        self._apply(found[0], update)
+        return dict(found[0])
+
+    def update_one(self, query, update):
+        found = [doc for doc in self.docs if matches(doc, query)][:1]
+        for doc in found:
+            self._apply(doc, update)
+        return UpdateResult(len(found))
+
+    def update_many(self, query, update):
+        found = [doc for doc in self.docs if matches(doc, query)]
+        for doc in found:
+            self._apply(doc, update)
+        return UpdateResult(len(found))
+
+    def get(self, job_id):
+        return next(doc for doc in self.docs if doc["_id"] == job_id)
+
+NOW = datetime.datetime.utcnow()
+
+def pending(minutes_ago, region="Pune", **fields):
+    return {
+        "_id": ObjectId(), "region": region, "notification_type": "market_price",
+        "notification_data": {"crop_name": "Wheat", "price": 22}, "status": "pending", "attempts": 0,
+        "created_at": NOW - datetime.timedelta(minutes=minutes_ago),
+        "not_before": NOW - datetime.timedelta(minutes=minutes_ago - 1), **fields
+    }
+
+@pytest.fixture
+def outbox(monkeypatch):
+    collection = FakeOutbox()
+    monkeypatch.setattr(db, "notification_outbox_collection", collection)
+    return collection
+
+def test_claim_takes_the_oldest_due_job_under_a_new_lease(outbox):
+    later, oldest = pending(5), pending(10)
+    not_due = pending(20, not_before=NOW + datetime.timedelta(minutes=1))
+    outbox.docs += [later, oldest, not_due]
+    job = db.claim_notification_job()
+    assert job["_id"] == oldest["_id"]
+    assert job["status"] == "processing" and job["attempts"] == 1
+    assert isinstance(job["lease_id"], ObjectId)
+    assert db.claim_notification_job()["_id"] == later["_id"]
+    assert db.claim_notification_job() is None
+
+def test_claim_takes_over_an_expired_lease(outbox):
+    expired_lease = ObjectId()
+    outbox.docs.append(pending(10, status="processing", lease_id=expired_lease, attempts=1,
+                                lease_expires_at=NOW - datetime.timedelta(seconds=1)))
+    job = db.claim_notification_job()
+    assert job["attempts"] == 2
+    assert job["lease_id"] != expired_lease and job["lease_expires_at"] > NOW
+    # A live lease is not taken over
+    assert db.claim_notification_job() is None
+
+def test_checkpoint_after_takeover_raises_lease_lost(outbox):
+    outbox.docs.append(pending(10))
+    job = db.claim_notification_job()
+    db.checkpoint_notification_job(job, ObjectId(), {"sent": 1})
+    assert outbox.get(job["_id"])["progress"]["stats"] == {"sent": 1}
+
+    # Another worker claims the job once the lease has run out
+    outbox.get(job["_id"])["lease_expires_at"] = NOW - datetime.timedelta(seconds=1)
+    assert db.claim_notification_job()["_id"] == job["_id"]
+    with pytest.raises(db.NotificationLeaseLost):
+        db.checkpoint_notification_job(job, ObjectId(), {"sent": 2})
+    with pytest.raises(db.NotificationLeaseLost):
+        db.merge_notification_jobs(job, [], [])
+
+def test_coalescing_skips_other_regions_resumed_and_targeted_jobs(outbox):
+    leader, queued = pending(10), pending(9, not_before=NOW + datetime.timedelta(minutes=1))
+    outbox.docs += [leader, queued, pending(8, region="Nashik"), pending(7, progress={"last_user_id": ObjectId()}),
+                    pending(6, user_ids=[ObjectId()])]
+    job = db.claim_notification_job()
+    merged = db.claim_coalesced_notification_jobs(job, 10)
+    # Jobs still inside their coalescing window are merged too
+    assert [doc["_id"] for doc in merged] == [queued["_id"]]
+    assert merged[0]["coalesced_into"] == leader["_id"]
+
+def test_coalescing_stops_at_max_jobs(outbox):
+    outbox.docs += [pending(10 - index) for index in range(5)]
+    job = db.claim_notification_job()
+    assert len(db.claim_coalesced_notification_jobs(job, 2)) == 2
+
+def test_failed_job_is_retried_with_backoff_then_given_up(outbox, monkeypatch):
+    monkeypatch.setattr(db, "NOTIFICATION_RETRY_BACKOFF", 30)
+    outbox.docs.append(pending(10))
+    for attempt in range(1, db.NOTIFICATION_MAX_ATTEMPTS):
+        job = db.claim_notification_job()
+        db.finish_notification_job(job, {}, error="push service down")
+        stored = outbox.get(job["_id"])
+        assert stored["status"] == "pending" and "lease_id" not in stored
+        delay = (stored["not_before"] - datetime.datetime.utcnow()).total_seconds()
+        assert delay == pytest.approx(30 * 2 ** (attempt - 1), abs=5)
+        stored["not_before"] = NOW
+
+    job = db.claim_notification_job()
+    db.finish_notification_job(job, {}, error="push service down")
+    assert outbox.get(job["_id"])["status"] == "failed"
+
+def test_requeue_stops_after_max_deferrals(outbox):
+    job = pending(10, deferrals=db.NOTIFICATION_MAX_DEFERRALS - 1)
+    user_ids = [ObjectId()]
+    deferred_id = db.requeue_notification(job, [job["notification_data"]], user_ids, 600)
+    deferred = outbox.get(ObjectId(deferred_id))
+    assert deferred["user_ids"] == user_ids and deferred["deferred_from"] == job["_id"]
+    assert deferred["not_before"] > NOW + datetime.timedelta(seconds=590)
+    assert db.requeue_notification(deferred, deferred["items"], user_ids, 600) is None
+
+@pytest.fixture
+def worker(monkeypatch):
+    """process_job wired to the fake outbox with the fan-out recorded instead of sent"""
+    for name in ("claim_coalesced_notification_jobs", "merge_notification_jobs",
+                 "checkpoint_notification_job", "finish_notification_job", "requeue_notification"):
+        monkeypatch.setattr(notification_worker, name, getattr(db, name))
+    fan_outs = []
+
+    def notify_digest_in_region(region, items, notification_type, **kwargs):
+        fan_outs.append({"region": region, "items": items, **kwargs})
+        kwargs["checkpoint"](ObjectId(), {"sent": 1})
+        return {"sent": 1}
+
+    monkeypatch.setattr(notification_worker.PushNotification, "notify_digest_in_region",
+                        staticmethod(notify_digest_in_region))
+    return fan_outs
+
+def test_process_job_merges_queued_jobs_into_one_digest(outbox, worker):
+    first, second = pending(10), pending(9, notification_data={"crop_name": "Rice", "price": 30})
+    outbox.docs += [first, second]
+    notification_worker.process_job(db.claim_notification_job())
+    assert len(worker) == 1
+    assert [item["crop_name"] for item in worker[0]["items"]] == ["Wheat", "Rice"]
+    assert outbox.get(first["_id"])["status"] == "completed"
+    assert outbox.get(first["_id"])["stats"]["coalesced"] == 2
+    assert outbox.get(second["_id"])["stats"] == {"coalesced_into": str(first["_id"])}
+
+def test_process_job_resumes_from_its_checkpoint(outbox, worker):
+    last_user_id = ObjectId()
+    items = [{"crop_name": "Onion", "price": 18}]
+    outbox.docs += [pending(10, items=items, progress={"last_user_id": last_user_id, "stats": {"sent": 5}}),
+                    pending(9)]
+    notification_worker.process_job(db.claim_notification_job())
+    # The stored digest is resent as it was and no other job is merged in
+    assert worker[0]["items"] == items
+    assert worker[0]["after_user_id"] == last_user_id
+    assert worker[0]["stats"] == {"sent": 5}
+    assert outbox.docs[1]["status"] == "pending"
+
+def test_process_job_sends_a_deferred_job_only_to_its_users(outbox, worker):
+    user_ids = [ObjectId()]
+    outbox.docs += [pending(10, user_ids=user_ids), pending(9)]
+    notification_worker.process_job(db.claim_notification_job())
+    assert worker[0]["user_ids"] == user_ids
+    assert outbox.docs[1]["status"] == "pending"
+
+def test_process_job_stops_when_the_lease_is_lost(outbox, worker):
+    outbox.docs.append(pending(10))
+    job = db.claim_notification_job()
+    outbox.get(job["_id"])["lease_id"] = ObjectId()
+    notification_worker.process_job(job)
+    # The job belongs to the other worker, which finishes it
+    assert worker == [] and outbox.get(job["_id"])["status"] == "processing"
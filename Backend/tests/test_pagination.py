@@ -0,0 +1,85 @@
+import datetime
+import pymongo
+import pytest
+from bson import ObjectId
+from db import MAX_PAGE_SIZE, _paginate, clamp_limit, decode_cursor, encode_cursor
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, keys):
+        for field, direction in reversed(keys):
+            self.docs.sort(key=lambda doc: doc[field], reverse=direction == pymongo.DESCENDING)
+        return self
+
+    def limit(self, count):
+        self.docs = self.docs[:count]
+        return self
+
+    def __iter__(self):
+        return iter(self.docs)
+
+def matches(doc, query):
+    """The subset of query operators _paginate builds"""
+    for field, condition in query.items():
+        if field == "$and":
+            if not all(matches(doc, part) for part in condition):
+                return False
+        elif field == "$or":
+            if not any(matches(doc, part) for part in condition):
+                return False
+        elif isinstance(condition, dict):
+            for operator, value in condition.items():
+                if operator == "$lt" and not doc[field] < value:
+                    return False
+                if operator == "$gt" and not doc[field] > value:
+                    return False
+        elif doc.get(field) != condition:
+            return False
+    return True
+
+class FakeCollection:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, query, projection=None):
+        return FakeCursor([dict(doc) for doc in self.docs if matches(doc, query)])
+
+@pytest.fixture
+def collection():
+    start = datetime.datetime(2024, 3, 1)
+    # Several documents share a created_at so pages have to break ties on _id
+    return FakeCollection([
+        {"_id": ObjectId(), "created_at": start + datetime.timedelta(days=index // 3), "status": "active"}
+        for index in range(10)
+    ])
+
+def test_cursor_round_trip():
+    sort_value, doc_id = datetime.datetime(2024, 3, 1, 12, 30), ObjectId()
+    assert decode_cursor(encode_cursor(sort_value, doc_id)) == (sort_value, doc_id)
+
+def test_malformed_cursor_raises_value_error():
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+def test_clamp_limit():
+    assert clamp_limit(0) == clamp_limit(None)
+    assert clamp_limit(-5) == 1
+    assert clamp_limit(10 ** 6) == MAX_PAGE_SIZE
+
+@pytest.mark.parametrize("direction", [pymongo.ASCENDING, pymongo.DESCENDING])
+def test_pages_cover_every_document_once(collection, direction):
+    expected = list(collection.find({}).sort([("created_at", direction), ("_id", direction)]))
+    seen, cursor = [], None
+    while True:
+        page, cursor = _paginate(collection, {"status": "active"}, "created_at", direction, 4, cursor)
+        seen += page
+        if cursor is None:
+            break
+    assert [doc["_id"] for doc in seen] == [doc["_id"] for doc in expected]
+
+def test_no_limit_or_cursor_returns_everything(collection):
+    docs, cursor = _paginate(collection, {}, "_id", pymongo.ASCENDING)
+    assert len(docs) == 10
+    assert cursor is None
@@ -0,0 +1,100 @@
+import datetime
+import io
+import pytest
+import price_import
+from price_import import detect_format, read_rows, validate_row
+
+VALID_ROW = {
+    "crop_name": " Wheat ",
+    "price": "2150.5",
+    "state": "Maharashtra",
+    "region": "Pune",
+    "date_effective": "2024-03-15"
+}
+
+@pytest.mark.parametrize("filename, requested, expected", [
+    ("prices.csv", None, "csv"),
+    ("prices.CSV", None, "csv"),
+    ("prices.jsonl", None, "jsonl"),
+    ("prices.ndjson", None, "jsonl"),
+    ("prices.json", None, "jsonl"),
+    ("prices.txt", "csv", "csv"),
+    ("prices.csv", "JSONL", "jsonl"),
+    ("prices.xlsx", None, None),
+    ("prices", None, None),
+])
+def test_detect_format(filename, requested, expected):
+    assert detect_format(filename, requested) == expected
+
+def test_validate_row_normalises_fields():
+    price_data = validate_row(VALID_ROW)
+    assert price_data == {
+        "crop_name": "Wheat",
+        "price": 2150.5,
+        "state": "Maharashtra",
+        "region": "Pune",
+        "market": "Pune",
+        "date_effective": datetime.datetime(2024, 3, 15)
+    }
+
+def test_validate_row_keeps_market_coordinates_and_image():
+    price_data = validate_row({**VALID_ROW, "market": "Hadapsar", "latitude": "18.5", "longitude": 73.9,
+                               "image_url": "https://example.com/wheat.jpg"})
+    assert price_data["market"] == "Hadapsar"
+    assert (price_data["latitude"], price_data["longitude"]) == (18.5, 73.9)
+    assert price_data["image_url"] == "https://example.com/wheat.jpg"
+
+def test_validate_row_treats_blank_coordinates_as_missing():
+    assert "latitude" not in validate_row({**VALID_ROW, "latitude": "", "longitude": " "})
+
+@pytest.mark.parametrize("changes, message", [
+    ({"crop_name": ""}, "Missing required fields: crop_name"),
+    ({"price": "abc"}, "Invalid price format"),
+    ({"price": "0"}, "Price must be greater than 0"),
+    ({"price": "nan"}, "Invalid price format"),
+    ({"price": "inf"}, "Invalid price format"),
+    ({"latitude": "nan", "longitude": "73.9"}, "Invalid latitude or longitude"),
+    ({"latitude": "18.5", "longitude": "-inf"}, "Invalid latitude or longitude"),
+    ({"date_effective": "15/03/2024"}, "Invalid date format"),
+    ({"latitude": "18.5"}, "latitude and longitude must be given together"),
+    ({"latitude": "north", "longitude": "73.9"}, "Invalid latitude or longitude"),
+    ({"latitude": "95", "longitude": "73.9"}, "out of range"),
+])
+def test_validate_row_rejects_bad_rows(changes, message):
+    with pytest.raises(ValueError, match=message):
+        validate_row({**VALID_ROW, **changes})
+
+def test_read_rows_reports_bad_jsonl_lines():
+    stream = io.BytesIO(b'{"crop_name": "Wheat"}\n\nnot json\n[1, 2]\n')
+    rows = list(read_rows(stream, "jsonl"))
+    assert rows[0] == (1, {"crop_name": "Wheat"}, None)
+    assert rows[1][0] == 3 and rows[1][2].startswith("Invalid JSON")
+    assert rows[2] == (4, None, "Each line must be a JSON object")
+
+def test_import_digest_uses_latest_date_per_crop(monkeypatch):
+    monkeypatch.setattr(price_import, "bulk_upsert_prices", lambda rows: {"inserted": len(rows), "updated": 0})
+    digests = {}
+    monkeypatch.setattr(price_import, "enqueue_notification",
+                        lambda region, data, notification_type, items: digests.setdefault(region, items))
+    sheet = (
+        "crop_name,price,state,region,date_effective\n"
+        "Wheat,2200,Maharashtra,Pune,2024-03-15\n"
+        "Wheat,2100,Maharashtra,Pune,2024-03-14\n"
+        "Rice,3000,Maharashtra,Pune,2024-03-15\n"
+    )
+    report = price_import.import_prices(io.BytesIO(sheet.encode()), "csv", chunk_size=1)
+    assert report["inserted"] == 3
+    assert {item["crop_name"]: item["price"] for item in digests["Pune"]} == {"Wheat": 2200.0, "Rice": 3000.0}
+
+def test_import_keeps_same_market_name_in_different_states(monkeypatch):
+    upserted = []
+    monkeypatch.setattr(price_import, "bulk_upsert_prices",
+                        lambda rows: upserted.extend(rows) or {"inserted": len(rows), "updated": 0})
+    monkeypatch.setattr(price_import, "enqueue_notification", lambda region, data, notification_type, items: None)
+    sheet = (
+        "crop_name,price,state,region,date_effective\n"
+        "Rice,3000,Rajasthan,Udaipur,2024-03-15\n"
+        "Rice,2800,Tripura,Udaipur,2024-03-15\n"
+    )
+    price_import.import_prices(io.BytesIO(sheet.encode()), "csv")
+    assert sorted(row["state"] for row in upserted) == ["Rajasthan", "Tripura"]
@@ -0,0 +1,117 @@
+import pytest
+from bson import ObjectId
+import push_notifications
+from push_notifications import PushNotification
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, field, direction):
+        self.docs.sort(key=lambda doc: doc[field], reverse=direction < 0)
+        return self
+
+    def limit(self, count):
+        self.docs = self.docs[:count]
+        return self
+
+    def __iter__(self):
+        return iter(self.docs)
+
+class FakeUsers:
+    """find() applies the _id range notify_digest_in_region pages with"""
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.queries = []
+
+    def find(self, query, projection=None):
+        self.queries.append(dict(query))
+        id_filter = query.get("_id", {})
+        return FakeCursor([
+            {"_id": doc["_id"], "push_subscription": doc["push_subscription"]} for doc in self.docs
+            if doc["region"] == query["region"]
+            and ("$gt" not in id_filter or doc["_id"] > id_filter["$gt"])
+            and ("$in" not in id_filter or doc["_id"] in id_filter["$in"])
+        ])
+
+class FakeEngine:
+    """Records each batch; endpoints listed in retry_after are deferred instead of sent"""
+
+    def __init__(self, retry_after=()):
+        self.retry_after = set(retry_after)
+        self.batches = []
+
+    def deliver_many(self, recipients, payload):
+        recipients = list(recipients)
+        self.batches.append((recipients, payload))
+        deferred = [(user_id, 600.0) for user_id, subscription in recipients
+                    if subscription["endpoint"] in self.retry_after]
+        sent = len(recipients) - len(deferred)
+        return {"recipients": len(recipients), "sent": sent, "failed": 0, "pruned": 0,
+                "failure_reasons": {}, "deferred": deferred}
+
+@pytest.fixture
+def users(monkeypatch):
+    docs = [{"_id": ObjectId(), "region": "Pune", "push_subscription": {"endpoint": f"e{index}"}}
+            for index in range(5)]
+    docs.append({"_id": ObjectId(), "region": "Nashik", "push_subscription": {"endpoint": "other"}})
+    collection = FakeUsers(docs)
+    monkeypatch.setattr(push_notifications, "users_collection", collection)
+    monkeypatch.setattr(push_notifications, "NOTIFY_BATCH_SIZE", 2)
+    return collection
+
+@pytest.fixture
+def engine(monkeypatch):
+    engine = FakeEngine()
+    monkeypatch.setattr(push_notifications, "delivery_engine", engine)
+    return engine
+
+ITEMS = [{"crop_name": "Wheat", "price": 22, "region": "Pune"},
+         {"crop_name": "Rice", "price": 30, "change": 4.5, "region": "Pune"}]
+
+def test_digest_is_rendered_once_and_sent_in_batches(users, engine):
+    checkpoints = []
+    stats = PushNotification.notify_digest_in_region(
+        "Pune", ITEMS, "market_price", checkpoint=lambda last_user_id, totals: checkpoints.append(last_user_id))
+    assert stats["recipients"] == stats["sent"] == 5
+    assert [len(recipients) for recipients, _ in engine.batches] == [2, 2, 1]
+    # Every batch carries the same rendered payload object
+    assert len({id(payload) for _, payload in engine.batches}) == 1
+    assert engine.batches[0][1]["notification"]["title"] == "Market Price Updates in Pune"
+    assert checkpoints == [users.docs[1]["_id"], users.docs[3]["_id"], users.docs[4]["_id"]]
+    assert users.queries[0]["push_subscription"] == {"$exists": True}
+
+def test_resume_after_checkpoint_keeps_earlier_totals(users, engine):
+    earlier = {"recipients": 2, "sent": 2, "failed": 0, "pruned": 0, "failure_reasons": {}}
+    stats = PushNotification.notify_digest_in_region(
+        "Pune", ITEMS, "market_price", after_user_id=users.docs[1]["_id"], stats=earlier)
+    assert [user_id for recipients, _ in engine.batches for user_id, _ in recipients] == \
+        [str(doc["_id"]) for doc in users.docs[2:5]]
+    assert stats["sent"] == 5
+
+def test_user_ids_limit_the_fan_out(users, engine):
+    targeted = [users.docs[0]["_id"], users.docs[3]["_id"]]
+    PushNotification.notify_digest_in_region("Pune", ITEMS, "market_price", user_ids=targeted)
+    assert [user_id for recipients, _ in engine.batches for user_id, _ in recipients] == \
+        [str(user_id) for user_id in targeted]
+
+def test_retry_after_sends_are_deferred(users, monkeypatch):
+    engine = FakeEngine(retry_after={"e1", "e4"})
+    monkeypatch.setattr(push_notifications, "delivery_engine", engine)
+    deferrals = []
+    stats = PushNotification.notify_digest_in_region(
+        "Pune", ITEMS, "market_price", defer=lambda user_ids, seconds: deferrals.append((user_ids, seconds)) or True)
+    assert stats["deferred"] == 2 and stats["failed"] == 0
+    assert deferrals == [([users.docs[1]["_id"]], 600.0), ([users.docs[4]["_id"]], 600.0)]
+
+def test_retry_after_counts_as_failed_when_deferral_is_refused(users, monkeypatch):
+    monkeypatch.setattr(push_notifications, "delivery_engine", FakeEngine(retry_after={"e0"}))
+    stats = PushNotification.notify_digest_in_region(
+        "Pune", ITEMS, "market_price", defer=lambda user_ids, seconds: False)
+    assert stats["deferred"] == 0
+    assert stats["failed"] == 1 and stats["failure_reasons"] == {"retry_after": 1}
+
+def test_unknown_type_sends_nothing(users, engine):
+    stats = PushNotification.notify_digest_in_region("Pune", ITEMS, "unknown")
+    assert engine.batches == [] and stats["recipients"] == 0
@@ -0,0 +1,89 @@
+import pytest
+from flask import Flask, g, jsonify
+import cache_utils
+from response_cache import ResponseCache
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setattr(cache_utils, "_subscribers", {})
+    app = Flask(__name__)
+    app.calls = 0
+    response_cache = ResponseCache(ttl=60)
+
+    @app.before_request
+    def read_primary():
+        g.read_primary = app.config.get("READ_PRIMARY", False)
+
+    @app.route("/news")
+    @response_cache.cached("daily_news")
+    def news():
+        app.calls += 1
+        return jsonify({"calls": app.calls})
+
+    @app.route("/missing")
+    @response_cache.cached("daily_news")
+    def missing():
+        app.calls += 1
+        return jsonify({"error": "not found"}), 404
+
+    @app.route("/states")
+    @response_cache.cached("states", cache_control="public, max-age=86400")
+    def states():
+        app.calls += 1
+        return jsonify(["Maharashtra"])
+
+    return app
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+def test_response_is_served_from_cache_with_validators(app, client):
+    first, second = client.get("/news"), client.get("/news")
+    assert app.calls == 1
+    assert first.get_json() == second.get_json() == {"calls": 1}
+    assert first.headers["ETag"] == second.headers["ETag"]
+    assert first.headers["Last-Modified"]
+    assert first.headers["Cache-Control"] == "public, no-cache"
+
+def test_matching_etag_gets_304_without_a_body(client):
+    etag = client.get("/news").headers["ETag"]
+    response = client.get("/news", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+    assert client.get("/news", headers={"If-None-Match": '"stale"'}).status_code == 200
+
+def test_if_modified_since_gets_304(client):
+    last_modified = client.get("/news").headers["Last-Modified"]
+    assert client.get("/news", headers={"If-Modified-Since": last_modified}).status_code == 304
+
+def test_query_arguments_are_cached_separately(app, client):
+    client.get("/news?page=1")
+    client.get("/news?page=2")
+    client.get("/news?page=1")
+    assert app.calls == 2
+
+def test_invalidate_drops_the_namespace(app, client):
+    etag = client.get("/news").headers["ETag"]
+    client.get("/states")
+    cache_utils.invalidate("daily_news")
+    response = client.get("/news", headers={"If-None-Match": etag})
+    assert response.status_code == 200 and response.get_json() == {"calls": 3}
+    assert response.headers["ETag"] != etag
+    # Other namespaces keep their entries
+    client.get("/states")
+    assert app.calls == 3
+
+def test_errors_are_not_cached(app, client):
+    assert client.get("/missing").status_code == 404
+    assert client.get("/missing").status_code == 404
+    assert app.calls == 2
+
+def test_read_primary_bypasses_the_cache(app, client):
+    app.config["READ_PRIMARY"] = True
+    client.get("/news")
+    response = client.get("/news")
+    assert app.calls == 2 and "ETag" not in response.headers
+
+def test_cache_control_per_view(client):
+    assert client.get("/states").headers["Cache-Control"] == "public, max-age=86400"
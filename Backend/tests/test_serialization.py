@@ -0,0 +1,75 @@
+import datetime
+import json
+import pytest
+from bson import ObjectId
+from flask import Flask, jsonify
+import serialization
+from serialization import MongoJSONProvider, default, dumps
+
+OBJECT_ID = ObjectId("65f3c0ffee0000000000abcd")
+DOCUMENT = {
+    "_id": OBJECT_ID,
+    "created_at": datetime.datetime(2024, 3, 15, 9, 30, 5, 123456),
+    "date_effective": datetime.date(2024, 3, 15),
+    "tags": [ObjectId("65f3c0ffee0000000000abce")],
+    "price": 22.5
+}
+EXPECTED = {
+    "_id": "65f3c0ffee0000000000abcd",
+    "created_at": "2024-03-15 09:30:05",
+    "date_effective": "2024-03-15",
+    "tags": ["65f3c0ffee0000000000abce"],
+    "price": 22.5
+}
+
+@pytest.fixture(params=["orjson", "stdlib"])
+def backend(request, monkeypatch):
+    if request.param == "orjson":
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setattr(serialization, "orjson", None)
+    return request.param
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.json = MongoJSONProvider(app)
+    return app
+
+def test_default_encodes_mongo_types():
+    assert default(OBJECT_ID) == "65f3c0ffee0000000000abcd"
+    assert default(datetime.datetime(2024, 3, 15, 9, 30)) == "2024-03-15 09:30:00"
+    assert default(datetime.date(2024, 3, 15)) == "2024-03-15"
+
+def test_default_rejects_unknown_types():
+    with pytest.raises(TypeError):
+        default(object())
+
+def test_dumps_is_compact_and_sorted(backend):
+    encoded = dumps(DOCUMENT)
+    assert json.loads(encoded) == EXPECTED
+    assert encoded.startswith(b'{"_id":"65f3c0ffee0000000000abcd","created_at"')
+
+def test_dumps_keeps_the_api_datetime_format_not_rfc3339(backend):
+    # orjson would emit 2024-03-15T09:30:05.123456 without OPT_PASSTHROUGH_DATETIME
+    assert dumps({"at": DOCUMENT["created_at"]}) == b'{"at":"2024-03-15 09:30:05"}'
+
+def test_jsonify_accepts_raw_documents(app, backend):
+    with app.app_context():
+        response = jsonify(DOCUMENT)
+    assert response.mimetype == "application/json"
+    assert json.loads(response.get_data()) == EXPECTED
+
+def test_jsonify_lists_and_non_string_keys(app, backend):
+    with app.app_context():
+        response = jsonify(prices=[DOCUMENT], counts={2024: 3})
+    assert json.loads(response.get_data()) == {"prices": [EXPECTED], "counts": {"2024": 3}}
+
+def test_dumps_non_string_keys(backend):
+    assert json.loads(dumps({2024: 3})) == {"2024": 3}
+
+def test_debug_mode_keeps_indented_output(app):
+    app.debug = True
+    with app.app_context():
+        body = jsonify(DOCUMENT).get_data(as_text=True)
+    assert '\n  "_id": "65f3c0ffee0000000000abcd"' in body
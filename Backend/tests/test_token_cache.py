@@ -0,0 +1,122 @@
+import time
+import jwt
+import pytest
+import cache_utils
+import token_cache
+from token_cache import BloomFilter, VerifiedTokenCache, hash_token
+
+SECRET = "test-secret-key-for-hs256-signatures"
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    hashes = [hash_token(f"token-{index}") for index in range(1000)]
+    for token_hash in hashes:
+        bloom.add(token_hash)
+    assert all(token_hash in bloom for token_hash in hashes)
+
+def test_bloom_filter_false_positive_rate_near_target():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    for index in range(1000):
+        bloom.add(hash_token(f"token-{index}"))
+    false_positives = sum(hash_token(f"other-{index}") in bloom for index in range(10000))
+    assert false_positives / 10000 < 0.03
+
+def test_empty_bloom_filter_contains_nothing():
+    assert hash_token("token") not in BloomFilter(capacity=100)
+
+@pytest.fixture
+def counted_decode(monkeypatch):
+    calls = []
+    decode = jwt.decode
+
+    def counting_decode(*args, **kwargs):
+        calls.append(args[0])
+        return decode(*args, **kwargs)
+
+    monkeypatch.setattr(token_cache.jwt, "decode", counting_decode)
+    return calls
+
+def test_verified_token_is_decoded_once(counted_decode):
+    cache = VerifiedTokenCache(SECRET)
+    token = jwt.encode({"user_id": "u1", "exp": int(time.time()) + 3600}, SECRET, algorithm="HS256")
+    assert cache.verify(token)["user_id"] == "u1"
+    assert cache.verify(token)["user_id"] == "u1"
+    assert len(counted_decode) == 1
+
+def test_verified_token_expires_at_exp(monkeypatch, counted_decode):
+    cache = VerifiedTokenCache(SECRET, default_ttl=3600)
+    token = jwt.encode({"user_id": "u1", "exp": int(time.time()) + 60}, SECRET, algorithm="HS256")
+    cache.verify(token)
+    # Past the token's exp the cached claims are gone even though default_ttl has not run out
+    start = time.monotonic()
+    monkeypatch.setattr(cache_utils.time, "monotonic", lambda: start + 61)
+    assert cache._claims.get(hash_token(token)) is None
+    cache.verify(token)
+    assert len(counted_decode) == 2
+
+def test_verified_claims_are_copies():
+    cache = VerifiedTokenCache(SECRET)
+    token = jwt.encode({"user_id": "u1", "exp": int(time.time()) + 3600}, SECRET, algorithm="HS256")
+    cache.verify(token)["user_id"] = "changed"
+    assert cache.verify(token)["user_id"] == "u1"
+
+def test_invalid_signature_is_rejected_and_not_cached():
+    cache = VerifiedTokenCache(SECRET)
+    token = jwt.encode({"user_id": "u1", "exp": int(time.time()) + 3600}, "other-secret-key-for-hs256-signatures", algorithm="HS256")
+    with pytest.raises(jwt.InvalidTokenError):
+        cache.verify(token)
+    assert cache.stats()["size"] == 0
+
+class FakeBlacklistCollection:
+    """find / find_one / insert_one over token_hash entries"""
+
+    def __init__(self):
+        self.entries = []
+        self.lookups = 0
+        self.fail_scans = False
+
+    def insert_one(self, entry):
+        self.entries.append(dict(entry))
+
+    def find(self, query, projection=None):
+        if self.fail_scans:
+            raise RuntimeError("MongoDB unavailable")
+        since = query.get("created_at", {}).get("$gt")
+        return [dict(entry) for entry in self.entries if since is None or entry["created_at"] > since]
+
+    def find_one(self, query, projection=None):
+        self.lookups += 1
+        return next((entry for entry in self.entries if entry["token_hash"] == query["token_hash"]), None)
+
+def make_token(user_id: str = "u1") -> str:
+    return jwt.encode({"user_id": user_id, "exp": int(time.time()) + 3600}, SECRET, algorithm="HS256")
+
+def test_revoked_token_is_detected_and_others_skip_mongo():
+    collection = FakeBlacklistCollection()
+    blacklist = token_cache.TokenBlacklist(collection)
+    revoked, other = make_token("u1"), make_token("u2")
+    blacklist.revoke(revoked)
+    assert blacklist.is_revoked(revoked, verified=True)
+    lookups = collection.lookups
+    assert not blacklist.is_revoked(other, verified=True)
+    assert not blacklist.is_revoked(other, verified=True)
+    # A Bloom filter miss needs no MongoDB lookup
+    assert collection.lookups == lookups
+
+def test_failed_first_rebuild_falls_back_to_mongo():
+    collection = FakeBlacklistCollection()
+    token = make_token()
+    collection.insert_one({"token_hash": hash_token(token), "created_at": token_cache.datetime.datetime.utcnow()})
+    collection.fail_scans = True
+    blacklist = token_cache.TokenBlacklist(collection)
+    assert blacklist.is_revoked(token, verified=True)
+
+def test_unverified_tokens_are_not_remembered():
+    collection = FakeBlacklistCollection()
+    blacklist = token_cache.TokenBlacklist(collection)
+    forged = jwt.encode({"user_id": "u1", "exp": int(time.time()) + 10 ** 8}, "forged-key-for-hs256-signatures-xx",
+                        algorithm="HS256")
+    assert not blacklist.is_revoked(forged)
+    assert blacklist._known_good.stats()["size"] == 0
+    assert not blacklist.is_revoked(make_token(), verified=True)
+    assert blacklist._known_good.stats()["size"] == 1
@@ -0,0 +1,99 @@
+import pytest
+from bson import ObjectId
+from flask import Flask
+import db
+from cache_utils import TTLCache
+
+class FakeUsers:
+    """Counts reads so tests can tell cache hits from database round trips"""
+
+    def __init__(self, docs):
+        self.docs = {doc["_id"]: doc for doc in docs}
+        self.reads = 0
+
+    def find_one(self, query):
+        self.reads += 1
+        doc = self.docs.get(query["_id"])
+        return dict(doc) if doc else None
+
+    def find_one_and_update(self, query, update, return_document=None):
+        doc = self.docs.get(query["_id"])
+        if doc is None:
+            return None
+        doc.update(update.get("$set", {}))
+        for field in update.get("$unset", {}):
+            doc.pop(field, None)
+        return dict(doc)
+
+USER_ID = ObjectId()
+
+@pytest.fixture
+def users(monkeypatch):
+    collection = FakeUsers([{"_id": USER_ID, "full_name": "Asha", "region": "Pune"}])
+    monkeypatch.setattr(db, "users_collection", collection)
+    monkeypatch.setattr(db, "_user_cache", TTLCache(maxsize=10, ttl=60))
+    return collection
+
+@pytest.fixture
+def app():
+    return Flask(__name__)
+
+def test_process_cache_serves_repeated_reads(users):
+    assert db.get_user(str(USER_ID))["full_name"] == "Asha"
+    assert db.get_user(USER_ID)["full_name"] == "Asha"
+    assert users.reads == 1
+
+def test_fresh_read_skips_the_caches(users, app):
+    db.get_user(str(USER_ID))
+    with app.test_request_context():
+        db.get_user(str(USER_ID))
+        db.get_user(str(USER_ID), fresh=True)
+    assert users.reads == 2
+
+def test_request_memo_outlives_process_cache_eviction(users, app):
+    with app.test_request_context():
+        db.get_user(str(USER_ID))
+        db._user_cache.clear()
+        db.get_user(str(USER_ID))
+        assert users.reads == 1
+    # A new request has its own memo
+    with app.test_request_context():
+        db.get_user(str(USER_ID))
+    assert users.reads == 2
+
+def test_update_user_refreshes_both_caches(users, app):
+    with app.test_request_context():
+        db.get_user(str(USER_ID))
+        db.update_user(str(USER_ID), {"region": "Nashik"}, unset=["full_name"])
+        user = db.get_user(str(USER_ID))
+        assert user["region"] == "Nashik" and "full_name" not in user
+    assert db.get_user(str(USER_ID))["region"] == "Nashik"
+    assert users.reads == 1
+
+def test_invalidate_user_forces_a_read(users, app):
+    with app.test_request_context():
+        db.get_user(str(USER_ID))
+        users.docs[USER_ID]["region"] = "Nashik"
+        db.invalidate_user(USER_ID)
+        assert db.get_user(str(USER_ID))["region"] == "Nashik"
+    assert users.reads == 2
+
+def test_missing_user_is_not_cached(users):
+    missing = str(ObjectId())
+    assert db.get_user(missing) is None
+    assert db.get_user(missing) is None
+    assert users.reads == 2
+
+def test_update_of_missing_user_drops_cached_copy(users):
+    db.get_user(str(USER_ID))
+    del users.docs[USER_ID]
+    assert db.update_user(str(USER_ID), {"region": "Nashik"}) is None
+    assert db.get_user(str(USER_ID)) is None
+
+def test_request_memo_only_exists_inside_a_request(users, app):
+    assert db._request_users() is None
+    db._remember_user(str(USER_ID), {"_id": USER_ID})
+    with app.test_request_context():
+        db._remember_user(str(USER_ID), {"_id": USER_ID})
+        assert db._request_users() == {str(USER_ID): {"_id": USER_ID}}
+    assert db._user_cache.get(str(USER_ID)) == {"_id": USER_ID}
@@ -0,0 +1,212 @@
+import datetime
+import hashlib
+import logging
+import math
+import threading
+import time
+from typing import Optional
+import jwt
+from pymongo import ASCENDING, IndexModel
+from pymongo.collection import Collection
+from cache_utils import TTLCache
+
+logger = logging.getLogger(__name__)
+
+def hash_token(token: str) -> str:
+    """Return the SHA-256 hex digest stored in place of the raw token"""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def get_token_expiry(token: str) -> Optional[float]:
+    """Read the exp claim without verifying the signature (token_required verifies it)"""
+    try:
+        exp = jwt.decode(token, options={"verify_signature": False}).get("exp")
+        return float(exp) if exp is not None else None
+    except Exception:
+        return None
+
+class VerifiedTokenCache:
+    """Claims of tokens whose signature has already been verified.
+
+    Keyed on the token hash and kept until the token's exp, so a token is
+    verified once per process instead of on every request. Revocation is
+    still checked separately on each request by TokenBlacklist.
+    """
+
+    def __init__(self, secret_key: str, algorithms=("HS256",), maxsize: int = 10000,
+                 default_ttl: float = 300):
+        self.secret_key = secret_key
+        self.algorithms = list(algorithms)
+        self.default_ttl = default_ttl
+        self._claims = TTLCache(maxsize=maxsize, ttl=default_ttl)
+
+    def verify(self, token: str) -> dict:
+        """Return the token's claims, raising jwt.InvalidTokenError (or ExpiredSignatureError)"""
+        token_hash = hash_token(token)
+        claims = self._claims.get(token_hash)
+        if claims is None:
+            claims = jwt.decode(token, self.secret_key, algorithms=self.algorithms)
+            exp = claims.get("exp")
+            self._claims.set(token_hash, claims, expires_at=float(exp) if exp is not None else None)
+        # Callers get their own copy so request handlers cannot alter the cached claims
+        return dict(claims)
+
+    def forget(self, token: str) -> None:
+        self._claims.pop(hash_token(token))
+
+    def stats(self) -> dict:
+        return self._claims.stats()
+
+class BloomFilter:
+    """Bloom filter over token hashes (no false negatives)"""
+
+    def __init__(self, capacity: int = 100000, error_rate: float = 0.001):
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.hash_count = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, token_hash: str):
+        # Double hashing on two 64-bit halves of the SHA-256 digest
+        h1 = int(token_hash[:16], 16)
+        h2 = int(token_hash[16:32], 16) | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, token_hash: str) -> None:
+        for position in self._positions(token_hash):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, token_hash: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(token_hash))
+
+class TokenBlacklist:
+    """Revoked token store with an in-process front.
+
+    Verified tokens known not to be revoked are kept in an LRU until their
+    exp, and revoked token hashes are mirrored into a Bloom filter refreshed
+    incrementally from the collection, so only Bloom filter hits reach MongoDB.
+    Until the filter has been built once every check goes to MongoDB.
+    """
+
+    INDEXES = [
+        IndexModel([("token_hash", ASCENDING)], name="token_hash_1"),
+        IndexModel([("created_at", ASCENDING)], name="created_at_1"),
+        # Remove entries once the token itself has expired
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ]
+
+    def __init__(self, collection: Collection, refresh_interval: float = 5,
+                 rebuild_interval: float = 3600, cache_size: int = 10000,
+                 default_ttl: float = 300, capacity: int = 100000):
+        self.collection = collection
+        self.refresh_interval = refresh_interval
+        self.rebuild_interval = rebuild_interval
+        self.default_ttl = default_ttl
+        self.capacity = capacity
+        self._known_good = TTLCache(maxsize=cache_size, ttl=default_ttl)
+        self._bloom = BloomFilter(capacity)
+        self._watermark: Optional[datetime.datetime] = None
+        self._last_refresh = 0.0
+        self._last_rebuild = 0.0
+        self._refresh_lock = threading.Lock()
+
+    def revoke(self, token: str) -> None:
+        """Add a token to the blacklist"""
+        token_hash = hash_token(token)
+        exp = get_token_expiry(token)
+        entry = {
+            "token_hash": token_hash,
+            "created_at": datetime.datetime.utcnow()
+        }
+        if exp is not None:
+            entry["expires_at"] = datetime.datetime.utcfromtimestamp(exp)
+        self.collection.insert_one(entry)
+        self._bloom.add(token_hash)
+        self._known_good.pop(token_hash)
+
+    def is_revoked(self, token: str, verified: bool = False) -> bool:
+        """Check whether a token has been revoked.
+
+        Only tokens whose signature the caller has verified are remembered as
+        not revoked, since their exp is read from the unverified payload.
+        """
+        token_hash = hash_token(token)
+        self._maybe_refresh()
+
+        if self._known_good.get(token_hash):
+            return False
+
+        # Without a built filter a miss proves nothing
+        if self._watermark is not None and token_hash not in self._bloom:
+            revoked = False
+        else:
+            revoked = self.collection.find_one({"token_hash": token_hash}, {"_id": 1}) is not None
+        if not revoked and verified:
+            self._known_good.set(token_hash, True, expires_at=get_token_expiry(token))
+        return revoked
+
+    def _maybe_refresh(self) -> None:
+        now = time.monotonic()
+        if now - self._last_refresh < self.refresh_interval:
+            return
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            if self._watermark is None or now - self._last_rebuild >= self.rebuild_interval:
+                self._rebuild()
+            else:
+                self._refresh()
+            self._last_refresh = now
+        except Exception:
+            logger.exception("Error refreshing token blacklist")
+        finally:
+            self._refresh_lock.release()
+
+    def _refresh(self) -> None:
+        """Pull revocations written since the last refresh (by any worker)"""
+        # Overlap the window so inserts from workers with slightly skewed clocks are not missed
+        since = self._watermark - datetime.timedelta(seconds=2 * self.refresh_interval)
+        for entry in self.collection.find({"created_at": {"$gt": since}},
+                                          {"token_hash": 1, "token": 1, "created_at": 1}):
+            self._add_entry(entry)
+
+    def _rebuild(self) -> None:
+        """Rebuild the Bloom filter from scratch so expired hashes drop out"""
+        bloom = BloomFilter(self.capacity)
+        watermark = self._watermark
+        for entry in self.collection.find({}, {"token_hash": 1, "token": 1, "created_at": 1}):
+            # Entries written before migrate_raw_tokens has run still carry the raw token
+            token_hash = entry.get("token_hash") or hash_token(entry["token"])
+            bloom.add(token_hash)
+            self._known_good.pop(token_hash)
+            if watermark is None or entry["created_at"] > watermark:
+                watermark = entry["created_at"]
+        self._bloom = bloom
+        self._watermark = watermark or datetime.datetime.utcnow()
+        self._last_rebuild = time.monotonic()
+
+    def _add_entry(self, entry: dict) -> None:
+        token_hash = entry.get("token_hash") or hash_token(entry["token"])
+        self._bloom.add(token_hash)
+        self._known_good.pop(token_hash)
+        if entry["created_at"] > self._watermark:
+            self._watermark = entry["created_at"]
+
+    def migrate_raw_tokens(self) -> int:
+        """Replace raw tokens written by older versions with their hash.
+
+        A one-off migration run through db.run_once from boot maintenance or
+        the db.py CLI; returns the number of entries rewritten.
+        """
+        migrated = 0
+        for entry in self.collection.find({"token": {"$exists": True}}, {"token": 1}):
+            update = {"token_hash": hash_token(entry["token"])}
+            exp = get_token_expiry(entry["token"])
+            if exp is not None:
+                update["expires_at"] = datetime.datetime.utcfromtimestamp(exp)
+            self.collection.update_one(
+                {"_id": entry["_id"]},
+                {"$set": update, "$unset": {"token": ""}}
+            )
+            migrated += 1
+        return migrated
+
@@ -0,0 +1,403 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+from cache_utils import TTLCache
+from http_utils import (
+    CircuitBreaker, CircuitOpenError, create_session, request_with_retries, retry_after_seconds
+)
+
+logger = logging.getLogger(__name__)
+
+OPENWEATHER_URL = "https://api.openweathermap.org/data/2.5"
+
+# Provider update cadence: current conditions every ~10 minutes, forecast every 3 hours
+CURRENT_TTL = 10 * 60
+FORECAST_TTL = 3 * 60 * 60
+# How long past its TTL an entry may still be served while it is refreshed
+STALE_TTL_FACTOR = 6
+# Oldest data kept around as a fallback while the provider is down
+MAX_CACHE_AGE = 24 * 60 * 60
+
+class WeatherProviderError(Exception):
+    """Raised when OpenWeatherMap returns an error response"""
+
+_GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+def geohash_cell(lat: float, lon: float, precision: int = 5) -> Tuple[str, float, float]:
+    """Return the geohash of a point and the center of its cell"""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        interval, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            interval[0] = mid
+        else:
+            interval[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_GEOHASH_ALPHABET[bits])
+            bits, bit_count = 0, 0
+    center_lat = round((lat_range[0] + lat_range[1]) / 2, 4)
+    center_lon = round((lon_range[0] + lon_range[1]) / 2, 4)
+    return "".join(chars), center_lat, center_lon
+
+class InProcessWeatherBackend:
+    """Weather cache held in this worker's memory"""
+
+    def __init__(self, maxsize: int = 4096):
+        self._cache = TTLCache(maxsize=maxsize)
+
+    def get(self, key: str) -> Optional[Dict]:
+        return self._cache.get(key)
+
+    def set(self, key: str, entry: Dict, ttl: float) -> None:
+        self._cache.set(key, entry, ttl=ttl)
+
+class RedisWeatherBackend:
+    """Weather cache shared by all workers through Redis"""
+
+    def __init__(self, url: str):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> Optional[Dict]:
+        value = self._redis.get(f"weather:{key}")
+        return json.loads(value) if value else None
+
+    def set(self, key: str, entry: Dict, ttl: float) -> None:
+        self._redis.set(f"weather:{key}", json.dumps(entry), ex=int(ttl))
+
+def create_weather_backend():
+    """Use Redis when WEATHER_CACHE_REDIS_URL is set and redis is installed"""
+    url = os.getenv("WEATHER_CACHE_REDIS_URL")
+    if url:
+        try:
+            return RedisWeatherBackend(url)
+        except ImportError:
+            logger.warning("redis package not installed, using in-process weather cache")
+    return InProcessWeatherBackend()
+
+class WeatherService:
+    """OpenWeatherMap client with a stale-while-revalidate cache.
+
+    Coordinates are snapped to a geohash cell so nearby farmers share cache
+    entries. Current conditions and forecast are cached separately with
+    their own TTLs; a stale entry is served immediately while a background
+    thread refreshes it. Both upstream calls go out concurrently over one
+    pooled session, and while the provider is failing a circuit breaker
+    answers from whatever cached data exists.
+    """
+
+    def __init__(self, backend, precision: int = 5):
+        self.backend = backend
+        self.precision = precision
+        self.session = create_session(pool_maxsize=20)
+        self.breaker = CircuitBreaker("openweathermap")
+        self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="weather")
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def get_agricultural_weather(self, lat: float, lon: float, api_key: str) -> Dict:
+        cell, cell_lat, cell_lon = geohash_cell(lat, lon, self.precision)
+        kinds = {"weather": CURRENT_TTL, "forecast": FORECAST_TTL}
+
+        entries, pending = {}, {}
+        for kind, ttl in kinds.items():
+            key = f"{kind}:{cell}"
+            entry = self.backend.get(key)
+            age = time.time() - entry["fetched_at"] if entry else None
+            if entry is not None and age <= ttl * STALE_TTL_FACTOR:
+                if age > ttl:
+                    self._refresh_in_background(kind, key, cell_lat, cell_lon, api_key)
+                entries[kind] = entry
+            else:
+                pending[kind] = self._executor.submit(
+                    self._fetch_and_store, kind, key, cell_lat, cell_lon, api_key
+                )
+
+        for kind, future in pending.items():
+            try:
+                entries[kind] = future.result()
+            except Exception as e:
+                # Provider down: fall back to an older cached value if there is one
+                fallback = self.backend.get(f"{kind}:{cell}")
+                if fallback is None:
+                    raise
+                logger.warning(f"Serving cached {kind} data for {cell}: {e}")
+                entries[kind] = fallback
+
+        current, forecast = entries["weather"], entries["forecast"]
+
+        # Reuse the processed payload while neither component has changed
+        key = f"combined:{cell}"
+        combined = self.backend.get(key)
+        version = [current["fetched_at"], forecast["fetched_at"]]
+        if combined and combined["version"] == version:
+            return combined["value"]
+
+        value = build_agricultural_weather(current["value"], forecast["value"])
+        self.backend.set(key, {"version": version, "value": value}, MAX_CACHE_AGE)
+        return value
+
+    def _fetch_and_store(self, kind: str, key: str, lat: float, lon: float, api_key: str) -> Dict:
+        entry = {"value": self._fetch(kind, lat, lon, api_key), "fetched_at": time.time()}
+        self.backend.set(key, entry, MAX_CACHE_AGE)
+        return entry
+
+    def _refresh_in_background(self, kind: str, key: str, lat: float, lon: float, api_key: str) -> None:
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self._fetch_and_store(kind, key, lat, lon, api_key)
+            except Exception as e:
+                logger.warning(f"Background weather refresh failed for {key}: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._executor.submit(refresh)
+
+    def _fetch(self, kind: str, lat: float, lon: float, api_key: str) -> Dict:
+        try:
+            return self.breaker.call(self._request, kind, lat, lon, api_key)
+        except CircuitOpenError as e:
+            raise WeatherProviderError(str(e))
+
+    def _request(self, kind: str, lat: float, lon: float, api_key: str) -> Dict:
+        logger.info(f"Fetching {kind} data from OpenWeatherMap API")
+        start = time.perf_counter()
+        try:
+            response = request_with_retries(
+                self.session, "GET", f"{OPENWEATHER_URL}/{kind}",
+                params={"lat": lat, "lon": lon, "appid": api_key, "units": "metric"},
+                timeout=(3.05, 5)
+            )
+        finally:
+            metrics.histogram(f"weather.upstream.{kind}_ms").observe((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            metrics.increment(f"weather.upstream.{kind}.errors")
+            retry_after = retry_after_seconds(response)
+            if retry_after:
+                # Stop calling the provider for as long as it asked
+                self.breaker.trip(retry_after)
+            raise WeatherProviderError(f"OpenWeatherMap API error - {kind} status: {response.status_code}")
+        return response.json()
+
+def build_agricultural_weather(weather_data: Dict, forecast_data: Dict) -> Dict:
+    """Combine current conditions and forecast into the /weather payload"""
+    # Calculate agricultural metrics
+    agricultural_metrics = {
+        "growing_degree_days": max(0, (weather_data["main"]["temp_max"] + weather_data["main"]["temp_min"]) / 2 - 10),
+        "evapotranspiration": calculate_evapotranspiration(weather_data),
+        "frost_risk": "High" if weather_data["main"]["temp"] < 2 else "Low",
+        "irrigation_need": calculate_irrigation_need(weather_data)
+    }
+
+    # Format forecast data
+    formatted_forecast = [
+        {
+            "date": item["dt_txt"],
+            "temperature": item["main"]["temp"],
+            "humidity": item["main"]["humidity"],
+            "description": item["weather"][0]["description"],
+            "wind_speed": item["wind"]["speed"],
+            "rainfall_chance": item["pop"] * 100  # Probability of precipitation
+        }
+        for item in forecast_data["list"][:8]  # Next 24 hours (3-hour intervals)
+    ]
+
+    # Generate farming advice
+    farming_advice = generate_farming_advice(weather_data, forecast_data)
+
+    # Combine all data
+    return {
+        "current": {
+            "temperature": weather_data["main"]["temp"],
+            "humidity": weather_data["main"]["humidity"],
+            "wind_speed": weather_data["wind"]["speed"],
+            "description": weather_data["weather"][0]["description"],
+            "rainfall": weather_data.get("rain", {}).get("1h", 0),
+            "soil_temp": weather_data["main"]["temp"] - 2,  # Approximate soil temperature
+        },
+        "agricultural_metrics": agricultural_metrics,
+        "forecast": formatted_forecast,
+        "farming_advice": {
+            "risk_indicator": farming_advice["risk_indicator"],
+            "weather_summary": farming_advice["weather_summary"],
+            "recommendations": farming_advice["advice"]
+        }
+    }
+
+def calculate_evapotranspiration(weather_data):
+    """Simple estimation of evapotranspiration"""
+    temp = weather_data["main"]["temp"]
+    humidity = weather_data["main"]["humidity"]
+    wind_speed = weather_data["wind"]["speed"]
+    
+    # Basic estimation formula
+    et = (0.0023 * (temp + 17.8) * (max(0, temp - 0.0) ** 0.5)) * (100 - humidity) / 100
+    return round(max(0, et), 2)
+
+def calculate_irrigation_need(weather_data):
+    """Calculate irrigation needs based on weather"""
+    temp = weather_data["main"]["temp"]
+    humidity = weather_data["main"]["humidity"]
+    rainfall = weather_data.get("rain", {}).get("1h", 0)
+    
+    if rainfall > 5:
+        return "No irrigation needed - Recent rainfall sufficient"
+    elif temp > 30 and humidity < 50:
+        return "High - Consider immediate irrigation"
+    elif temp > 25:
+        return "Moderate - Monitor soil moisture"
+    else:
+        return "Low - Regular schedule adequate"
+
+def generate_farming_advice(weather_data, forecast_data):
+    """Generate AI-based farming advice based on current weather conditions and forecast"""
+    try:
+        temp = weather_data["main"]["temp"]
+        humidity = weather_data["main"]["humidity"]
+        wind_speed = weather_data["wind"]["speed"]
+        description = weather_data["weather"][0]["description"]
+        rainfall = weather_data.get("rain", {}).get("1h", 0)
+        
+        # Get forecast data for next 24 hours
+        next_24h_forecast = forecast_data["list"][:8]  # 3-hour intervals
+        
+        advice = []
+        risk_level = "low"
+        
+        # Temperature-based advice
+        if temp > 35:
+            risk_level = "high"
+            advice.extend([
+                "High Temperature Alert:",
+                "• Use shade nets or temporary covers to protect sensitive crops",
+                "• Increase irrigation frequency but reduce water quantity per session",
+                "• Apply mulching to retain soil moisture",
+                "• Best time for irrigation: Early morning or late evening",
+                "• Monitor for heat stress symptoms in plants"
+            ])
+        elif temp < 5:
+            risk_level = "high"
+            advice.extend([
+                "Cold Temperature Alert:",
+                "• Cover sensitive crops with row covers or frost protection sheets",
+                "• Maintain soil moisture to prevent frost damage",
+                "• Delay fertilizer application until temperature rises",
+                "• Monitor for cold damage symptoms",
+                "• Consider using cold frames for vulnerable seedlings"
+            ])
+        
+        # Humidity-based advice
+        if humidity > 80:
+            risk_level = "moderate" if risk_level == "low" else risk_level
+            advice.extend([
+                "High Humidity Management:",
+                "• Monitor for fungal disease development",
+                "• Increase plant spacing for better air circulation",
+                "• Consider preventive fungicide application",
+                "• Avoid overhead irrigation",
+                "• Remove affected leaves to prevent disease spread"
+            ])
+        elif humidity < 30:
+            risk_level = "moderate" if risk_level == "low" else risk_level
+            advice.extend([
+                "Low Humidity Management:",
+                "• Increase irrigation frequency",
+                "• Apply mulching to conserve soil moisture",
+                "• Consider drip irrigation implementation",
+                "• Best times for crop operations: Early morning or late evening",
+                "• Monitor for signs of water stress"
+            ])
+        
+        # Wind-based advice
+        if wind_speed > 20:
+            risk_level = "high"
+            advice.extend([
+                "Strong Wind Advisory:",
+                "• Delay pesticide/fertilizer spraying",
+                "• Provide wind breaks for vulnerable crops",
+                "• Check and reinforce crop support structures",
+                "• Monitor for physical damage to crops",
+                "• Consider emergency irrigation if soil is drying"
+            ])
+        
+        # Rain-based advice
+        if rainfall > 5:
+            risk_level = "moderate" if risk_level == "low" else risk_level
+            advice.extend([
+                "Rainfall Management:",
+                "• Hold off on irrigation for next 24-48 hours",
+                "• Monitor soil drainage in low-lying areas",
+                "• Check for water logging and improve drainage if needed",
+                "• Delay fertilizer application",
+                "• Watch for signs of root diseases"
+            ])
+        
+        # Forecast-based advice
+        forecast_conditions = [item["weather"][0]["main"] for item in next_24h_forecast]
+        if "Rain" in forecast_conditions:
+            advice.extend([
+                "Rain Expected in Next 24 Hours:",
+                "• Plan harvesting activities accordingly",
+                "• Prepare drainage systems",
+                "• Delay any planned chemical applications",
+                "• Consider protective covering for sensitive crops",
+                "• Have equipment ready for water management"
+            ])
+        
+        # General advice based on weather description
+        if "clear" in description.lower():
+            advice.extend([
+                "Clear Weather Operations:",
+                "• Ideal time for pest monitoring",
+                "• Good conditions for spraying operations",
+                "• Consider soil moisture management",
+                "• Optimal time for harvesting operations"
+            ])
+        elif "cloud" in description.lower():
+            advice.extend([
+                "Cloudy Conditions Management:",
+                "• Good time for transplanting activities",
+                "• Monitor humidity levels",
+                "• Check for pest presence under leaves",
+                "• Ideal conditions for foliar applications"
+            ])
+        
+        # Add risk level indicator
+        risk_indicator = {
+            "low": "Low Risk - Regular monitoring sufficient",
+            "moderate": "Moderate Risk - Increased vigilance needed",
+            "high": "High Risk - Immediate attention required"
+        }
+        
+        return {
+            "risk_level": risk_level,
+            "risk_indicator": risk_indicator[risk_level],
+            "weather_summary": f"Current Conditions: {description.capitalize()}, {temp}°C, {humidity}% Humidity, Wind {wind_speed}m/s",
+            "advice": advice if advice else ["No specific farming advice needed for current conditions. Continue regular monitoring."]
+        }
+        
+    except Exception as e:
+        logger.error(f"Error generating farming advice: {str(e)}")
+        return {
+            "risk_level": "unknown",
+            "risk_indicator": "Risk Level Unknown",
+            "weather_summary": "Weather data unavailable",
+            "advice": ["Unable to generate specific farming advice. Please check weather data."]
+        }
@@ -137,6 +137,29 @@ export const auth = {
   }
 };
 
+// Poll a queued image analysis until it completes or fails
+const waitForAnalysis = async (data, { interval = 2000, timeout = 120000 } = {}) => {
+  if (!data?.job_id || data.analysis) {
+    return data;
+  }
+
+  const deadline = Date.now() + timeout;
+  while (Date.now() < deadline) {
+    await new Promise((resolve) => setTimeout(resolve, interval));
+    const response = await api.get(`/user/analysis/${data.job_id}`);
+    if (response.status >= 400) {
+      throw new Error(response.data?.error || 'Failed to get analysis status');
+    }
+    if (response.data.status === 'completed') {
+      return response.data;
+    }
+    if (response.data.status === 'failed') {
+      throw new Error(response.data.error || 'Analysis failed');
+    }
+  }
+  throw new Error('Analysis is taking longer than expected. Please try again.');
+};
+
 export const diseaseDetection = {
   uploadImage: async (file) => {
     try {
@@ -153,8 +176,11 @@ export const diseaseDetection = {
       if (!response.data) {
         throw new Error('No response from server');
       }
+      if (response.status >= 400) {
+        throw new Error(response.data.error || 'Server error');
+      }
 
-      return response.data;
+      return await waitForAnalysis(response.data);
     } catch (error) {
       console.error('Error in uploadImage:', error);
       if (error.response) {
@@ -209,6 +235,16 @@ export const marketPrices = {
     const response = await api.delete(`/admin/prices/${priceId}`);
     return response.data;
   },
+  importPrices: async (file) => {
+    const formData = new FormData();
+    formData.append('file', file);
+    const response = await api.post('/admin/prices/import', formData, {
+      headers: {
+        'Content-Type': 'multipart/form-data',
+      },
+    });
+    return response.data;
+  },
 };
 
 export const schemes = {
@@ -276,7 +312,7 @@ export const detectPlantDisease = async (formData) => {
       }
     });
 
-    return response.data;
+    return await waitForAnalysis(response.data);
   } catch (error) {
     console.error('Error in detectPlantDisease:', error);
     if (error.response?.status === 401) {